@@ -1,25 +1,3163 @@
 import os
 import shutil
 import tkinter as tk
-from tkinter import Listbox, StringVar, ttk, messagebox, filedialog, PhotoImage
+import tkinter.font as tkfont
+from tkinter import StringVar, ttk, messagebox, filedialog, PhotoImage
 import vlc
 import hashlib
+import hmac
 import datetime
 from tkcalendar import DateEntry
 import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from pymediainfo import MediaInfo
 import time
+import uuid
 import threading
 import unicodedata
+import zlib
 import re
+import secrets
 import sv_ttk
 import ftplib
-from cryptography.fernet import Fernet
+import posixpath
+import ssl
+import subprocess
+import tarfile
+import http.server
+import argparse
+import contextlib
+import cProfile
+import io
+import mmap
+import pstats
+import sys
+import queue
+import ipaddress
+import itertools
+import socket
+import socketserver
+import sqlite3
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from cryptography.fernet import Fernet, InvalidToken
+
+try:
+    import paramiko  # Optional: only needed for SFTP delivery
+except ImportError:
+    paramiko = None
+
+# Built-in camera clip naming schemes, tried in order. Named groups: prefix, clip (required) and chapter.
+# "prefix" overrides the matched prefix, so e.g. GoPro's GOPR1234 sorts with its GP011234 chapters.
+DEFAULT_CLIP_NAME_PATTERNS = [
+    {"name": "gopro", "pattern": r"^(?P<prefix>G[XHLP])(?P<chapter>\d{2})(?P<clip>\d{4})"},
+    {"name": "gopro_legacy", "pattern": r"^GOPR(?P<clip>\d{4})", "prefix": "GP"},
+    {"name": "chaptered", "pattern": r"^(?P<prefix>[A-Z]{2})(?P<chapter>\d{2})(?P<clip>\d+)"},
+    {"name": "sony", "pattern": r"^(?P<prefix>C)(?P<clip>\d{4})"},
+    {"name": "canon", "pattern": r"^(?P<prefix>MVI_)(?P<clip>\d{4})"},
+    {"name": "dji", "pattern": r"^(?P<prefix>DJI_)(?P<clip>\d{4})"},
+    {"name": "panasonic", "pattern": r"^(?P<prefix>P)(?P<clip>\d{7})"},
+]
+
+ClipName = namedtuple("ClipName", "scheme prefix clip chapter")
+
+
+class ClipNameParser:
+    """A precompiled camera clip naming scheme."""
+    __slots__ = ("name", "regex", "prefix")
+
+    def __init__(self, name, pattern, prefix=None):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.prefix = prefix
+
+    def parse(self, file_name):
+        match = self.regex.match(file_name)
+        if not match:
+            return None
+        groups = match.groupdict()
+        chapter = groups.get("chapter")
+        return ClipName(self.name, self.prefix or groups.get("prefix") or "", int(groups["clip"]),
+                        int(chapter) if chapter else 0)
+
+
+def build_clip_name_parsers(config_patterns=None):
+    # Patterns from the config are tried first; one with the name of a built-in scheme replaces it
+    config_patterns = config_patterns or []
+    overridden = {pattern.get("name") for pattern in config_patterns}
+    parsers = []
+    for pattern in config_patterns + [p for p in DEFAULT_CLIP_NAME_PATTERNS if p["name"] not in overridden]:
+        try:
+            parsers.append(ClipNameParser(pattern.get("name", pattern["pattern"]), pattern["pattern"],
+                                          pattern.get("prefix")))
+        except (KeyError, re.error) as e:
+            logging.error(f"Invalid clip name pattern {pattern}: {e}")
+    return parsers
+
+
+class FileEntry:
+    """A file found on a source card. The id stays the same across refreshes and sorts."""
+    __slots__ = ("id", "path", "name", "stem", "ext", "display_name", "ctime", "size",
+                 "clip", "sort_key", "parsed_by", "fingerprint", "sidecars")
+
+    def __init__(self, path, name, ctime, size):
+        self.id = os.path.normcase(os.path.abspath(path))
+        self.path = path
+        self.name = name
+        self.stem, self.ext = os.path.splitext(name)
+        self.display_name = name  # Name shown in the list and used at the destination (de-duplicated)
+        self.ctime = ctime
+        self.size = size
+        self.clip = None  # ClipName parsed from the name, if it follows a camera naming scheme
+        self.sort_key = None
+        self.parsed_by = None  # Parser list the cached clip/sort_key were computed with
+        self.fingerprint = None  # Content fingerprint for the ingest catalog, computed on demand
+        self.sidecars = ()  # Sidecar files (metadata, thumbnails) copied along with this file
+
+    @property
+    def label(self):
+        return self.display_name
+
+    @property
+    def entries(self):
+        return (self,)
+
+
+def assign_display_names(entries):
+    # Give files with the same name a numbered display name (name_2.ext, name_3.ext, ...) in list order
+    file_name_counts = {}
+    for entry in entries:
+        file_name = entry.name
+        if file_name in file_name_counts:
+            file_name_counts[file_name] += 1
+            entry.display_name = f"{entry.stem}_{file_name_counts[file_name]}{entry.ext}"
+        else:
+            file_name_counts[file_name] = 1
+            entry.display_name = file_name
+
+
+def attach_sidecars(entries, sidecar_extensions):
+    # Link sidecar files to the media file in the same folder whose name their name starts with
+    # (C0001M01.XML -> C0001.MP4, GX010001.THM -> GX010001.MP4; the longest match wins).
+    # Returns the media entries; sidecars without a media file are left out.
+    media = [entry for entry in entries if entry.ext.lower() not in sidecar_extensions]
+    by_stem = {}
+    for entry in media:
+        entry.sidecars = []
+        by_stem[(os.path.dirname(entry.id), entry.stem.lower())] = entry
+    for entry in entries:
+        if entry.ext.lower() not in sidecar_extensions:
+            continue
+        folder, stem = os.path.dirname(entry.id), entry.stem.lower()
+        for length in range(len(stem), 0, -1):
+            owner = by_stem.get((folder, stem[:length]))
+            if owner is not None:
+                owner.sidecars.append(entry)
+                break
+    return media
+
+
+def sidecar_name(sidecar, entry):
+    # Destination name of a sidecar: follows the (possibly de-duplicated) name of its media file
+    display_stem = os.path.splitext(entry.display_name)[0]
+    return display_stem + sidecar.stem[len(entry.stem):] + sidecar.ext
+
+
+class ClipGroup:
+    """A spanned recording: the chapters of one clip, listed, routed and copied as one unit."""
+    __slots__ = ("id", "entries", "label")
+
+    def __init__(self, entries):
+        self.id = entries[0].id  # The first chapter identifies the clip
+        self.entries = entries
+        self.label = f"{entries[0].display_name}  (+{len(entries) - 1} hoofdstuk{'ken' if len(entries) > 2 else ''})"
+
+    @property
+    def path(self):
+        return self.entries[0].path
+
+    @property
+    def display_name(self):
+        return self.entries[0].display_name
+
+
+def group_spanned_clips(entries):
+    # Collect chapters of the same clip (same folder, prefix, clip number and extension) into a
+    # ClipGroup at the position of its first chapter; everything else stays a single FileEntry
+    items = []
+    chapters_by_clip = {}
+    for entry in entries:
+        if entry.clip is None:
+            items.append(entry)
+            continue
+        key = (os.path.dirname(entry.id), entry.clip.prefix, entry.clip.clip, entry.ext.lower())
+        chapters = chapters_by_clip.get(key)
+        if chapters is None:
+            chapters = chapters_by_clip[key] = []
+            items.append(chapters)
+        chapters.append(entry)
+
+    grouped = []
+    for item in items:
+        if not isinstance(item, list):
+            grouped.append(item)
+        elif len(item) > 1 and len({entry.clip.chapter for entry in item}) == len(item):
+            grouped.append(ClipGroup(item))
+        else:
+            grouped.extend(item)  # A single file, or colliding chapter numbers: list them separately
+    return grouped
+
+
+# Optional top-level config.json settings: key -> (accepted types, null allowed)
+CONFIG_SETTING_TYPES = {
+    "theme": (str, False),
+    "enable_custom_export": (bool, False),
+    "enable_ftp_export": (bool, False),
+    "perform_hash_check": (bool, False),
+    "group_spanned_clips": (bool, False),
+    "enable_thumbnail_view": (bool, False),
+    "thumbnail_cache_size_mb": ((int, float), False),
+    "thumbnail_width": (int, False),
+    "thumbnail_workers": (int, False),
+    "ffmpeg_path": (str, False),
+    "metrics_jsonl": (bool, False),
+    "metrics_port": (int, True),
+    "profiling": (str, True),
+    "profiling_sample_interval_ms": ((int, float), False),
+    "preview_debounce_ms": (int, False),
+    "copy_workers": (int, False),
+    "copy_buffer_count": (int, False),
+    "copy_buffer_size_kb": (int, False),
+    "copy_rate_limit_mbps": ((int, float), False),
+    "upload_rate_limit_mbps": ((int, float), False),
+    "preview_throttle_mbps": ((int, float), False),
+    "transfer_io_priority": (str, False),
+    "export_workers": (int, False),
+    "config_reload_interval_ms": (int, False),
+    "verify_read": (str, False),
+    "small_file_kb": (int, False),
+    "small_file_workers": (int, False),
+    "sidecar_archive": (bool, False),
+    "upload_verify_retries": (int, False),
+    "delivery_windows": (dict, False),
+    "worker_address": (str, True),
+    "worker_jobs_per_device": (int, False),
+    "enable_catalog": (bool, False),
+    "catalog_path": (str, False),
+    "catalog_duplicates": (str, False),
+    "catalog_preselect_new": (bool, False),
+}
+
+
+def validate_config(config):
+    # Check the structure of config.json; returns a list of problems (empty when the config is valid)
+    errors = []
+
+    def expect(value, types, where, allow_none=False):
+        types = types if isinstance(types, tuple) else (types,)
+        # bool is a subclass of int, but true/false is not a valid number here
+        if (value is None and allow_none) or (isinstance(value, types) and
+                                               (bool in types or not isinstance(value, bool))):
+            return True
+        names = "/".join(t.__name__ for t in types)
+        errors.append(f"{where}: expected {names}, got {type(value).__name__}")
+        return False
+
+    if not expect(config, dict, "config"):
+        return errors
+
+    source_folders = config.get("source_folders", {})
+    if expect(source_folders, dict, "source_folders"):
+        for name, folders in source_folders.items():
+            for i, folder in enumerate(folders if isinstance(folders, list) else [folders]):
+                expect(folder, str, f"source_folders.{name}[{i}]")
+
+    mapping = config.get("destination_folders_mapping", {})
+    if expect(mapping, dict, "destination_folders_mapping"):
+        for project, extensions in mapping.items():
+            if not expect(extensions, dict, f"destination_folders_mapping.{project}"):
+                continue
+            for ext, rules in extensions.items():
+                where = f"destination_folders_mapping.{project}.{ext}"
+                if not ext.startswith("."):
+                    errors.append(f"{where}: extension must start with '.'")
+                if not expect(rules, list, where):
+                    continue
+                for i, rule in enumerate(rules):
+                    if not expect(rule, dict, f"{where}[{i}]"):
+                        continue
+                    if not isinstance(rule.get("path"), str) or not rule.get("path"):
+                        errors.append(f"{where}[{i}].path: required")
+                    if "adjust_time" in rule:
+                        expect(rule["adjust_time"], bool, f"{where}[{i}].adjust_time")
+                    if expect(rule.get("backup_paths", []), list, f"{where}[{i}].backup_paths"):
+                        for j, backup_path in enumerate(rule.get("backup_paths", [])):
+                            expect(backup_path, str, f"{where}[{i}].backup_paths[{j}]")
+                    if "ftp_credential" in rule:
+                        expect(rule["ftp_credential"], str, f"{where}[{i}].ftp_credential")
+                    tracks = rule.get("media_info_tracks", {})
+                    if expect(tracks, dict, f"{where}[{i}].media_info_tracks"):
+                        for track_type, attributes in tracks.items():
+                            expect(attributes, dict, f"{where}[{i}].media_info_tracks.{track_type}")
+
+    default_destinations = config.get("default_destinations", {})
+    if expect(default_destinations, dict, "default_destinations") and isinstance(mapping, dict):
+        for source, project in default_destinations.items():
+            if project not in mapping:
+                errors.append(f"default_destinations.{source}: unknown destination '{project}'")
+
+    for key in ("update_file_listbox", "sidecar_extensions"):
+        extensions = config.get(key, [])
+        if expect(extensions, list, key):
+            for i, ext in enumerate(extensions):
+                expect(ext, str, f"{key}[{i}]")
+
+    for key, (types, allow_none) in CONFIG_SETTING_TYPES.items():
+        if key in config:
+            expect(config[key], types, key, allow_none)
+    if config.get("theme", "light") not in ("light", "dark"):
+        errors.append("theme: must be 'light' or 'dark'")
+    if config.get("transfer_io_priority", "normal") not in ("normal", "low", "idle"):
+        errors.append("transfer_io_priority: must be 'normal', 'low' or 'idle'")
+    if config.get("verify_read", "cached") not in ("cached", "drop", "direct"):
+        errors.append("verify_read: must be 'cached', 'drop' or 'direct'")
+    if config.get("catalog_duplicates", "copy") not in ("copy", "skip", "hardlink"):
+        errors.append("catalog_duplicates: must be 'copy', 'skip' or 'hardlink'")
+    if isinstance(config.get("worker_address"), str):
+        try:
+            if not is_loopback_host(parse_worker_address(config["worker_address"])[0]):
+                errors.append("worker_address: must be a loopback address (127.0.0.1, ::1 or localhost)")
+        except ValueError:
+            errors.append("worker_address: must be host:port")
+    delivery_windows = config.get("delivery_windows", {})
+    for priority, window in (delivery_windows.items() if isinstance(delivery_windows, dict) else ()):
+        if priority not in DELIVERY_PRIORITIES:
+            errors.append(f"delivery_windows.{priority}: must be 'urgent', 'normal' or 'bulk'")
+        elif window is not None and expect(window, str, f"delivery_windows.{priority}"):
+            try:
+                parse_delivery_window(window)
+            except ValueError as e:
+                errors.append(f"delivery_windows.{priority}: {e}")
+
+    patterns = config.get("clip_name_patterns", [])
+    if expect(patterns, list, "clip_name_patterns"):
+        for i, pattern in enumerate(patterns):
+            if not isinstance(pattern, dict) or not isinstance(pattern.get("pattern"), str):
+                errors.append(f"clip_name_patterns[{i}]: expected an object with a 'pattern'")
+                continue
+            try:
+                if "clip" not in re.compile(pattern["pattern"]).groupindex:
+                    errors.append(f"clip_name_patterns[{i}]: pattern needs a (?P<clip>...) group")
+            except re.error as e:
+                errors.append(f"clip_name_patterns[{i}]: {e}")
+    return errors
+
+
+def compile_destination_mapping(mapping):
+    # Routing table with lower-case extension keys, matching the lower-cased file extensions
+    return {project: {ext.lower(): rules for ext, rules in extensions.items()}
+            for project, extensions in mapping.items()}
+
+
+def file_hash(file_path, hash_algorithm="sha256", block_size=65536):
+    # Calculate the hash of a file.
+    hash_obj = hashlib.new(hash_algorithm)
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            hash_obj.update(block)
+    return hash_obj.hexdigest()
+
+
+def read_direct(file_path, block_size, consume):
+    # Read a file around the page cache (O_DIRECT on Linux, FILE_FLAG_NO_BUFFERING on Windows), calling
+    # consume(block) for every block. Both need sector-aligned buffers, so blocks are read into an
+    # (always page-aligned) anonymous mmap.
+    block_size = -(-block_size // 4096) * 4096
+    with mmap.mmap(-1, block_size) as buffer:
+        view = memoryview(buffer)
+        try:
+            if sys.platform == "win32":
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                kernel32.CreateFileW.restype = ctypes.c_void_p
+                handle = kernel32.CreateFileW(file_path, 0x80000000, 0x1, None, 3, 0x20000000 | 0x08000000, None)
+                if handle is None or handle == ctypes.c_void_p(-1).value:
+                    raise ctypes.WinError()
+                target = (ctypes.c_char * block_size).from_buffer(buffer)
+                try:
+                    length = ctypes.c_ulong()
+                    while True:
+                        if not kernel32.ReadFile(ctypes.c_void_p(handle), target, block_size,
+                                                 ctypes.byref(length), None):
+                            raise ctypes.WinError()
+                        if length.value:
+                            consume(view[:length.value])
+                        if length.value < block_size:
+                            break
+                finally:
+                    del target
+                    kernel32.CloseHandle(ctypes.c_void_p(handle))
+            else:
+                fd = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+                try:
+                    while True:
+                        length = os.readv(fd, [buffer])
+                        if length:
+                            consume(view[:length])
+                        if length < block_size:
+                            break  # End of file; a direct read at the unaligned end offset would fail
+                finally:
+                    os.close(fd)
+        finally:
+            view.release()
+
+
+def file_hash_uncached(file_path, hash_algorithm="sha256", block_size=1024 * 1024, mode="drop"):
+    # Hash a file as it is stored on the disk rather than as it sits in the page cache, and leave none
+    # of its pages cached. "direct" reads around the cache; "drop" flushes the file and drops its cached
+    # pages before and while reading. Falls back from "direct" to "drop" where direct reads are not
+    # supported (e.g. tmpfs), and to a normal read where neither is available.
+    hash_obj = hashlib.new(hash_algorithm)
+    if mode == "direct":
+        read_bytes = 0
+
+        def consume(block):
+            nonlocal read_bytes
+            hash_obj.update(block)
+            read_bytes += len(block)
+
+        try:
+            read_direct(file_path, block_size, consume)
+            return hash_obj.hexdigest()
+        except (OSError, AttributeError) as e:
+            if read_bytes:
+                raise  # A read error halfway, not a missing feature
+            logging.debug(f"Direct reads not available for '{file_path}' ({e}); dropping cached pages instead.")
+    if not hasattr(os, "posix_fadvise"):
+        return file_hash(file_path, hash_algorithm, block_size)
+    with open(file_path, "rb") as file:
+        fd = file.fileno()
+        os.fsync(fd)  # Dirty pages cannot be dropped
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        offset = 0
+        for block in iter(lambda: file.read(block_size), b""):
+            hash_obj.update(block)
+            os.posix_fadvise(fd, offset, len(block), os.POSIX_FADV_DONTNEED)
+            offset += len(block)
+    return hash_obj.hexdigest()
+
+
+def media_info_mismatch(media_info, expected_tracks):
+    # Check the parsed media info against the tracks required by a destination rule.
+    # Returns (mismatch_occurred, last actual value read).
+    mismatch_occurred = False
+    actual_value = None
+    for track in media_info.tracks:
+        track_type = track.track_type
+        if track_type in expected_tracks:
+            # For each required attribute + expected value
+            for attr, expected_value in expected_tracks[track_type].items():
+                actual_value = getattr(track, attr, "N/A")
+                if actual_value != expected_value:
+                    mismatch_occurred = True
+    return mismatch_occurred, actual_value
+
+
+def find_destination(source_path, file_name, destination_info_list):
+    # Return the first destination rule whose media info requirements match, or None.
+    # MediaInfo is parsed at most once, and only when a rule actually has requirements.
+    media_info = None
+    for destination_info in destination_info_list:
+        expected_tracks = destination_info.get("media_info_tracks", {})
+        if expected_tracks:
+            if media_info is None:
+                media_info = MediaInfo.parse(source_path)
+            mismatch_occurred, actual_value = media_info_mismatch(media_info, expected_tracks)
+            if mismatch_occurred:
+                logging.warning(
+                    f"Skipping destination '{destination_info.get('path')}' for file '{file_name}' "
+                    f"due to media info mismatch. Last actual_value read: {actual_value}"
+                )
+                continue
+        return destination_info
+    return None
+
+
+def clip_sort_key(entry, parsers):
+    # Parse the name once per entry (and again only when the parsers change)
+    if entry.parsed_by is not parsers:
+        entry.clip = None
+        for parser in parsers:
+            entry.clip = parser.parse(entry.name)
+            if entry.clip:
+                break
+        if entry.clip:
+            # Sort camera clips by prefix alphabetically, then by clip identifier and chapter
+            entry.sort_key = (entry.clip.prefix, entry.clip.clip, entry.clip.chapter)
+        else:
+            # For other files, sort alphabetically by filename
+            entry.sort_key = (entry.name.lower(),)
+        entry.parsed_by = parsers
+    return entry.sort_key
+
+
+def scan_source_folders(source_folders, allowed_extensions, previous_entries=None):
+    # Walk the source folders top-down (like os.walk) using scandir, whose entries carry a cached stat.
+    # Entries from a previous scan are reused when the file did not change.
+    previous_entries = previous_entries or {}
+    entries = []
+
+    def walk(folder):
+        subfolders = []
+        try:
+            with os.scandir(folder) as it:
+                for dir_entry in it:
+                    try:
+                        if dir_entry.is_dir():
+                            if not dir_entry.is_symlink():
+                                subfolders.append(dir_entry.path)
+                            continue
+                        _, file_extension = os.path.splitext(dir_entry.name.lower())
+                        if file_extension not in allowed_extensions:
+                            continue
+                        stat = dir_entry.stat()
+                    except OSError:
+                        continue
+                    entry = previous_entries.get(os.path.normcase(os.path.abspath(dir_entry.path)))
+                    if entry is None or entry.ctime != stat.st_ctime or entry.size != stat.st_size:
+                        entry = FileEntry(dir_entry.path, dir_entry.name, stat.st_ctime, stat.st_size)
+                    entries.append(entry)
+        except OSError:
+            return  # Unreachable folders are skipped, like os.walk does
+        for subfolder in subfolders:
+            walk(subfolder)
+
+    for source_folder in source_folders:
+        walk(source_folder)
+    return entries
+
+
+def file_fingerprint(path, size, sample_size=64 * 1024):
+    # Quick content fingerprint: the size plus a hash of the first and last sample_size bytes.
+    # Reads at most 128 KB, so a whole card can be checked without reading the media.
+    hash_obj = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as file:
+        hash_obj.update(file.read(sample_size))
+        if size > sample_size:
+            file.seek(max(sample_size, size - sample_size))
+            hash_obj.update(file.read(sample_size))
+    return f"{size}:{hash_obj.hexdigest()}"
+
+
+def entry_fingerprint(entry):
+    # Fingerprint of a scanned file, cached on the entry (entries are reused while the file is unchanged)
+    if entry.fingerprint is None:
+        entry.fingerprint = file_fingerprint(entry.path, entry.size)
+    return entry.fingerprint
+
+
+def camera_clip_id(entry):
+    # Camera clip ID such as "sony:C0001" or "gopro:GX1234/01"; None for files without a naming scheme
+    if entry.clip is None:
+        return None
+    clip_id = f"{entry.clip.scheme}:{entry.clip.prefix}{entry.clip.clip:04d}"
+    return f"{clip_id}/{entry.clip.chapter}" if entry.clip.chapter else clip_id
+
+
+class IngestCatalog:
+    """SQLite record of every ingested file, looked up by content fingerprint and camera clip ID."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ingested (
+            id INTEGER PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            clip_id TEXT,
+            name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            ingested_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ingested_fingerprint ON ingested (fingerprint);
+        CREATE INDEX IF NOT EXISTS ingested_size ON ingested (size);
+        CREATE INDEX IF NOT EXISTS ingested_clip_id ON ingested (clip_id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # One connection, shared by the scan and copy threads
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(self.SCHEMA)
+
+    def sizes(self):
+        # Sizes of all ingested files; only files with one of these sizes need a fingerprint
+        with self.lock:
+            return {size for size, in self.connection.execute("SELECT DISTINCT size FROM ingested")}
+
+    def contains(self, fingerprint):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM ingested WHERE fingerprint = ? LIMIT 1",
+                                           (fingerprint,)).fetchone() is not None
+
+    def lookup(self, fingerprint):
+        # Earlier ingests of this content, newest first, as (destination, clip_id, ingested_at)
+        with self.lock:
+            return self.connection.execute(
+                "SELECT destination, clip_id, ingested_at FROM ingested WHERE fingerprint = ? ORDER BY id DESC",
+                (fingerprint,)).fetchall()
+
+    def find_copy(self, fingerprint):
+        # Newest ingested copy of this content that still exists, or None
+        for destination, _, _ in self.lookup(fingerprint):
+            if os.path.isfile(destination):
+                return destination
+        return None
+
+    def verified_copy(self, fingerprint, path, hash_algorithm="sha256"):
+        # Earlier copy of the file at path that still exists and has the same contents, or None. The
+        # fingerprint only samples a file, so a hit is confirmed against the full contents first.
+        existing = self.find_copy(fingerprint)
+        if existing is None:
+            return None
+        try:
+            if os.path.getsize(existing) != os.path.getsize(path):
+                return None
+            if file_hash(existing, hash_algorithm, 1024 * 1024) != file_hash(path, hash_algorithm, 1024 * 1024):
+                return None
+        except OSError as e:
+            logging.warning(f"Could not compare '{path}' with its earlier copy '{existing}': {e}")
+            return None
+        return existing
+
+    def record(self, fingerprint, size, clip_id, name, source, destination):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO ingested (fingerprint, size, clip_id, name, source, destination, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, size, clip_id, name, source, destination,
+                 datetime.datetime.now().isoformat(timespec="seconds")))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class VirtualFileList(tk.Frame):
+    """List view that only draws the visible rows. Rows and selection are tracked by item id."""
+
+    def __init__(self, master, font=("Helvetica", 11), colors=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.colors = colors or {"background": "#ffffff", "foreground": "#000000",
+                                 "select_background": "#005fb8", "select_foreground": "#ffffff"}
+        self.font = tkfont.Font(font=font)
+        self.row_height = self.font.metrics("linespace") + 4
+
+        # Compact backing store: parallel lists plus an id -> row index
+        self.ids = []
+        self.texts = []
+        self.index = {}
+        self.selected = set()
+        self.anchor = None  # Row index where a shift-selection starts
+        self.active = None  # Row index of the keyboard cursor
+        self.top = 0  # Scroll offset in pixels
+        self.pool = []  # Recycled (rectangle, text) canvas items for the visible rows
+
+        self.canvas = tk.Canvas(self, background=self.colors["background"], highlightthickness=0, takefocus=1)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<Control-Button-1>", self.on_control_click)
+        self.canvas.bind("<Shift-Button-1>", self.on_shift_click)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_rows(-3 * int(event.delta / 120)))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_rows(-3))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_rows(3))
+        self.canvas.bind("<Up>", lambda event: self.move_active(-1, extend=False))
+        self.canvas.bind("<Down>", lambda event: self.move_active(1, extend=False))
+        self.canvas.bind("<Shift-Up>", lambda event: self.move_active(-1, extend=True))
+        self.canvas.bind("<Shift-Down>", lambda event: self.move_active(1, extend=True))
+        self.canvas.bind("<Prior>", lambda event: self.move_active(-self.visible_rows(), extend=False))
+        self.canvas.bind("<Next>", lambda event: self.move_active(self.visible_rows(), extend=False))
+        self.canvas.bind("<Home>", lambda event: self.move_active(-len(self.ids), extend=False))
+        self.canvas.bind("<End>", lambda event: self.move_active(len(self.ids), extend=False))
+        self.canvas.bind("<Control-a>", lambda event: self.select_all())
+
+    def set_items(self, ids, texts):
+        # Replace the rows; the selection survives for ids that are still present
+        active_id = self.ids[self.active] if self.active is not None and self.active < len(self.ids) else None
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.index = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.selected &= self.index.keys()
+        self.active = self.index.get(active_id)
+        self.anchor = self.active
+        self.top = max(0, min(self.top, self.max_top()))
+        self.redraw()
+
+    def size(self):
+        return len(self.ids)
+
+    def set_colors(self, colors):
+        self.colors = colors
+        self.canvas.configure(background=colors["background"])
+        self.redraw()
+
+    def selection(self):
+        # Selected ids in display order
+        return sorted(self.selected, key=self.index.__getitem__)
+
+    def select(self, ids):
+        self.selected = {item_id for item_id in ids if item_id in self.index}
+        self.active = self.index[ids[0]] if ids and ids[0] in self.index else None
+        self.anchor = self.active
+        self.redraw()
+
+    def select_all(self):
+        self.selected = set(self.ids)
+        self.redraw()
+        self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def see(self, item_id):
+        row = self.index.get(item_id)
+        if row is None:
+            return
+        row_top = row * self.row_height
+        height = self.canvas.winfo_height()
+        if row_top < self.top:
+            self.top = row_top
+        elif row_top + self.row_height > self.top + height:
+            self.top = row_top + self.row_height - height
+        self.top = max(0, min(self.top, self.max_top()))
+        self.redraw()
+
+    def visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def max_top(self):
+        return max(0, len(self.ids) * self.row_height - self.canvas.winfo_height())
+
+    def row_at(self, y):
+        row = int((self.top + y) // self.row_height)
+        return min(max(row, 0), len(self.ids) - 1) if self.ids else None
+
+    def redraw(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+
+        # Grow the item pool to cover the visible rows (plus one partially visible row)
+        needed = height // self.row_height + 2
+        while len(self.pool) < needed:
+            rectangle = self.canvas.create_rectangle(0, 0, 0, 0, width=0)
+            text = self.canvas.create_text(0, 0, anchor="w", font=self.font)
+            self.pool.append((rectangle, text))
+
+        first_row = self.top // self.row_height
+        offset = first_row * self.row_height - self.top
+        for slot, (rectangle, text) in enumerate(self.pool):
+            row = first_row + slot
+            if slot >= needed or row >= len(self.ids):
+                self.canvas.itemconfigure(rectangle, state="hidden")
+                self.canvas.itemconfigure(text, state="hidden")
+                continue
+            y = offset + slot * self.row_height
+            is_selected = self.ids[row] in self.selected
+            background = self.colors["select_background"] if is_selected else self.colors["background"]
+            foreground = self.colors["select_foreground"] if is_selected else self.colors["foreground"]
+            self.canvas.coords(rectangle, 0, y, width, y + self.row_height)
+            self.canvas.itemconfigure(rectangle, fill=background, state="normal")
+            self.canvas.coords(text, 4, y + self.row_height // 2)
+            self.canvas.itemconfigure(text, text=self.texts[row], fill=foreground, state="normal")
+
+        # Update the scrollbar to the visible fraction
+        total = len(self.ids) * self.row_height
+        if total <= height or total == 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.top / total, (self.top + height) / total)
+
+    def yview(self, *args):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.ids) * self.row_height)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows()
+            self.top += amount * self.row_height
+        self.top = max(0, min(self.top, self.max_top()))
+        self.redraw()
+
+    def scroll_rows(self, rows):
+        self.yview("scroll", rows, "units")
+        return "break"
+
+    def on_click(self, event):
+        self.canvas.focus_set()
+        row = self.row_at(event.y)
+        if row is None:
+            return
+        self.selected = {self.ids[row]}
+        self.anchor = self.active = row
+        self.changed()
+
+    def on_control_click(self, event):
+        self.canvas.focus_set()
+        row = self.row_at(event.y)
+        if row is None:
+            return "break"
+        self.selected ^= {self.ids[row]}
+        self.anchor = self.active = row
+        self.changed()
+        return "break"
+
+    def on_shift_click(self, event):
+        self.canvas.focus_set()
+        row = self.row_at(event.y)
+        if row is None:
+            return "break"
+        self.select_range(row)
+        return "break"
+
+    def on_drag(self, event):
+        row = self.row_at(event.y)
+        if row is None or row == self.active:
+            return
+        if event.y < 0 or event.y > self.canvas.winfo_height():
+            self.scroll_rows(-1 if event.y < 0 else 1)
+        self.select_range(row)
+
+    def select_range(self, row):
+        if self.anchor is None:
+            self.anchor = row
+        start, end = sorted((self.anchor, row))
+        self.selected = set(self.ids[start:end + 1])
+        self.active = row
+        self.changed()
+
+    def move_active(self, step, extend):
+        if not self.ids:
+            return "break"
+        row = 0 if self.active is None else min(max(self.active + step, 0), len(self.ids) - 1)
+        if extend:
+            self.select_range(row)
+        else:
+            self.selected = {self.ids[row]}
+            self.anchor = self.active = row
+            self.changed()
+        self.see(self.ids[row])
+        return "break"
+
+    def changed(self):
+        self.redraw()
+        self.event_generate("<<ListboxSelect>>")
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatter that appends the structured fields passed as extra={"fields": {...}} as key=value pairs."""
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " | " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False)}" for key, value in fields.items())
+        return message
+
+
+class ThumbnailCache:
+    """Disk cache of poster frames, keyed by path, size and mtime and limited by size (LRU)."""
+
+    def __init__(self, cache_folder, max_bytes, width=160, max_workers=2, ffmpeg_path="ffmpeg"):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.width = width
+        self.ffmpeg_path = shutil.which(ffmpeg_path)
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+        self.lock = threading.Lock()
+        self.index = None  # cache file name -> size, least recently used first
+        self.total_bytes = 0
+        self.pending = {}  # cache file name -> Future
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+
+        if not self.ffmpeg_path:
+            logging.warning(f"'{ffmpeg_path}' not found; thumbnails can only be served from the cache.")
+
+    def load_index(self):
+        # Build the LRU index from the files on disk, oldest mtime first (called with the lock held)
+        if self.index is not None:
+            return
+        entries = []
+        for entry in os.scandir(self.cache_folder):
+            if entry.is_file() and entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self.index = OrderedDict((name, size) for _, name, size in entries)
+        self.total_bytes = sum(self.index.values())
+
+    def cache_name(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.width}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png"
+
+    def lookup(self, path):
+        # Return the cached poster frame for path, or None if it has not been extracted yet
+        try:
+            name = self.cache_name(path)
+        except OSError:
+            return None
+        with self.lock:
+            self.load_index()
+            if name not in self.index:
+                return None
+            self.index.move_to_end(name)
+        cached_path = os.path.join(self.cache_folder, name)
+        try:
+            os.utime(cached_path)  # Keep the LRU order across restarts
+        except OSError:
+            return None
+        return cached_path
+
+    def request(self, path, callback):
+        # Extract the poster frame in the worker pool; callback(cached_path or None) runs on a worker thread
+        cached_path = self.lookup(path)
+        if cached_path or not self.ffmpeg_path:
+            callback(cached_path)
+            return None
+        try:
+            name = self.cache_name(path)
+        except OSError:
+            callback(None)
+            return None
+        with self.lock:
+            future = self.pending.get(name)
+            if future is None:
+                future = self.executor.submit(self.extract, path, name)
+                self.pending[name] = future
+        future.add_done_callback(lambda f: callback(None if f.cancelled() or f.exception() else f.result()))
+        return future
+
+    def extract(self, path, name):
+        cached_path = os.path.join(self.cache_folder, name)
+        temp_path = cached_path + ".tmp.png"
+        try:
+            # Try a frame one second in (skips black leaders), fall back to the very first frame
+            for seek in ("1", "0"):
+                command = [self.ffmpeg_path, "-v", "error", "-y", "-ss", seek, "-i", path,
+                           "-frames:v", "1", "-vf", f"scale={self.width}:-2", temp_path]
+                subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60,
+                               creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+                if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+                    break
+            else:
+                logging.warning(f"Could not extract a thumbnail from '{path}'.")
+                return None
+
+            os.replace(temp_path, cached_path)
+            size = os.path.getsize(cached_path)
+            with self.lock:
+                self.load_index()
+                self.total_bytes += size - self.index.get(name, 0)
+                self.index[name] = size
+                self.evict()
+            return cached_path
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f"Error extracting thumbnail from '{path}': {e}")
+            return None
+        finally:
+            with self.lock:
+                self.pending.pop(name, None)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def evict(self):
+        # Drop least recently used poster frames until the cache fits (called with the lock held)
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            name, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_folder, name))
+            except OSError:
+                pass
+
+    def cancel_pending(self):
+        with self.lock:
+            for name, future in list(self.pending.items()):
+                if future.cancel():
+                    del self.pending[name]
+
+    def shutdown(self):
+        self.cancel_pending()
+        self.executor.shutdown(wait=False)
+
+
+class MetricsRegistry:
+    """Counters and histograms for transfers, exposed in the Prometheus text format and as JSON lines."""
+
+    SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+    THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)  # MB/s
+
+    METRICS = {
+        "filemover_files_total": ("counter", "Files transferred, by status.", None),
+        "filemover_bytes_total": ("counter", "Bytes transferred.", None),
+        "filemover_jobs_total": ("counter", "Transfer jobs completed.", None),
+        "filemover_file_seconds": ("histogram", "Time to transfer one file.", SECONDS_BUCKETS),
+        "filemover_file_throughput_mbps": ("histogram", "Per-file throughput in MB/s.", THROUGHPUT_BUCKETS),
+        "filemover_hash_seconds": ("histogram", "Time spent hashing source and destination.", SECONDS_BUCKETS),
+        "filemover_mediainfo_seconds": ("histogram", "Time spent parsing MediaInfo for routing.", SECONDS_BUCKETS),
+        "filemover_queue_wait_seconds": ("histogram", "Time a file waited between job start and its transfer.", SECONDS_BUCKETS),
+        "filemover_job_seconds": ("histogram", "Time to run one transfer job.", SECONDS_BUCKETS),
+        "filemover_job_throughput_mbps": ("histogram", "Per-job throughput in MB/s.", THROUGHPUT_BUCKETS),
+    }
+
+    def __init__(self, jsonl_path=None):
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> counter value, or [bucket counts..., sum, count] for histograms
+        self.jsonl_file = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self.server = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def record(self, event, **fields):
+        # One JSON object per line, for later analysis
+        if self.jsonl_file is None:
+            return
+        line = json.dumps({"time": datetime.datetime.now().isoformat(timespec="milliseconds"), "event": event, **fields})
+        with self.lock:
+            self.jsonl_file.write(line + "\n")
+            self.jsonl_file.flush()
+
+    def observe_file(self, kind, labels, file_name, size, seconds, ok=True,
+                     hash_seconds=None, mediainfo_seconds=None, queue_wait=None):
+        throughput = size / seconds / (1024 * 1024) if seconds > 0 else 0.0
+        self.inc("filemover_files_total", kind=kind, status="ok" if ok else "failed", **labels)
+        self.inc("filemover_bytes_total", size, kind=kind, **labels)
+        self.observe("filemover_file_seconds", seconds, kind=kind, **labels)
+        self.observe("filemover_file_throughput_mbps", throughput, kind=kind, **labels)
+        if hash_seconds is not None:
+            self.observe("filemover_hash_seconds", hash_seconds, kind=kind, **labels)
+        if mediainfo_seconds is not None:
+            self.observe("filemover_mediainfo_seconds", mediainfo_seconds, kind=kind, **labels)
+        if queue_wait is not None:
+            self.observe("filemover_queue_wait_seconds", queue_wait, kind=kind, **labels)
+        self.record("file", kind=kind, **labels, file=file_name, bytes=size, seconds=round(seconds, 4),
+                    mb_per_s=round(throughput, 2), ok=ok, hash_seconds=hash_seconds,
+                    mediainfo_seconds=mediainfo_seconds, queue_wait=queue_wait)
+
+    def observe_job(self, kind, labels, files, size, seconds, failed=0):
+        throughput = size / seconds / (1024 * 1024) if seconds > 0 else 0.0
+        self.inc("filemover_jobs_total", kind=kind, **labels)
+        self.observe("filemover_job_seconds", seconds, kind=kind, **labels)
+        self.observe("filemover_job_throughput_mbps", throughput, kind=kind, **labels)
+        self.record("job", kind=kind, **labels, files=files, failed=failed, bytes=size,
+                    seconds=round(seconds, 4), mb_per_s=round(throughput, 2))
+
+    def render(self):
+        # Prometheus text exposition format
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        with self.lock:
+            snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in self.values.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in self.METRICS.items():
+            series = [(labels, value) for (metric, labels), value in snapshot.items() if metric == name]
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series):
+                if kind == "counter":
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                for bound, count in zip(buckets, value):
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the application log
+
+        self.server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+        if self.jsonl_file is not None:
+            with self.lock:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+
+
+class JobProfiler:
+    """Per-job stage timings (spans), optionally with a cProfile or sampling profile of the job's threads.
+
+    The job thread is the one that calls start(); the copy and upload workers of the job are tagged when
+    they enter a span, so the profiles cover them too.
+    """
+
+    MODES = ("spans", "cprofile", "sample")
+
+    def __init__(self, job_name, mode, report_folder, sample_interval=0.005):
+        self.job_name = job_name
+        self.mode = mode
+        self.report_folder = report_folder
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()  # Spans are closed from the job thread and its workers at the same time
+        self.stages = {}  # stage -> [total seconds, count]
+        self.threads = {}  # thread id -> thread name, of the threads tagged to this job
+        self.started = None
+        self.wall_time = 0.0
+        self.profile = None
+        self.worker_profiles = []  # cProfile of the worker threads, merged into the report
+        self.local = threading.local()  # Span depth and cProfile of the current worker thread
+        self.samples = {}  # folded stack -> sample count
+        self.sampler = None
+        self.stop_event = threading.Event()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        self.tag_thread()
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        profile = getattr(self.local, "profile", None)
+        if profile is not None and depth == 0:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.local.depth = depth
+            if profile is not None and depth == 0:
+                # Disable on the thread itself, before a pooled worker moves on to another job
+                profile.disable()
+            with self.lock:
+                totals = self.stages.setdefault(stage, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    def tag_thread(self):
+        # Marked in the thread-local, not by thread id: a new thread may get the id of one that ended
+        if getattr(self.local, "tagged", False):
+            return
+        self.local.tagged = True
+        with self.lock:
+            self.threads[threading.get_ident()] = threading.current_thread().name
+        if self.mode == "cprofile" and self.profile is not None:
+            # cProfile only follows the thread that enables it (before Python 3.12), so every worker
+            # thread gets its own profile; from 3.12 the job's profile already covers all threads
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return
+            profile.disable()
+            self.local.profile = profile
+            with self.lock:
+                self.worker_profiles.append(profile)
+
+    def start(self):
+        # Must be called on the job thread; it is profiled from start to stop, the workers while in a span
+        self.started = time.perf_counter()
+        self.threads[threading.get_ident()] = threading.current_thread().name
+        self.local.tagged = True  # Profiled as a whole below
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.mode == "sample":
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    def sample(self):
+        while not self.stop_event.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self.lock:
+                threads = list(self.threads.items())
+            for thread_id, thread_name in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    # Idle pool workers are sampled too; the thread name keeps them apart in the flame graph
+                    folded = ";".join([thread_name] + stack[::-1])
+                    self.samples[folded] = self.samples.get(folded, 0) + 1
+
+    def stop(self):
+        self.wall_time = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+
+    def write_report(self):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        base_path = os.path.join(self.report_folder, f"profile_{self.job_name}_{timestamp}")
+
+        lines = [f"Profile of job '{self.job_name}' (mode: {self.mode}), wall time {self.wall_time:.3f} s", "",
+                 f"{'stage':<20}{'total s':>12}{'count':>10}{'% wall':>10}"]
+        for stage, (total, count) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            share = total / self.wall_time * 100 if self.wall_time else 0.0
+            lines.append(f"{stage:<20}{total:>12.3f}{count:>10}{share:>9.1f}%")
+
+        if self.profile is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            with self.lock:
+                worker_profiles = list(self.worker_profiles)
+            for profile in worker_profiles:
+                stats.add(profile)
+            stats.dump_stats(base_path + ".prof")
+            stats.sort_stats("cumulative").print_stats(40)
+            lines += ["", "cProfile (top 40 by cumulative time, full profile in .prof):", stream.getvalue()]
+
+        if self.samples:
+            # Folded stacks can be turned into a flame graph with flamegraph.pl or speedscope
+            with open(base_path + ".folded", "w", encoding="utf-8") as folded_file:
+                for stack, count in self.samples.items():
+                    folded_file.write(f"{stack} {count}\n")
+            total_samples = sum(self.samples.values())
+            leaf_counts = {}
+            for stack, count in self.samples.items():
+                leaf = stack.rsplit(";", 1)[-1]
+                leaf_counts[leaf] = leaf_counts.get(leaf, 0) + count
+            lines += ["", f"Sampling profile ({total_samples} samples every {self.sample_interval * 1000:.0f} ms), "
+                          "top functions by self time:"]
+            for leaf, count in sorted(leaf_counts.items(), key=lambda item: -item[1])[:30]:
+                lines.append(f"{count / total_samples * 100:>6.1f}%  {leaf}")
+
+        with open(base_path + ".txt", "w", encoding="utf-8") as report_file:
+            report_file.write("\n".join(lines) + "\n")
+        logging.info(f"Profile of job '{self.job_name}' written to {base_path}.txt")
+
+
+class TokenBucket:
+    """Byte-rate limiter shared by the workers of one transfer job; a rate of 0 means unlimited.
+
+    Besides the configured rate, a temporary throttle rate can be set (e.g. while the preview
+    plays); the lower of the two applies.
+    """
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate  # bytes/s
+        self.throttle_rate = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def effective_rate(self):
+        rates = [rate for rate in (self.rate, self.throttle_rate) if rate]
+        return min(rates) if rates else 0
+
+    def set_throttle(self, rate):
+        with self.lock:
+            self.throttle_rate = rate
+
+    def consume(self, size):
+        # Block until size bytes may be transferred
+        while True:
+            with self.lock:
+                rate = self.effective_rate()
+                now = time.monotonic()
+                if not rate:
+                    self.tokens = 0.0
+                    self.updated = now
+                    return
+                # At most half a second of burst; a block larger than that is allowed to run into debt
+                burst = rate / 2
+                self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+                self.updated = now
+                needed = min(size, burst)
+                if self.tokens >= needed:
+                    self.tokens -= size
+                    return
+                delay = (needed - self.tokens) / rate
+            # Sleep in short steps, so a changed rate (preview started or stopped) applies quickly
+            time.sleep(min(delay, 0.25))
+
+
+class RateLimitedReader:
+    """File wrapper whose reads are paced by a TokenBucket, for uploads."""
+
+    def __init__(self, file, bucket):
+        self.file = file
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class Crc32:
+    """zlib.crc32 with the hashlib interface, for servers that only offer CRC checksums."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+
+def new_digest(algorithm):
+    return Crc32() if algorithm == "crc32" else hashlib.new(algorithm)
+
+
+class HashingReader:
+    """File wrapper that feeds everything read through it into a digest, for uploads."""
+
+    def __init__(self, file, digest):
+        self.file = file
+        self.digest = digest
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class DeliveryPreempted(Exception):
+    """Raised inside an upload when a more urgent delivery takes over, or the delivery window closes."""
+
+
+class PreemptibleReader:
+    """File wrapper that stops an upload at the next block once the preempt event is set."""
+
+    def __init__(self, file, preempt):
+        self.file = file
+        self.preempt = preempt
+
+    def read(self, size=-1):
+        if self.preempt.is_set():
+            raise DeliveryPreempted()
+        return self.file.read(size)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class HashingWriter:
+    """Upload stream wrapper that counts and digests everything written to it (streamed archives)."""
+
+    def __init__(self, stream, digest=None):
+        self.stream = stream
+        self.digest = digest
+        self.size = 0
+
+    def write(self, block):
+        if self.digest is not None:
+            self.digest.update(block)
+        self.size += len(block)
+        self.stream.write(block)
+        return len(block)
+
+    def close(self):
+        self.stream.close()
+
+
+def set_thread_io_priority(level):
+    # Lower the CPU and I/O priority of the calling thread: "low" or "idle" ("normal" leaves it alone).
+    # Returns what restore_thread_io_priority needs to undo it, or None if nothing was changed.
+    if level not in ("low", "idle"):
+        return None
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            thread = kernel32.GetCurrentThread()
+            previous = kernel32.GetThreadPriority(thread)
+            # Background mode also lowers the thread's I/O and memory priority
+            priority = 0x00010000 if level == "idle" else -1  # THREAD_MODE_BACKGROUND_BEGIN / THREAD_PRIORITY_BELOW_NORMAL
+            kernel32.SetThreadPriority(thread, priority)
+            return level, previous
+        elif sys.platform.startswith("linux"):
+            # Linux applies nice per thread; the CFQ/BFQ I/O schedulers derive the I/O priority from it
+            thread_id = threading.get_native_id()
+            previous = os.getpriority(os.PRIO_PROCESS, thread_id)
+            os.setpriority(os.PRIO_PROCESS, thread_id, max(previous, 10 if level == "low" else 19))
+            return level, previous
+    except (OSError, AttributeError) as e:
+        logging.debug(f"Could not lower the thread priority: {e}")
+    return None
+
+
+def restore_thread_io_priority(previous):
+    # Undo set_thread_io_priority on the same thread
+    if previous is None:
+        return
+    level, priority = previous
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            if level == "idle":
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 0x00020000)  # THREAD_MODE_BACKGROUND_END
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), priority)
+        else:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), priority)
+    except (OSError, AttributeError) as e:
+        # Raising the priority again needs CAP_SYS_NICE (or RLIMIT_NICE) on Linux
+        logging.debug(f"Could not restore the thread priority: {e}")
+
+
+@contextlib.contextmanager
+def thread_io_priority(level):
+    # Run a job's work on the calling thread at a lower priority; a pooled thread gets its priority back
+    previous = set_thread_io_priority(level)
+    try:
+        yield
+    finally:
+        restore_thread_io_priority(previous)
+
+
+# mirrors: extra local destination paths; uploads: (UploadTarget, remote name) pairs, all written from one read
+CopyTask = namedtuple("CopyTask", "source destination adjust_time context mirrors uploads",
+                      defaults=(False, None, (), ()))
+# targets: (label, ok, error) for every mirror and upload of the task
+CopyResult = namedtuple("CopyResult", "size seconds hash_seconds started ok resumed error targets", defaults=((),))
+
+
+class BufferRing:
+    """Fixed set of preallocated buffers that circulate between a reader and its writers.
+
+    The reader blocks when every buffer is still being written, which bounds memory use to
+    count * size no matter how large the file is.
+    """
+
+    def __init__(self, count=8, size=1024 * 1024):
+        self.count = count
+        self.size = size
+        self.free = queue.Queue()
+        for _ in range(count):
+            self.free.put(bytearray(size))
+
+    def acquire(self):
+        return self.free.get()
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+
+class FanOut:
+    """Hands every filled ring buffer to several sinks, each writing on its own thread.
+
+    Reading and writing overlap, a slow sink only holds up the reader once the ring is exhausted,
+    and a failing sink is dropped without stopping the others. A buffer returns to the ring when
+    every sink is done with it, so sinks must not keep the memoryview they are given.
+    """
+
+    def __init__(self, sinks, ring, threaded=True, io_priority="normal"):
+        self.ring = ring
+        self.io_priority = io_priority
+        self.errors = {}  # sink name -> exception
+        self.lock = threading.Lock()
+        self.pending = {}  # id(buffer) -> number of sinks still writing it
+        self.queues = {}
+        self.threads = []
+        # Without threads the sinks write on the caller's thread (nothing to overlap for a single block)
+        self.sinks = None if threaded else sinks
+        for name, write in sinks.items() if threaded else ():
+            block_queue = queue.Queue()  # Bounded by the ring: at most ring.count buffers are in flight
+            self.queues[name] = block_queue
+            thread = threading.Thread(target=self.drain, args=(name, write, block_queue), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def drain(self, name, write, block_queue):
+        # The sink threads do most of the disk writes, so they run at the copy workers' priority
+        with thread_io_priority(self.io_priority):
+            while True:
+                item = block_queue.get()
+                if item is None:
+                    return
+                buffer, view = item
+                try:
+                    if name not in self.errors:  # A failed sink keeps draining, so buffers still return to the ring
+                        write(view)
+                except Exception as e:
+                    self.errors[name] = e
+                finally:
+                    self.done(buffer)
+
+    def done(self, buffer):
+        with self.lock:
+            self.pending[id(buffer)] -= 1
+            if self.pending[id(buffer)]:
+                return
+            del self.pending[id(buffer)]
+        self.ring.release(buffer)
+
+    def write(self, buffer, length):
+        if self.sinks is not None:
+            view = memoryview(buffer)[:length]
+            for name, write in self.sinks.items():
+                try:
+                    if name not in self.errors:
+                        write(view)
+                except Exception as e:
+                    self.errors[name] = e
+            self.ring.release(buffer)
+            return
+        active = [block_queue for name, block_queue in self.queues.items() if name not in self.errors]
+        if not active:
+            self.ring.release(buffer)
+            return
+        view = memoryview(buffer)[:length]
+        with self.lock:
+            self.pending[id(buffer)] = len(active)
+        for block_queue in active:
+            block_queue.put((buffer, view))
+
+    def close(self):
+        # Wait until every sink has written everything; returns the errors per sink
+        for block_queue in self.queues.values():
+            block_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.errors
+
+
+class UploadTarget:
+    """Remote folder that copy workers stream files into, with one connection per worker thread."""
+
+    def __init__(self, name, connect, directory):
+        self.name = name
+        self.connect = connect  # Returns a connected Transport
+        self.directory = directory
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    def label(self, remote_name):
+        return f"{self.name}:{self.directory}/{remote_name}"
+
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.connect()
+            session.ensure_directory(self.directory)
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def open_upload(self, remote_name):
+        return self.session().open_upload(remote_name)
+
+    def reset(self):
+        # Drop this thread's connection after a failed transfer; the next file reconnects
+        session = getattr(self.local, "session", None)
+        self.local.session = None
+        if session is not None:
+            with self.lock:
+                self.sessions.remove(session)
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logging.warning(f"Error closing {session.protocol.upper()} session: {e}")
+
+
+class CopyEngine:
+    """Copies files on a pool of worker threads and verifies them.
+
+    Each file is written to "<destination>.part" and only renamed into place once it is verified, so a
+    destination file is always complete. An interrupted copy leaves the .part file behind and the
+    next copy of the same file continues from where it stopped.
+
+    Reading and writing are pipelined: the worker thread fills buffers from a ring of preallocated
+    buffers while writer threads empty them, so a slow card reader and a slow destination work at
+    the same time instead of taking turns.
+    """
+
+    PART_SUFFIX = ".part"
+
+    def __init__(self, max_workers=2, verify="hash", hash_algorithm="sha256", block_size=1024 * 1024, span=None,
+                 rate_limit=None, io_priority="normal", buffer_count=8, small_file_size=0, small_file_workers=8,
+                 verify_read="cached"):
+        self.max_workers = max_workers
+        self.verify = verify  # "hash" or "size"
+        # How copies are read back for the hash: "cached" (may be served from the page cache), or from the
+        # disk itself with "drop" (flush and drop the cached pages) or "direct" (direct reads)
+        self.verify_read = verify_read
+        self.hash_algorithm = hash_algorithm
+        self.block_size = block_size  # Size of each ring buffer
+        self.buffer_count = buffer_count  # Ring buffers per worker
+        self.rings = threading.local()  # Each worker reuses its own ring for every file
+        self.span = span or (lambda stage: contextlib.nullcontext())
+        self.rate_limit = rate_limit  # TokenBucket shared by the workers, or None
+        self.io_priority = io_priority
+        # Files up to small_file_size bytes (sidecars, metadata) are copied by their own pool of workers,
+        # so hundreds of them do not queue behind the media files
+        self.small_file_size = small_file_size
+        self.small_file_workers = small_file_workers
+
+    def ring(self):
+        ring = getattr(self.rings, "ring", None)
+        if ring is None:
+            ring = self.rings.ring = BufferRing(self.buffer_count, self.block_size)
+        return ring
+
+    def start_small_file_worker(self):
+        # A small file fits in one buffer, so these workers get a minimal ring
+        self.rings.ring = BufferRing(2, self.block_size)
+
+    def is_small(self, task):
+        try:
+            return os.path.getsize(task.source) <= self.small_file_size
+        except OSError:
+            return False
+
+    def resume_offset(self, source_path, part_path):
+        # Length of a usable partial copy: it may not be longer than the source and its tail must match
+        try:
+            part_size = os.path.getsize(part_path)
+        except OSError:
+            return 0
+        if part_size == 0 or part_size > os.path.getsize(source_path):
+            return 0
+        tail = min(part_size, self.block_size)
+        with open(source_path, "rb") as source_file, open(part_path, "rb") as part_file:
+            source_file.seek(part_size - tail)
+            part_file.seek(part_size - tail)
+            if source_file.read(tail) != part_file.read(tail):
+                return 0
+        return part_size
+
+    def copy_file(self, source_path, destination_path, adjust_time=False, progress=None, mirrors=(), uploads=()):
+        # Copy source to destination and, from the same read, to the mirror paths and upload targets
+        part_path = destination_path + self.PART_SUFFIX
+        started = time.perf_counter()
+        source_hash = hashlib.new(self.hash_algorithm) if self.verify == "hash" else None
+        target_errors = {}  # mirror path or upload label -> exception
+
+        with self.span("copy"), contextlib.ExitStack() as stack:
+            # Resuming only applies to a plain copy; a tee copy writes every target from the start
+            offset = 0 if mirrors or uploads else self.resume_offset(source_path, part_path)
+            source_file = stack.enter_context(open(source_path, "rb"))
+            part_file = stack.enter_context(open(part_path, "r+b" if offset else "wb"))
+            if offset:
+                logging.info(f"Resuming copy of '{source_path}' at {offset} bytes.")
+                # The source hash must cover the part that is already copied
+                remaining = offset
+                while remaining > 0 and source_hash is not None:
+                    block = source_file.read(min(self.block_size, remaining))
+                    source_hash.update(block)
+                    remaining -= len(block)
+                source_file.seek(offset)
+                part_file.seek(offset)
+                if progress:
+                    progress(offset)
+
+            # The worker reads; the destination, every mirror, every upload and the hasher each write on their own thread
+            upload_streams = {}
+            part_files = {destination_path: part_file}
+            sinks = {destination_path: part_file.write}
+            for mirror in mirrors:
+                try:
+                    part_files[mirror] = stack.enter_context(open(mirror + self.PART_SUFFIX, "wb"))
+                    sinks[mirror] = part_files[mirror].write
+                except OSError as e:
+                    target_errors[mirror] = e  # e.g. the backup drive is not connected
+            upload_digests = {}  # checksum algorithm of an upload server -> digest of the source
+            for target, remote_name in uploads:
+                label = target.label(remote_name)
+                try:
+                    upload_streams[label] = (target, target.open_upload(remote_name), remote_name)
+                    sinks[label] = upload_streams[label][1].write
+                    algorithm = target.session().checksum_algorithm
+                    if algorithm and algorithm not in upload_digests:
+                        upload_digests[algorithm] = new_digest(algorithm)
+                except Exception as e:
+                    target_errors[label] = e
+                    target.reset()
+            if source_hash is not None:
+                sinks["hash"] = source_hash.update
+            for algorithm, digest in upload_digests.items():
+                if source_hash is None or algorithm != self.hash_algorithm:
+                    sinks[f"checksum:{algorithm}"] = digest.update
+            ring = self.ring()
+            fan_out = FanOut(sinks, ring, threaded=os.fstat(source_file.fileno()).st_size - offset > self.block_size,
+                             io_priority=self.io_priority)
+            # Streams still open when the copy fails leave their connection in an unknown state
+            stack.callback(lambda: [target.reset() for target, _, _ in upload_streams.values()])
+
+            try:
+                while True:
+                    buffer = ring.acquire()
+                    try:
+                        length = source_file.readinto(buffer)
+                    except BaseException:
+                        ring.release(buffer)
+                        raise
+                    if not length:
+                        ring.release(buffer)
+                        break
+                    if self.rate_limit is not None:
+                        self.rate_limit.consume(length)
+                    fan_out.write(buffer, length)
+                    if progress:
+                        progress(length)
+            finally:
+                errors = fan_out.close()
+
+            for name in (destination_path, "hash"):
+                if name in errors:
+                    raise errors[name]
+            target_errors.update(errors)
+            if source_hash is not None and self.verify_read != "cached":
+                # The copies are read back from the disk, so they have to be on it first
+                with self.span("flush"):
+                    for path, written_file in part_files.items():
+                        if path in target_errors:
+                            continue
+                        try:
+                            written_file.flush()
+                            os.fsync(written_file.fileno())
+                        except OSError as e:
+                            if path == destination_path:
+                                raise
+                            target_errors[path] = e
+            # Check every upload on its server (size, and checksum where offered) like a separate upload
+            source_size = os.fstat(source_file.fileno()).st_size
+            for label, (target, stream, remote_name) in list(upload_streams.items()):
+                try:
+                    if label in target_errors:
+                        raise target_errors[label]
+                    stream.close()
+                    del upload_streams[label]
+                    session = target.session()
+                    algorithm = session.checksum_algorithm
+                    digest = source_hash if algorithm and algorithm == self.hash_algorithm and source_hash is not None \
+                        else upload_digests.get(algorithm)
+                    with self.span("verify"):
+                        problem = session.verify_upload(remote_name, source_size, digest)
+                    if problem is not None:
+                        target_errors[label] = IOError(f"verification failed: {problem}")
+                except Exception as e:
+                    target_errors[label] = e
+        for path in (destination_path,) + tuple(mirror for mirror in mirrors if mirror not in target_errors):
+            shutil.copystat(source_path, path + self.PART_SUFFIX)
+        copy_seconds = time.perf_counter() - started
+
+        # The source was hashed while it was read; only the copies have to be read back
+        hash_start = time.perf_counter()
+        expected_size = os.path.getsize(source_path)
+
+        def verify_and_finish(path):
+            with self.span("hash"):
+                if source_hash is not None and self.verify_read != "cached":
+                    ok = file_hash_uncached(path + self.PART_SUFFIX, self.hash_algorithm, self.block_size,
+                                            self.verify_read) == source_hash.hexdigest()
+                elif source_hash is not None:
+                    ok = file_hash(path + self.PART_SUFFIX, self.hash_algorithm, self.block_size) == source_hash.hexdigest()
+                else:
+                    ok = os.path.getsize(path + self.PART_SUFFIX) == expected_size
+            if ok:
+                os.replace(path + self.PART_SUFFIX, path)
+                # If "adjust_time" is True, set the file timestamps to now
+                if adjust_time:
+                    current_time = time.time()
+                    os.utime(path, (current_time, current_time))
+            else:
+                os.remove(path + self.PART_SUFFIX)  # Do not resume from a copy that failed verification
+            return ok
+
+        size = os.path.getsize(part_path)
+        ok = verify_and_finish(destination_path)
+        targets = []
+        for mirror in mirrors:
+            if mirror in target_errors:
+                if os.path.exists(mirror + self.PART_SUFFIX):
+                    os.remove(mirror + self.PART_SUFFIX)
+                targets.append((mirror, False, target_errors[mirror]))
+            else:
+                targets.append((mirror, verify_and_finish(mirror), None))
+        for target, remote_name in uploads:
+            label = target.label(remote_name)
+            targets.append((label, label not in target_errors, target_errors.get(label)))
+        hash_seconds = time.perf_counter() - hash_start if source_hash is not None else None
+        return CopyResult(size, copy_seconds, hash_seconds, started, ok, bool(offset), None, tuple(targets))
+
+    def run(self, tasks, on_result=None, on_progress=None, progress_interval=0.1):
+        # Copy all tasks; on_result(task, result) and on_progress(copied bytes) are called on the calling thread
+        progress_lock = threading.Lock()
+        copied_bytes = 0
+
+        def progress(size):
+            nonlocal copied_bytes
+            with progress_lock:
+                copied_bytes += size
+
+        def copy_task(task):
+            try:
+                with thread_io_priority(self.io_priority):
+                    return self.copy_file(task.source, task.destination, task.adjust_time, progress,
+                                          task.mirrors, task.uploads)
+            except Exception as e:
+                return CopyResult(0, 0.0, None, time.perf_counter(), False, False, e)
+
+        small_tasks = {id(task) for task in tasks if self.small_file_size and self.is_small(task)}
+        results = []
+        with contextlib.ExitStack() as stack:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="copy"))
+            small_file_executor = stack.enter_context(ThreadPoolExecutor(
+                max_workers=self.small_file_workers, thread_name_prefix="copy-small",
+                initializer=self.start_small_file_worker)) if small_tasks else executor
+            futures = {(small_file_executor if id(task) in small_tasks else executor).submit(copy_task, task): task
+                       for task in tasks}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results.append((futures[future], future.result()))
+                    if on_result:
+                        on_result(futures[future], future.result())
+                if on_progress:
+                    on_progress(copied_bytes)
+        return results
+
+
+class CredentialStore:
+    """FTP credentials kept in memory and written through to an encrypted-password JSON file."""
+
+    # Transfer settings stored with every credential
+    DEFAULT_SETTINGS = {"pool_size": 1, "block_size": 256 * 1024, "protocol": "auto", "detected_protocol": None}
+
+    def __init__(self, credentials_path, key_path):
+        self.credentials_path = credentials_path
+        self.key_path = key_path
+        self.lock = threading.Lock()
+        self.cipher = Fernet(self.load_key())
+        self.credentials = self.load()
+
+    def load_key(self):
+        # Load the encryption key from a file, generating a new one if it doesn't exist.
+        try:
+            with open(self.key_path, "rb") as key_file:
+                return key_file.read()
+        except FileNotFoundError:
+            key = Fernet.generate_key()
+            with open(self.key_path, "wb") as key_file:
+                key_file.write(key)
+            return key
+
+    def load(self):
+        try:
+            with open(self.credentials_path, "r") as credentials_file:
+                credentials = json.load(credentials_file)
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError as e:
+            logging.error(f"Could not read {self.credentials_path}: {e}")
+            return []
+        for credential in credentials:
+            for key, value in self.DEFAULT_SETTINGS.items():
+                credential.setdefault(key, value)
+        return credentials
+
+    def save(self):
+        # Write to a temporary file and swap it in, so a crash never leaves a truncated file (called with the lock held)
+        temp_path = self.credentials_path + ".tmp"
+        with open(temp_path, "w") as credentials_file:
+            json.dump(self.credentials, credentials_file, indent=2)
+            credentials_file.flush()
+            os.fsync(credentials_file.fileno())
+        os.replace(temp_path, self.credentials_path)
+
+    def labels(self):
+        with self.lock:
+            return [f"{credential['username']}@{credential['server']}" for credential in self.credentials]
+
+    def get(self, index):
+        # Credential at index with the password decrypted
+        with self.lock:
+            credential = dict(self.credentials[index])
+        credential["password"] = self.decrypt_password(credential["password"])
+        return credential
+
+    def put(self, server, username, password, **settings):
+        # Add a credential, or update the one for the same server and user; returns its index
+        credential = {"server": server, "username": username, "password": self.encrypt_password(password)}
+        credential.update((key, value) for key, value in settings.items() if value is not None)
+        with self.lock:
+            for index, existing in enumerate(self.credentials):
+                if existing["server"] == server and existing["username"] == username:
+                    self.credentials[index] = dict(existing, **credential)
+                    break
+            else:
+                self.credentials.append(dict(self.DEFAULT_SETTINGS, **credential))
+                index = len(self.credentials) - 1
+            self.save()
+        return index
+
+    def settings(self, server, username):
+        # Transfer settings of the stored credential for server and user (defaults if it is not stored)
+        with self.lock:
+            for credential in self.credentials:
+                if credential["server"] == server and credential["username"] == username:
+                    return {key: credential[key] for key in self.DEFAULT_SETTINGS}
+        return dict(self.DEFAULT_SETTINGS)
+
+    def find(self, label):
+        # Credential by its "username@server" label with the password decrypted, or None
+        labels = self.labels()
+        return self.get(labels.index(label)) if label in labels else None
+
+    def remember_protocol(self, server, username, protocol):
+        # Store the protocol that worked for an "auto" credential, so the next connection tries it first
+        with self.lock:
+            for credential in self.credentials:
+                if credential["server"] == server and credential["username"] == username:
+                    if credential.get("detected_protocol") != protocol:
+                        credential["detected_protocol"] = protocol
+                        self.save()
+                    return
+
+    def remove(self, index):
+        with self.lock:
+            self.credentials.pop(index)
+            self.save()
+
+    def encrypt_password(self, password):
+        return self.cipher.encrypt(password.encode()).decode()
+
+    def decrypt_password(self, encrypted_password):
+        return self.cipher.decrypt(encrypted_password.encode()).decode()
+
+
+class Transport:
+    """Connection to a delivery target. Subclasses implement the protocol-specific primitives."""
+
+    protocol = None
+    default_port = None
+    missing_directory_errors = (OSError,)
+    checksum_algorithm = None  # Digest the server can compute for verify_upload (e.g. "sha256"), if any
+
+    def __init__(self, host, port=None, username="", password="", block_size=256 * 1024):
+        self.host = host
+        self.port = port or self.default_port
+        self.username = username
+        self.password = password
+        self.block_size = block_size
+
+    def ensure_directory(self, path):
+        # Change into path (relative to the current directory), creating missing folders on the way
+        for directory in path.split("/"):
+            if not directory:
+                continue
+            try:
+                self.cwd(directory)
+            except self.missing_directory_errors:
+                try:
+                    self.mkdir(directory)
+                except self.missing_directory_errors:
+                    pass  # Created by another connection in the meantime; the cwd below tells
+                self.cwd(directory)
+
+    def remote_size(self, remote_name):
+        return None  # Not supported (-1 when the file is not on the server)
+
+    def remote_checksum(self, remote_name):
+        return None  # Not supported
+
+    def verify_upload(self, remote_name, size, digest=None):
+        # Check an uploaded file against the server's size and, if it can compute one, its checksum
+        # (digest is the local digest of checksum_algorithm). Returns None when it matches, else the problem.
+        remote_size = self.remote_size(remote_name)
+        if remote_size is not None and remote_size < 0:
+            return "not found on the server"
+        if remote_size is not None and remote_size != size:
+            return f"size on server {remote_size} instead of {size}"
+        if digest is not None:
+            remote_checksum = self.remote_checksum(remote_name)
+            if remote_checksum is not None and int(remote_checksum, 16) != int(digest.hexdigest(), 16):
+                return f"{self.checksum_algorithm.upper()} on server {remote_checksum.lower()} instead of {digest.hexdigest()}"
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FTPTransport(Transport):
+    protocol = "ftp"
+    default_port = 21
+    missing_directory_errors = (ftplib.error_perm,)
+
+    # Checksum commands in order of preference: the HASH command (with its algorithm names), then the older X commands
+    HASH_ALGORITHMS = (("sha256", "SHA-256"), ("sha1", "SHA-1"), ("md5", "MD5"), ("crc32", "CRC32"))
+    CHECKSUM_COMMANDS = (("sha256", "XSHA256"), ("sha1", "XSHA1"), ("md5", "XMD5"), ("crc32", "XCRC"))
+
+    def new_session(self):
+        return ftplib.FTP()
+
+    def connect(self):
+        self.session = self.new_session()
+        self.session.connect(self.host, self.port, timeout=30)
+        self.session.login(self.username, self.password)
+        self.session.set_pasv(True)  # Set passive mode
+        self.features = self.read_features()
+        self.checksum_algorithm, self.checksum_command = self.choose_checksum()
+        return self
+
+    def read_features(self):
+        # FEAT: feature name -> its parameters ("HASH" -> "SHA-256*;SHA-1;MD5")
+        try:
+            response = self.session.sendcmd("FEAT")
+        except ftplib.Error:
+            return {}
+        features = {}
+        for line in response.splitlines()[1:-1]:
+            name, _, parameters = line.strip().partition(" ")
+            features[name.upper()] = parameters
+        return features
+
+    def choose_checksum(self):
+        if "HASH" in self.features:
+            offered = {name.rstrip("*").upper(): name.endswith("*") for name in self.features["HASH"].split(";")}
+            for algorithm, name in self.HASH_ALGORITHMS:
+                if name not in offered:
+                    continue
+                try:
+                    self.session.sendcmd(f"OPTS HASH {name}")
+                except ftplib.Error:
+                    if not offered[name]:  # Cannot switch to it, and it is not the current one
+                        continue
+                return algorithm, "HASH"
+        for algorithm, command in self.CHECKSUM_COMMANDS:
+            if command in self.features:
+                return algorithm, command
+        return None, None
+
+    def remote_size(self, remote_name):
+        if "SIZE" not in self.features:
+            return None
+        self.session.voidcmd("TYPE I")  # SIZE counts ASCII line endings otherwise
+        try:
+            return self.session.size(remote_name)
+        except ftplib.error_perm:
+            return -1  # Not on the server
+
+    def remote_checksum(self, remote_name):
+        try:
+            response = self.session.sendcmd(f"{self.checksum_command} {remote_name}")
+        except ftplib.error_perm as e:
+            logging.debug(f"{self.checksum_command} not usable on {self.host}: {e}")
+            self.checksum_algorithm = None  # Do not ask again on this session
+            return None
+        # "213 SHA-256 0-1023 <hex> <name>" (HASH) or "250 <hex>" (X commands)
+        fields = response.split(" ", 4)
+        value = fields[3] if self.checksum_command == "HASH" and len(fields) > 3 else fields[1] if len(fields) > 1 else ""
+        return value.strip() if re.fullmatch(r"[0-9A-Fa-f]+", value.strip()) else None
+
+    def cwd(self, path):
+        self.session.cwd(path)
+
+    def mkdir(self, path):
+        self.session.mkd(path)
+
+    def pwd(self):
+        return self.session.pwd()
+
+    def upload(self, file, remote_name, append=False):
+        self.session.storbinary(f"{'APPE' if append else 'STOR'} {remote_name}", file, blocksize=self.block_size)
+
+    def open_upload(self, remote_name):
+        # Writable stream for blocks that arrive one by one (tee copies)
+        self.session.voidcmd("TYPE I")
+        return FTPUploadStream(self.session, self.session.transfercmd(f"STOR {remote_name}"))
+
+    def close(self):
+        try:
+            self.session.quit()
+        except (OSError, EOFError, ftplib.Error):
+            self.session.close()
+
+
+class FTPUploadStream:
+    """Data connection of a STOR that is written block by block."""
+
+    def __init__(self, session, connection):
+        self.session = session
+        self.connection = connection
+
+    def write(self, block):
+        self.connection.sendall(block)
+
+    def close(self):
+        # Like storbinary: end TLS on the data connection, close it and read the transfer result
+        if isinstance(self.connection, ssl.SSLSocket):
+            self.connection.unwrap()
+        self.connection.close()
+        self.session.voidresp()
+
+
+class FTPSTransport(FTPTransport):
+    protocol = "ftps"
+
+    def new_session(self):
+        return ftplib.FTP_TLS()
+
+    def connect(self):
+        super().connect()
+        self.session.prot_p()  # Encrypt the data connections too
+        return self
+
+
+class SFTPTransport(Transport):
+    protocol = "sftp"
+    default_port = 22
+
+    def connect(self):
+        if paramiko is None:
+            raise RuntimeError("SFTP requires the paramiko package (pip install paramiko)")
+        self.client = paramiko.SSHClient()
+        self.client.load_system_host_keys()
+        # Trust on first use: an unknown server's key is stored in ftpConfig/known_hosts; after that a
+        # different key for the same server is refused (paramiko raises BadHostKeyException)
+        known_hosts_path = os.path.join(os.getcwd(), "ftpConfig", "known_hosts")
+        if not os.path.exists(known_hosts_path):
+            os.makedirs(os.path.dirname(known_hosts_path), exist_ok=True)
+            with os.fdopen(os.open(known_hosts_path, os.O_WRONLY | os.O_CREAT, 0o600), "w"):
+                pass
+        self.client.load_host_keys(known_hosts_path)  # New keys are saved back to this file
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        known_hosts = len(self.client.get_host_keys())
+        self.client.connect(self.host, self.port, self.username, self.password, timeout=30)
+        if len(self.client.get_host_keys()) > known_hosts:
+            logging.warning(f"First SFTP connection to {self.host}: stored its host key in {known_hosts_path}.")
+        self.session = self.client.open_sftp()
+        self.session.chdir(".")  # Track the current directory, paramiko only does so after a chdir
+        return self
+
+    def cwd(self, path):
+        self.session.chdir(path)
+
+    def mkdir(self, path):
+        self.session.mkdir(path)
+
+    def pwd(self):
+        return self.session.getcwd()
+
+    def upload(self, file, remote_name, append=False):
+        if not append:
+            self.session.putfo(file, remote_name, confirm=False)
+            return
+        with self.session.open(remote_name, "ab") as remote_file:
+            remote_file.set_pipelined(True)
+            shutil.copyfileobj(file, remote_file, self.block_size)
+
+    def remote_size(self, remote_name):
+        try:
+            return self.session.stat(remote_name).st_size
+        except FileNotFoundError:
+            return -1
+
+    def open_upload(self, remote_name):
+        remote_file = self.session.open(remote_name, "wb")
+        remote_file.set_pipelined(True)
+        return SFTPUploadStream(remote_file)
+
+    def close(self):
+        self.session.close()
+        self.client.close()
+
+
+class SFTPUploadStream:
+    """Remote SFTP file written block by block; paramiko only accepts bytes, not memoryviews."""
+
+    def __init__(self, remote_file):
+        self.remote_file = remote_file
+
+    def write(self, block):
+        self.remote_file.write(bytes(block))
+
+    def close(self):
+        self.remote_file.close()
+
+
+class LocalTransport(Transport):
+    """Delivers into a local (or mounted network) folder; the host is the root folder."""
+
+    protocol = "local"
+
+    def connect(self):
+        if not os.path.isdir(self.host):
+            raise FileNotFoundError(f"Folder not found: {self.host}")
+        self.directory = "/"
+        return self
+
+    def local_path(self, path=""):
+        virtual_path = posixpath.normpath(posixpath.join(self.directory, path))
+        return os.path.join(self.host, *[part for part in virtual_path.split("/") if part and part != ".."])
+
+    def cwd(self, path):
+        if not os.path.isdir(self.local_path(path)):
+            raise FileNotFoundError(f"Folder not found: {path}")
+        self.directory = posixpath.normpath(posixpath.join(self.directory, path))
+
+    def mkdir(self, path):
+        os.mkdir(self.local_path(path))
+
+    def pwd(self):
+        return self.directory
+
+    def upload(self, file, remote_name, append=False):
+        with open(self.local_path(remote_name), "ab" if append else "wb") as destination_file:
+            shutil.copyfileobj(file, destination_file, self.block_size)
+
+    def remote_size(self, remote_name):
+        try:
+            return os.path.getsize(self.local_path(remote_name))
+        except FileNotFoundError:
+            return -1
+
+    def open_upload(self, remote_name):
+        return open(self.local_path(remote_name), "wb")
+
+    def close(self):
+        pass
+
+
+TRANSPORTS = {transport.protocol: transport for transport in (FTPSTransport, FTPTransport, SFTPTransport, LocalTransport)}
+
+# Protocols tried, in order, for an "auto" credential
+AUTO_PROTOCOLS = ("ftps", "ftp")
+
+
+def parse_server_address(protocol, address):
+    # "host[:port]/sub/folder" -> (host, port, subfolder); for "local" the whole address is the root folder
+    if protocol == "local":
+        return address, None, ""
+    server, _, subfolder = address.partition("/")
+    host, _, port = server.partition(":")
+    return host, int(port) if port.isdigit() else None, subfolder
+
+
+def connect_transport(protocol, host, port, username, password, block_size=256 * 1024, detected_protocol=None):
+    # Connect with the credential's protocol; "auto" tries the last protocol that worked first, then FTPS and FTP
+    if protocol != "auto":
+        return TRANSPORTS[protocol](host, port, username, password, block_size).connect()
+    candidates = [detected_protocol] if detected_protocol in AUTO_PROTOCOLS else []
+    candidates += [candidate for candidate in AUTO_PROTOCOLS if candidate not in candidates]
+    for candidate in candidates:
+        try:
+            return TRANSPORTS[candidate](host, port, username, password, block_size).connect()
+        except Exception as e:
+            if candidate == candidates[-1]:
+                raise
+            logging.info(f"{candidate.upper()} connection failed: {e}. Trying {candidates[candidates.index(candidate) + 1].upper()}...")
+
+
+def device_key(path):
+    # Identify the device a path lives on (the nearest existing folder's st_dev), for the job scheduler
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        return f"dev:{os.stat(path).st_dev}"
+    except OSError:
+        return f"path:{os.path.splitdrive(path)[0] or path}"
+
+
+class DeviceSlots:
+    """Limits how many transfer jobs use one device (disk, share or server) at the same time."""
+
+    def __init__(self, jobs_per_device=1):
+        self.jobs_per_device = jobs_per_device
+        self.lock = threading.Lock()
+        self.semaphores = {}  # device -> Semaphore
+
+    @contextlib.contextmanager
+    def hold(self, devices):
+        # Acquired in sorted order, so two jobs that share several devices cannot deadlock
+        with self.lock:
+            semaphores = [self.semaphores.setdefault(device, threading.Semaphore(self.jobs_per_device))
+                          for device in sorted(set(devices))]
+        with contextlib.ExitStack() as stack:
+            for semaphore in semaphores:
+                stack.enter_context(semaphore)
+            yield
+
+
+DELIVERY_PRIORITIES = ("urgent", "normal", "bulk")
+
+
+def parse_delivery_window(window):
+    # "22:00-06:00" -> (1320, 360): start and end in minutes after midnight; a window may run past midnight
+    try:
+        start, end = ((int(hours), int(minutes)) for hours, minutes in
+                      (part.strip().split(":") for part in window.split("-")))
+    except ValueError:
+        raise ValueError(f"'{window}' is not a window like 22:00-06:00") from None
+    if not all(0 <= hours < 24 and 0 <= minutes < 60 for hours, minutes in (start, end)) or start == end:
+        raise ValueError(f"'{window}' is not a window like 22:00-06:00")
+    return start[0] * 60 + start[1], end[0] * 60 + end[1]
+
+
+def delivery_window_open(window, now=None):
+    if not window:
+        return True
+    start, end = parse_delivery_window(window)
+    now = now or datetime.datetime.now()
+    minute = now.hour * 60 + now.minute
+    return start <= minute < end if start < end else minute >= start or minute < end
+
+
+class DeliveryScheduler:
+    """Upload jobs (deliveries) queued by priority, each sent within its time window, kept across restarts.
+
+    Only the deliveries of the most urgent priority that may send right now run; a running delivery
+    of a lower priority, or one whose window closes, is preempted: its uploads stop at the next block
+    and it goes back in the queue with the files it has left, which later continue where they stopped.
+    The queue is written to queue_path (passwords encrypted with the credential store's key).
+    """
+
+    def __init__(self, service, queue_path=None, credential_store=None, check_interval=30):
+        self.service = service
+        self.queue_path = queue_path
+        self.credential_store = credential_store
+        self.check_interval = check_interval  # Windows open and close on whole minutes
+        self.condition = threading.Condition()
+        self.deliveries = self.load()  # id -> delivery (the persisted part)
+        self.running = {}  # id -> preempt event of the deliveries that are running
+        self.listeners = {}  # id -> (on_event, span) of the client waiting for a delivery
+        if self.deliveries:
+            logging.info(f"Resuming {len(self.deliveries)} queued deliveries.")
+        threading.Thread(target=self.dispatch, name="delivery-scheduler", daemon=True).start()
+
+    def load(self):
+        if self.queue_path is None:
+            return OrderedDict()
+        try:
+            with open(self.queue_path, "r") as queue_file:
+                return OrderedDict((delivery["id"], delivery) for delivery in json.load(queue_file))
+        except FileNotFoundError:
+            return OrderedDict()
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logging.error(f"Could not read the delivery queue {self.queue_path}: {e}")
+            return OrderedDict()
+
+    def save(self):
+        # Like CredentialStore.save: write a temporary file and swap it in (called with the lock held)
+        if self.queue_path is None:
+            return
+        temp_path = self.queue_path + ".tmp"
+        try:
+            with open(temp_path, "w") as queue_file:
+                json.dump([delivery for delivery in self.deliveries.values() if delivery["persist"]],
+                          queue_file, indent=2)
+                queue_file.flush()
+                os.fsync(queue_file.fileno())
+            os.replace(temp_path, self.queue_path)
+        except OSError as e:
+            logging.error(f"Could not save the delivery queue {self.queue_path}: {e}")
+
+    def submit(self, job, on_event=None, span=None):
+        # Queue an upload job with its "priority" and "window"; returns the delivery id
+        priority = job.get("priority") or "normal"
+        if priority not in DELIVERY_PRIORITIES:
+            raise ValueError(f"unknown priority '{priority}'")
+        window = job.get("window") or None
+        if window:
+            parse_delivery_window(window)
+        delivery_id = uuid.uuid4().hex
+        # Without the credential store's key the password cannot be stored, so the delivery is not kept
+        persist = self.credential_store is not None
+        password = self.credential_store.encrypt_password(job["password"]) if persist else job["password"]
+        delivery = {"id": delivery_id, "priority": priority, "window": window, "persist": persist,
+                    "submitted": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "job": dict(job, password=password, files=[list(file) for file in job["files"]]),
+                    "started": [], "completed": 0, "failed": 0, "bytes": 0}
+        with self.condition:
+            self.deliveries[delivery_id] = delivery
+            if on_event is not None or span is not None:
+                self.listeners[delivery_id] = (on_event, span)
+            self.save()
+            self.condition.notify_all()
+        if not delivery_window_open(window):
+            logging.info(f"Delivery of {len(job['files'])} files to {job['server']} queued for its window {window}.")
+            self.notify(delivery_id, {"event": "queued", "priority": priority, "window": window})
+        return delivery_id
+
+    def deliver(self, job, on_event=None, span=None):
+        # Submit a delivery and block until it is done (over as many preemptions as it takes)
+        finished = threading.Event()
+        outcome = {}
+
+        def on_delivery_event(event):
+            if event["event"] == "delivered":
+                outcome.update(event, event="done")
+                finished.set()
+            elif on_event is not None:
+                on_event(event)
+
+        self.submit(job, on_delivery_event, span)
+        finished.wait()
+        if on_event is not None:
+            on_event(outcome)
+        return outcome
+
+    def notify(self, delivery_id, event):
+        on_event = self.listeners.get(delivery_id, (None, None))[0]
+        if on_event is not None:
+            try:
+                on_event(event)
+            except Exception as e:
+                logging.debug(f"Event handler of delivery {delivery_id} failed: {e}")
+
+    def status(self):
+        with self.condition:
+            return [{"id": delivery["id"], "priority": delivery["priority"], "window": delivery["window"],
+                     "state": "running" if delivery["id"] in self.running else
+                              "queued" if delivery_window_open(delivery["window"]) else "waiting",
+                     "server": delivery["job"]["server"], "directory": delivery["job"]["directory"],
+                     "files": len(delivery["job"]["files"]), "completed": delivery["completed"]}
+                    for delivery in self.deliveries.values()]
+
+    def dispatch(self):
+        with self.condition:
+            while True:
+                now = datetime.datetime.now()
+                ready = {delivery_id for delivery_id, delivery in self.deliveries.items()
+                         if delivery_window_open(delivery["window"], now)}
+                top = min((DELIVERY_PRIORITIES.index(self.deliveries[delivery_id]["priority"])
+                           for delivery_id in ready), default=None)
+                for delivery_id, delivery in self.deliveries.items():
+                    runs_now = delivery_id in ready and DELIVERY_PRIORITIES.index(delivery["priority"]) == top
+                    preempt = self.running.get(delivery_id)
+                    if preempt is not None and not runs_now and not preempt.is_set():
+                        logging.info(f"Delivery to {delivery['job']['server']} ({delivery['priority']}) preempted.")
+                        preempt.set()
+                    elif preempt is None and runs_now:
+                        self.running[delivery_id] = threading.Event()
+                        threading.Thread(target=self.run_delivery, args=(delivery, self.running[delivery_id]),
+                                         name="delivery", daemon=True).start()
+                self.condition.wait(self.check_interval)
+
+    def run_delivery(self, delivery, preempt):
+        delivery_id = delivery["id"]
+        span = self.listeners.get(delivery_id, (None, None))[1]
+        with self.condition:
+            job = dict(delivery["job"], files=list(delivery["job"]["files"]), resume=list(delivery["started"]))
+            done_before = delivery["completed"] + delivery["failed"]
+            bytes_before = delivery["bytes"]
+
+        def on_event(event):
+            with self.condition:
+                if event["event"] == "started" and event["name"] not in delivery["started"]:
+                    delivery["started"].append(event["name"])
+                    self.save()
+                elif event["event"] == "file":
+                    # Finished (or failed for good): not sent again when the delivery resumes
+                    delivery["job"]["files"] = [file for file in delivery["job"]["files"] if file[1] != event["name"]]
+                    delivery["started"] = [name for name in delivery["started"] if name != event["name"]]
+                    delivery["completed" if event["ok"] else "failed"] += 1
+                    delivery["bytes"] += event["size"]
+                    self.save()
+            if event["event"] == "progress":
+                # Count what earlier runs of the delivery sent as well
+                event = dict(event, files=event["files"] + done_before, bytes=event["bytes"] + bytes_before,
+                             total_files=event["total_files"] + done_before,
+                             total_bytes=event["total_bytes"] + bytes_before)
+            if event["event"] != "done":
+                self.notify(delivery_id, event)
+
+        try:
+            if delivery["persist"]:
+                job["password"] = self.credential_store.decrypt_password(job["password"])
+            done = self.service.run(job, on_event, span, preempt)
+        except Exception as e:
+            logging.error(f"Delivery to {delivery['job']['server']} failed: {e}")
+            done = {"completed": 0, "failed": 0, "bytes": 0, "seconds": 0, "failed_targets": [], "error": str(e)}
+        with self.condition:
+            del self.running[delivery_id]
+            requeued = preempt.is_set() and bool(delivery["job"]["files"]) and done["error"] is None
+            if not requeued:
+                del self.deliveries[delivery_id]
+            self.save()
+            self.condition.notify_all()
+        if requeued:
+            self.notify(delivery_id, {"event": "queued", "priority": delivery["priority"],
+                                      "window": delivery["window"]})
+            return
+        logging.info(f"Delivery to {delivery['job']['server']} done: {delivery['completed']} files uploaded, "
+                     f"{delivery['failed']} failed.")
+        self.notify(delivery_id, dict(done, event="delivered", completed=delivery["completed"],
+                                      failed=delivery["failed"], bytes=delivery["bytes"]))
+        self.listeners.pop(delivery_id, None)
+
+
+class IngestService:
+    """Runs copy and upload jobs: the transfer engine behind the GUI, in-process or in a worker (--worker).
+
+    Jobs are plain dicts (so they can be sent to a worker as JSON) and report through on_event with
+    "progress", "started", "file" and "done" events. run() blocks the calling thread until the job is
+    done; deliver() does the same for an upload job that goes through the delivery queue.
+    """
+
+    def __init__(self, metrics, catalog=None, credential_store=None, jobs_per_device=1, delivery_queue_path=None):
+        self.metrics = metrics
+        self.catalog = catalog
+        self.credential_store = credential_store
+        self.devices = DeviceSlots(jobs_per_device)
+        self.job_ids = itertools.count(1)
+        self.jobs = OrderedDict()  # job id -> status of the queued and running jobs
+        self.throttles = {}  # client -> preview throttle rate in bytes/s
+        self.rate_limits = set()  # TokenBuckets of the running jobs
+        self.lock = threading.Lock()
+        self.deliveries = DeliveryScheduler(self, delivery_queue_path, credential_store)
+
+    def status(self):
+        with self.lock:
+            return [dict(job_status) for job_status in self.jobs.values()]
+
+    def set_throttle(self, client, rate_mbps):
+        # Throttle while a client's preview plays; the lowest throttle of all clients applies
+        with self.lock:
+            if rate_mbps:
+                self.throttles[client] = rate_mbps * 1024 * 1024
+            else:
+                self.throttles.pop(client, None)
+            for bucket in self.rate_limits:
+                bucket.set_throttle(self.throttle_rate())
+
+    def throttle_rate(self):
+        return min(self.throttles.values(), default=0)
+
+    @contextlib.contextmanager
+    def rate_limit(self, rate_mbps):
+        # Bandwidth cap for one job; throttled further while a preview plays
+        bucket = TokenBucket(rate_mbps * 1024 * 1024)
+        with self.lock:
+            bucket.set_throttle(self.throttle_rate())
+            self.rate_limits.add(bucket)
+        try:
+            yield bucket
+        finally:
+            with self.lock:
+                self.rate_limits.discard(bucket)
+
+    def run(self, job, on_event=None, span=None, preempt=None):
+        # Queue the job behind other jobs on the same devices, run it and return its "done" event
+        on_event = on_event or (lambda event: None)
+        with self.lock:
+            job_id = next(self.job_ids)
+            job_status = self.jobs[job_id] = {"job": job_id, "kind": job["kind"], "labels": job.get("labels", {}),
+                                              "state": "queued", "files": 0, "total_files": 0,
+                                              "bytes": 0, "total_bytes": 0}
+
+        def emit(event, **fields):
+            fields.update(event=event, job=job_id)
+            if event == "progress":
+                job_status.update(files=fields["files"], total_files=fields["total_files"],
+                                  bytes=fields["bytes"], total_bytes=fields["total_bytes"])
+            try:
+                on_event(fields)
+            except Exception as e:
+                logging.debug(f"Event handler of job {job_id} failed: {e}")
+            return fields
+
+        span = span or (lambda stage: contextlib.nullcontext())
+        try:
+            with self.devices.hold(self.job_devices(job)):
+                job_status["state"] = "running"
+                if job["kind"] == "copy":
+                    result = self.run_copy_job(job, emit, span)
+                else:
+                    result = self.run_upload_job(job, emit, span, preempt)
+        except Exception as e:
+            logging.error(f"{job['kind'].capitalize()} job {job_id} failed: {e}")
+            result = {"completed": 0, "failed": 0, "bytes": 0, "seconds": 0, "failed_targets": [], "error": str(e)}
+        finally:
+            with self.lock:
+                del self.jobs[job_id]
+        return emit("done", **result)
+
+    def deliver(self, job, on_event=None, span=None):
+        # Send an upload job by its "priority" within its "window"; returns the "done" event of the delivery
+        return self.deliveries.deliver(job, on_event, span)
+
+    def job_devices(self, job):
+        if job["kind"] == "upload":
+            return [device_key(path) for path, *_ in job["files"][:1]] + [f"server:{job['server']}"]
+        devices = set()
+        for task in job["tasks"]:
+            devices.add(device_key(task["source"]))
+            devices.update(device_key(path) for path in [task["destination"], *task.get("mirrors", ())])
+            devices.update(f"credential:{credential}" for credential, _, _ in task.get("uploads", ()))
+        return devices
+
+    def create_upload_target(self, credential_label, directory):
+        # Upload target for a routing rule's "ftp_credential" (a saved credential, "user@server")
+        credential = self.credential_store.find(credential_label) if self.credential_store else None
+        if credential is None:
+            logging.warning(f"FTP credential '{credential_label}' not found; clips are not uploaded.")
+            return None
+        protocol = credential["protocol"]
+        server, port, folder = parse_server_address(protocol, credential["server"])
+
+        def connect():
+            session = connect_transport(protocol, server, port, credential["username"], credential["password"],
+                                        credential["block_size"], credential["detected_protocol"])
+            if protocol == "auto":
+                self.credential_store.remember_protocol(credential["server"], credential["username"], session.protocol)
+            return session
+
+        return UploadTarget(credential_label, connect, "/".join(part for part in (folder, directory) if part))
+
+    def run_copy_job(self, job, emit, span):
+        # Copy (and verify) job["tasks"] on a CopyEngine; also writes their backup copies and uploads
+        settings = job["settings"]
+        kind = job.get("metric", "copy")
+        labels = job.get("labels", {})
+        job_start = time.perf_counter()
+        upload_targets = {}  # (ftp_credential, directory) -> UploadTarget (None if the credential is unknown)
+        copy_tasks = []
+        for task in job["tasks"]:
+            uploads = []
+            for credential_label, directory, remote_name in task.get("uploads", ()):
+                if (credential_label, directory) not in upload_targets:
+                    upload_targets[credential_label, directory] = self.create_upload_target(credential_label, directory)
+                if upload_targets[credential_label, directory] is not None:
+                    uploads.append((upload_targets[credential_label, directory], remote_name))
+            copy_tasks.append(CopyTask(task["source"], task["destination"], task.get("adjust_time", False),
+                                       task, tuple(task.get("mirrors", ())), tuple(uploads)))
+
+        total_files = len(copy_tasks)
+        total_bytes = sum(os.path.getsize(task.source) for task in copy_tasks)
+        processed_files = completed_files = copied_bytes = 0
+        failed_targets = []
+
+        def on_copy_result(copy_task, result):
+            nonlocal processed_files, completed_files, copied_bytes
+            task = copy_task.context
+            file_name = task.get("name", os.path.basename(copy_task.source))
+            if result.error is not None:
+                logging.error(f"Error copying '{file_name}' to '{copy_task.destination}': {result.error}")
+            elif result.ok:
+                logging.info(f"File '{file_name}' copied to '{copy_task.destination}' and verified.",
+                             extra={"fields": {"source": copy_task.source, "destination": copy_task.destination,
+                                               "seconds": round(result.seconds, 3), "resumed": result.resumed}})
+            else:
+                logging.info(f"Verification failed for file '{file_name}'. Copy may not be successful.")
+            if result.ok and task.get("fingerprint") and self.catalog is not None:
+                try:
+                    self.catalog.record(task["fingerprint"], result.size, task.get("clip_id"), file_name,
+                                        copy_task.source, copy_task.destination)
+                except sqlite3.Error as e:
+                    logging.error(f"Could not record '{file_name}' in the ingest catalog: {e}")
+            for target, target_ok, target_error in result.targets:
+                if target_ok:
+                    logging.info(f"File '{file_name}' also written to '{target}'.")
+                else:
+                    failed_targets.append(target)
+                    logging.error(f"Writing '{file_name}' to '{target}' failed: "
+                                  f"{target_error if target_error is not None else 'verification failed'}")
+            processed_files += 1
+            completed_files += 1 if result.ok else 0
+            copied_bytes += result.size
+            self.metrics.observe_file(
+                kind, labels, file_name, result.size, result.seconds, ok=result.ok,
+                hash_seconds=result.hash_seconds, queue_wait=result.started - job_start,
+                mediainfo_seconds=task.get("mediainfo_seconds"))
+            emit("file", name=file_name, source=copy_task.source, destination=copy_task.destination,
+                 ok=result.ok, error=None if result.error is None else str(result.error), size=result.size,
+                 resumed=result.resumed, targets=[list(target) for target in result.targets])
+
+        def on_copy_progress(done_bytes):
+            emit("progress", files=processed_files, total_files=total_files,
+                 bytes=done_bytes, total_bytes=total_bytes)
+
+        try:
+            with self.rate_limit(settings.get("rate_limit_mbps", 0)) as bucket:
+                engine = CopyEngine(settings.get("workers", 2), settings.get("verify", "hash"),
+                                    block_size=settings.get("block_size", 1024 * 1024), span=span,
+                                    rate_limit=bucket, io_priority=settings.get("io_priority", "normal"),
+                                    buffer_count=settings.get("buffer_count", 8),
+                                    small_file_size=settings.get("small_file_kb", 0) * 1024,
+                                    small_file_workers=settings.get("small_file_workers", 8),
+                                    verify_read=settings.get("verify_read", "cached"))
+                engine.run(copy_tasks, on_copy_result, on_copy_progress)
+        finally:
+            for upload_target in upload_targets.values():
+                if upload_target is not None:
+                    upload_target.close()
+
+        seconds = time.perf_counter() - job_start
+        self.metrics.observe_job(kind, labels, completed_files, copied_bytes, seconds,
+                                 failed=total_files - completed_files)
+        return {"completed": completed_files, "failed": total_files - completed_files, "bytes": copied_bytes,
+                "seconds": seconds, "failed_targets": failed_targets, "error": None}
+
+    def run_upload_job(self, job, emit, span, preempt=None):
+        # Upload job["files"] ([path, remote name, is sidecar]) to job["directory"] on a server. Media files
+        # go over a pool of sessions; small files and sidecars go one after another over one more session,
+        # or packed into one archive (job["archive"]), so they do not cost a connection or a queue slot each.
+        # Deliveries pass a preempt event: once it is set, running uploads stop at the next block and no
+        # new ones start; the files in job["resume"] were cut off like that and are appended to on the server.
+        settings = job["settings"]
+        labels = job.get("labels", {})
+        server_address = job["server"]
+        protocol = settings["protocol"]
+        server, port, ftp_subfolder = parse_server_address(protocol, server_address)
+
+        def connect(protocol):
+            with span("connect"):
+                return connect_transport(protocol, server, port, job["username"], job["password"],
+                                         settings["block_size"], settings.get("detected_protocol"))
+
+        session = connect(protocol)
+        logging.info(f"Connected to {server} via {session.protocol.upper()}.")
+        if protocol == "auto" and self.credential_store is not None:
+            # Remember what worked, so the next upload does not repeat a failing TLS handshake
+            self.credential_store.remember_protocol(server_address, job["username"], session.protocol)
+
+        with span("mkdir"):
+            # Navigate to the server's subfolder if present, then make sure the job's folder exists
+            if ftp_subfolder:
+                session.ensure_directory(ftp_subfolder)
+            session.ensure_directory(job["directory"])
+            upload_directory = session.pwd()
+
+        small_file_size = settings.get("small_file_kb", 0) * 1024
+        uploads, small_uploads, archived = [], [], []
+        for file_to_upload, remote_name, *sidecar in job["files"]:
+            if sidecar and sidecar[0] and job.get("archive"):
+                archived.append((file_to_upload, remote_name))
+            elif (sidecar and sidecar[0]) or os.path.getsize(file_to_upload) <= small_file_size:
+                small_uploads.append((file_to_upload, remote_name))
+            else:
+                uploads.append((file_to_upload, remote_name))
+        total_files = len(uploads) + len(small_uploads) + len(archived)
+        total_bytes = sum(os.path.getsize(path) for path, *_ in job["files"])
+        uploaded_files = uploaded_bytes = failed_files = 0
+        progress_lock = threading.Lock()
+        job_start = time.perf_counter()
+        preempt = preempt or threading.Event()
+        resume = set(job.get("resume", ()))
+
+        # Extra connections for parallel uploads, opened on first use by each worker thread
+        sessions = [session]
+        thread_sessions = threading.local()
+
+        def worker_session():
+            if getattr(thread_sessions, "session", None) is None:
+                extra_session = connect(session.protocol)  # The protocol the first connection settled on
+                extra_session.cwd(upload_directory)
+                with progress_lock:
+                    sessions.append(extra_session)
+                thread_sessions.session = extra_session
+            return thread_sessions.session
+
+        def uploaded(file_to_upload, remote_name, file_size, file_start, destination=server_address):
+            nonlocal uploaded_files, uploaded_bytes
+            with progress_lock:
+                uploaded_files += 1
+                uploaded_bytes += file_size
+                done_files, done_bytes = uploaded_files, uploaded_bytes
+            self.metrics.observe_file("upload", labels, remote_name, file_size,
+                                      time.perf_counter() - file_start, queue_wait=file_start - job_start)
+            logging.info(f"Uploaded {remote_name} successfully.",
+                         extra={"fields": {"source": file_to_upload, "server": server, "bytes": file_size}})
+            emit("file", name=remote_name, source=file_to_upload, destination=destination,
+                 ok=True, error=None, size=file_size, resumed=False, targets=[])
+            emit("progress", files=done_files, total_files=total_files,
+                 bytes=done_bytes, total_bytes=total_bytes)
+
+        def upload_failed(file_to_upload, remote_name, file_start, error):
+            nonlocal failed_files
+            with progress_lock:
+                failed_files += 1
+            self.metrics.observe_file("upload", labels, remote_name, 0,
+                                      time.perf_counter() - file_start, ok=False)
+            logging.warning(f"Failed to upload {remote_name}: {error}")
+            emit("file", name=remote_name, source=file_to_upload, destination=server_address,
+                 ok=False, error=str(error), size=0, resumed=False, targets=[])
+
+        def upload(file_to_upload, remote_name, upload_session=None):
+            # Upload, then check size and checksum on the server; a file that does not match is uploaded again
+            if preempt.is_set():
+                return
+            file_start = time.perf_counter()
+            emit("started", name=remote_name, source=file_to_upload)
+            for attempt in range(verify_retries + 1):
+                try:
+                    upload_session = upload_session or worker_session()
+                    algorithm = upload_session.checksum_algorithm
+                    digest = new_digest(algorithm) if algorithm else None
+                    with span("upload"), open(file_to_upload, "rb") as file:
+                        # Continue a file that was cut off by preemption or a restart where the server left off
+                        offset = 0
+                        if attempt == 0 and remote_name in resume:
+                            remote_size = upload_session.remote_size(remote_name) or 0
+                            offset = remote_size if 0 < remote_size <= os.fstat(file.fileno()).st_size else 0
+                        while digest is not None and file.tell() < offset:
+                            digest.update(file.read(min(settings["block_size"], offset - file.tell())))
+                        file.seek(offset)
+                        reader = RateLimitedReader(PreemptibleReader(file, preempt), bucket)
+                        upload_session.upload(HashingReader(reader, digest) if digest else reader, remote_name,
+                                              append=offset > 0)
+                        file_size = file.tell()
+                    if offset:
+                        logging.info(f"Resumed {remote_name} at {offset} bytes.")
+                    with span("verify"):
+                        problem = upload_session.verify_upload(remote_name, file_size, digest)
+                except DeliveryPreempted:
+                    logging.info(f"Upload of {remote_name} preempted; it continues when the delivery resumes.")
+                    return
+                except Exception as e:
+                    upload_failed(file_to_upload, remote_name, file_start, e)
+                    return
+                if problem is None:
+                    uploaded(file_to_upload, remote_name, file_size, file_start)
+                    return
+                logging.warning(f"Verification of {remote_name} on {server} failed ({problem}); uploading it again.")
+            upload_failed(file_to_upload, remote_name, file_start, f"verification failed: {problem}")
+
+        def upload_archive(upload_session):
+            # Stream the sidecars into one tar file on the server (nothing is packed on disk), then verify it
+            file_start = time.perf_counter()
+            for attempt in range(verify_retries + 1):
+                try:
+                    algorithm = upload_session.checksum_algorithm
+                    with span("upload"):
+                        stream = HashingWriter(upload_session.open_upload(job["archive"]),
+                                               new_digest(algorithm) if algorithm else None)
+                        try:
+                            with tarfile.open(fileobj=stream, mode="w|") as archive:
+                                for file_to_upload, remote_name in archived:
+                                    with open(file_to_upload, "rb") as file:
+                                        archive.addfile(archive.gettarinfo(arcname=remote_name, fileobj=file),
+                                                        RateLimitedReader(PreemptibleReader(file, preempt), bucket))
+                        finally:
+                            stream.close()
+                    with span("verify"):
+                        problem = upload_session.verify_upload(job["archive"], stream.size, stream.digest)
+                except DeliveryPreempted:
+                    return  # Uploaded again as a whole when the delivery resumes
+                except Exception as e:
+                    problem = e
+                    break
+                if problem is None:
+                    for file_to_upload, remote_name in archived:
+                        uploaded(file_to_upload, remote_name, os.path.getsize(file_to_upload), file_start,
+                                 f"{server_address}/{job['archive']}")
+                    return
+                logging.warning(f"Verification of {job['archive']} on {server} failed ({problem}); uploading it again.")
+            for file_to_upload, remote_name in archived:
+                upload_failed(file_to_upload, remote_name, file_start, problem)
+
+        def upload_small_files(upload_session=None):
+            # One session for all small files: each costs a few round trips instead of a connection
+            try:
+                upload_session = upload_session or worker_session()
+            except Exception as e:
+                for file_to_upload, remote_name in small_uploads + archived:
+                    upload_failed(file_to_upload, remote_name, time.perf_counter(), e)
+                return
+            if archived and not preempt.is_set():
+                upload_archive(upload_session)
+            for file_to_upload, remote_name in small_uploads:
+                upload(file_to_upload, remote_name, upload_session)
+
+        pool_size = max(1, min(settings["pool_size"], len(uploads)))
+        io_priority = settings.get("io_priority", "normal")
+        verify_retries = settings.get("verify_retries", 2)
+
+        def at_io_priority(function, *args):
+            with thread_io_priority(io_priority):
+                return function(*args)
+
+        try:
+            with self.rate_limit(settings.get("rate_limit_mbps", 0)) as bucket:
+                with ThreadPoolExecutor(max_workers=pool_size + 1, thread_name_prefix="ftp-upload") as executor:
+                    if small_uploads or archived:
+                        # Alongside the media uploads on an extra session, or on the first session if there are none
+                        executor.submit(at_io_priority, upload_small_files, None if uploads else session)
+                    if pool_size > 1:
+                        list(executor.map(lambda item: at_io_priority(upload, *item), uploads))
+                    else:
+                        executor.submit(at_io_priority, lambda: [upload(*item, session) for item in uploads]).result()
+        finally:
+            for open_session in sessions:
+                try:
+                    open_session.close()
+                except Exception as e:
+                    logging.warning(f"Error closing {open_session.protocol.upper()} session: {e}")
+
+        seconds = time.perf_counter() - job_start
+        self.metrics.observe_job("upload", labels, uploaded_files, uploaded_bytes, seconds, failed=failed_files)
+        return {"completed": uploaded_files, "failed": failed_files, "bytes": uploaded_bytes,
+                "seconds": seconds, "failed_targets": [], "error": None, "preempted": preempt.is_set()}
+
+
+def parse_worker_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback_host(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def worker_token_path(config_path="config.json"):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), "worker.key")
+
+
+def load_worker_token(path):
+    # Shared secret of the worker API (beside config.json), created on first use and readable by this user only
+    try:
+        with open(path, "r") as token_file:
+            return token_file.read().strip()
+    except FileNotFoundError:
+        pass
+    token = secrets.token_hex(32)
+    try:
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as token_file:
+            token_file.write(token)
+    except FileExistsError:  # Created by the worker or another client in the meantime
+        with open(path, "r") as token_file:
+            return token_file.read().strip()
+    return token
+
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    """One client connection to the worker: JSON requests in, JSON events out, one object per line."""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.send_lock = threading.Lock()
+        self.connected = True
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = request["method"]
+                token = request.get("token")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.send({"event": "error", "error": "invalid request"})
+                continue
+            if not isinstance(token, str) or not hmac.compare_digest(token, self.server.token):
+                logging.warning(f"Worker request from {self.client_address[0]} refused: wrong or missing token.")
+                self.send({"event": "error", "error": "not authorized"})
+                return
+            if method == "run":
+                # The job keeps running when the client goes away; its events are then dropped
+                service.run(request["job"], self.send)
+            elif method == "deliver":
+                try:
+                    service.deliver(request["job"], self.send)
+                except ValueError as e:
+                    self.send({"event": "error", "error": str(e)})
+            elif method == "status":
+                self.send({"event": "status", "jobs": service.status(), "deliveries": service.deliveries.status()})
+            elif method == "throttle":
+                service.set_throttle(request.get("client"), request.get("rate_mbps", 0))
+                self.send({"event": "ok"})
+            else:
+                self.send({"event": "error", "error": f"unknown method '{method}'"})
+
+    def send(self, message):
+        with self.send_lock:
+            if not self.connected:
+                return
+            try:
+                self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+            except OSError:
+                self.connected = False
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """The worker's local socket API in front of an IngestService (python Filemover.py --worker).
+
+    Only listens on a loopback address, and every request must carry the shared token (worker.key).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service, token):
+        if not is_loopback_host(address[0]):
+            raise ValueError(f"the worker only listens on a loopback address, not {address[0]}")
+        self.service = service
+        self.token = token
+        super().__init__(address, WorkerHandler)
+
+
+class WorkerClient:
+    """Client side of the worker API; run() blocks like IngestService.run() while the worker does the job."""
+
+    def __init__(self, address, client_id=None, timeout=5, token=None):
+        self.address = parse_worker_address(address)
+        self.client_id = client_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.timeout = timeout
+        self.token = token or load_worker_token(worker_token_path())
+
+    def connect(self):
+        connection = socket.create_connection(self.address, timeout=self.timeout)
+        connection.settimeout(None)  # Jobs can run for hours
+        return connection
+
+    def request(self, message, connection=None):
+        # Send one request; yields the events the worker answers with
+        with contextlib.closing(connection or self.connect()) as connection:
+            connection.sendall(json.dumps(dict(message, token=self.token)).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as lines:
+                for line in lines:
+                    yield json.loads(line)
+
+    def run(self, job, on_event=None, span=None, method="run"):
+        connection = self.connect()  # Raises OSError before anything was submitted when the worker is down
+        for event in self.request({"method": method, "job": job}, connection):
+            if event["event"] == "error" and event["error"] == "not authorized":
+                raise PermissionError(f"worker refused the job: {event['error']} (check worker.key)")
+            if event["event"] == "error":
+                raise ValueError(event["error"])
+            if on_event is not None:
+                on_event(event)
+            if event["event"] == "done":
+                return event
+        raise ConnectionError("connection to the worker lost; the job continues in the worker")
+
+    def deliver(self, job, on_event=None, span=None):
+        return self.run(job, on_event, span, method="deliver")
+
+    def call(self, message):
+        reply = next(self.request(message))
+        if reply["event"] == "error":
+            raise PermissionError(reply["error"]) if reply["error"] == "not authorized" else ValueError(reply["error"])
+        return reply
+
+    def status(self):
+        return self.call({"method": "status"})["jobs"]
+
+    def deliveries(self):
+        return self.call({"method": "status"})["deliveries"]
+
+    def set_throttle(self, client, rate_mbps):
+        self.call({"method": "throttle", "client": client, "rate_mbps": rate_mbps})
+
+
+def run_worker(config_path="config.json"):
+    # Worker process: owns the transfer jobs of every GUI (and CLI) that is configured with its address
+    with open(config_path, "r") as config_file:
+        config = json.load(config_file)
+    errors = validate_config(config)
+    if errors:
+        raise SystemExit("Invalid configuration:\n" + "\n".join(errors))
+
+    log_folder = "logs"
+    os.makedirs(log_folder, exist_ok=True)
+    handler = TimedRotatingFileHandler(os.path.join(log_folder, "worker.log"), when="midnight", backupCount=14,
+                                       encoding="utf-8")
+    handler.setFormatter(StructuredFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().addHandler(logging.StreamHandler())
+    logging.getLogger().setLevel(logging.INFO)
+
+    ftp_config_folder = os.path.join(os.getcwd(), "ftpConfig")
+    os.makedirs(ftp_config_folder, exist_ok=True)
+    catalog = IngestCatalog(config.get("catalog_path", "catalog.sqlite")) if config.get("enable_catalog", True) else None
+    metrics = MetricsRegistry(os.path.join(log_folder, "worker_metrics.jsonl")
+                              if config.get("metrics_jsonl", True) else None)
+    service = IngestService(metrics, catalog,
+                            CredentialStore(os.path.join(ftp_config_folder, "ftp_credentials.json"),
+                                            os.path.join(ftp_config_folder, "secret.key")),
+                            config.get("worker_jobs_per_device", 1),
+                            os.path.join(ftp_config_folder, "delivery_queue.json"))
+
+    address = config.get("worker_address") or "127.0.0.1:8765"
+    with WorkerServer(parse_worker_address(address), service, load_worker_token(worker_token_path(config_path))) as server:
+        logging.info(f"Worker listening on {address}.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("Worker stopped.")
+        finally:
+            metrics.close()
+            if catalog is not None:
+                catalog.close()
+
 
 class FileCopyApp:
-    def __init__(self, root):
+    def __init__(self, root, profiling_mode=None):
         self.root = root
         self.root.title("FileMover")  
 
@@ -40,7 +3178,8 @@ class FileCopyApp:
         self.ftp_credentials_path = os.path.join(self.ftp_config_folder, 'ftp_credentials.json')
         self.secret_key_path = os.path.join(self.ftp_config_folder, 'secret.key') 
 
-        self.load_configuration()  # Assuming this method or similar ones will use the updated paths               
+        self.config_path = "config.json"
+        self.load_configuration()
 
         # Configure logging
         log_folder = "logs"  # Change this to the desired folder for log files
@@ -48,33 +3187,72 @@ class FileCopyApp:
         if not os.path.exists(log_folder):
             os.makedirs(log_folder)
 
+        self.log_folder = log_folder
+
         log_file = os.path.join(log_folder, "file_copy_app.log")
         
         # Use a different file name pattern for rotation, including date placeholders
         handler = TimedRotatingFileHandler(log_file, when="midnight", interval=1, backupCount=0, encoding='utf-8', atTime=datetime.time(0, 0, 0))
         handler.suffix = "%Y-%m-%d.log"
         
-        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logging.getLogger().addHandler(handler)
+        handler.setFormatter(StructuredFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+        # Records go through a queue; a background listener writes them, so file operations
+        # never wait on a slow (network) log folder
+        self.log_file_handler = handler
+        self.log_queue_handler = QueueHandler(queue.SimpleQueue())
+        self.log_listener = QueueListener(self.log_queue_handler.queue, handler, respect_handler_level=True)
+        self.log_listener.start()
+        logging.getLogger().addHandler(self.log_queue_handler)
         logging.getLogger().setLevel(logging.INFO)
 
-        # Cleanup logs older than 14 days
-        self.cleanup_old_logs(log_folder, days=14)
+        # Cleanup logs older than 14 days in the background
+        threading.Thread(target=self.cleanup_old_logs, args=(log_folder,), kwargs={"days": 14}, daemon=True).start()
 
         logging.info("GUI opened.") 
 
-        # Load configuration from the file
-        self.load_configuration()
+        # Profiling mode: the command line overrides the configuration
+        self.profiling_cli_mode = profiling_mode
+        self.set_profiling_mode(profiling_mode or self.config.get("profiling"))
+        self.job_profiles = threading.local()  # The JobProfiler of the job running on each thread
+
+        # Structured transfer metrics, written as JSON lines and optionally served over HTTP
+        metrics_port = self.config.get("metrics_port")
+        self.metrics = MetricsRegistry(os.path.join(log_folder, "metrics.jsonl") if self.config.get("metrics_jsonl", True) else None)
+        if metrics_port:
+            try:
+                self.metrics.start_http_server(metrics_port)
+            except OSError as e:
+                logging.error(f"Could not start the metrics endpoint on port {metrics_port}: {e}")
+
+        # Catalog of earlier ingests, used to flag and skip clips that were already copied
+        self.catalog = None
+        if self.config.get("enable_catalog", True):
+            try:
+                self.catalog = IngestCatalog(self.config.get("catalog_path", "catalog.sqlite"))
+            except sqlite3.Error as e:
+                logging.error(f"Could not open the ingest catalog: {e}")
+        self.ingested_ids = set()  # Row ids of listed items that are all in the catalog
 
         sv_ttk.set_theme(self.theme)
 
-        # Custom location if enabled
-        if self.enable_custom_export:
-            self.root.bind('<Control-e>', self.copy_to_custom_location)
+        # Custom location and FTP upload shortcuts if enabled
+        self.bind_optional_shortcuts()
 
-        # FTP upload if enabled
-        if self.enable_ftp_export:
-            self.root.bind('<Control-f>', self.open_ftp_upload_window)   
+        # Reload config.json on Ctrl+R and when the file changes
+        self.root.bind('<Control-r>', self.reload_configuration)
+        if self.config_reload_interval_ms:
+            self.root.after(self.config_reload_interval_ms, self.watch_configuration)
+
+        # Thumbnail view if enabled
+        if self.enable_thumbnail_view:
+            self.thumbnail_cache = ThumbnailCache(os.path.join(os.getcwd(), 'thumbnails'),
+                                                  max_bytes=self.thumbnail_cache_size_mb * 1024 * 1024,
+                                                  width=self.thumbnail_width,
+                                                  max_workers=self.thumbnail_workers,
+                                                  ffmpeg_path=self.ffmpeg_path)
+            self.thumbnail_window = None
+            self.root.bind('<Control-t>', self.open_thumbnail_window)
 
         # Bind the F5 key to refresh the listbox
         self.root.bind('<F5>', self.update_file_listbox)    
@@ -139,8 +3317,11 @@ class FileCopyApp:
 
         self.destination_dropdown.bind("<FocusIn>", lambda event: event.widget.selection_clear())
 
-        # Listbox to display files
-        self.file_listbox = Listbox(root, selectmode="extended", exportselection=False, font=("Helvetica", 11))
+        # Virtualized list to display files; rows are keyed by FileEntry.id
+        self.file_entries = {}  # FileEntry.id -> FileEntry for every scanned file
+        self.file_items = {}  # Row id -> FileEntry or ClipGroup, in display order
+        self.scan_generation = 0
+        self.file_listbox = VirtualFileList(root, font=("Helvetica", 11), colors=self.file_list_colors())
         self.file_listbox.grid(row=3, column=0, rowspan=6, columnspan=2, padx=7, pady=55, sticky="nsew")
 
         # Play button
@@ -189,6 +3370,11 @@ class FileCopyApp:
         # Create VLC media player instance with native interface
         self.instance = vlc.Instance("--no-xlib")
         self.player = self.instance.media_player_new()
+
+        # Preview loading state: pending debounce timer, load generation and in-flight flag
+        self.preview_after_id = None
+        self.preview_generation = 0
+        self.preview_loading = False
         
         # Bind the listbox selection event to load_media
         self.file_listbox.bind("<<ListboxSelect>>", lambda event: self.load_media())
@@ -220,10 +3406,25 @@ class FileCopyApp:
         root.grid_columnconfigure(0, weight=0, uniform="group1")
         root.grid_columnconfigure(2, weight=6, uniform="group1")
 
-        # Update duration and current time labels periodically
-        self.update_time_labels()
-
-        self.key = self.load_key()
+        # A single UI tick refreshes the player labels, scrub bar and copy progress while needed
+        self.ui_tick_after_id = None
+        self.ui_tick_interval_ms = 100
+        self.copy_progress = None  # (completed, total, label) published by transfer threads
+        self.preview_playing = False
+        self.schedule_ui_tick()
+
+        self.credential_store = CredentialStore(self.ftp_credentials_path, self.secret_key_path)
+
+        # Copy, export and upload jobs run on the in-process transfer service, or on the worker
+        # process (python Filemover.py --worker) when "worker_address" is configured. The worker then
+        # keeps the delivery queue; here it is kept only when there is no worker. Both are only read here,
+        # so a changed worker_address takes effect after a restart.
+        self.worker_address = self.config.get("worker_address")
+        self.service = IngestService(self.metrics, self.catalog, self.credential_store,
+                                     self.config.get("worker_jobs_per_device", 1),
+                                     None if self.worker_address else os.path.join(self.ftp_config_folder,
+                                                                                   "delivery_queue.json"))
+        self.worker_client_id = f"{socket.gethostname()}:{os.getpid()}"
 
         # Splash screen handling with logging
         try:
@@ -238,64 +3439,42 @@ class FileCopyApp:
 
 
     def cleanup_old_logs(self, log_folder, days=14):
-        cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days)
-        for filename in os.listdir(log_folder):
-            file_path = os.path.join(log_folder, filename)
-            if os.path.isfile(file_path):
-                file_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                if file_time < cutoff_date:
-                    try:
-                        os.remove(file_path)
-                        logging.info(f"Deleted old log file: {filename}")
-                    except Exception as e:
-                        logging.error(f"Error deleting file {filename}: {e}")
-
-    def generate_key(self):
-        # Generate a new encryption key and save it to a file.
-        key = Fernet.generate_key()
-        with open(self.secret_key_path, "wb") as key_file:
-            key_file.write(key)
-        return key
-
-    def load_key(self):
-        # Load the encryption key from a file, generating a new one if it doesn't exist.
+        cutoff_timestamp = (datetime.datetime.now() - datetime.timedelta(days=days)).timestamp()
         try:
-            return open(self.secret_key_path, "rb").read()
-        except FileNotFoundError:
-            # Generate the key if it does not exist
-            return self.generate_key()
-
-    def encrypt_password(self, password):
-        # Encrypt a password using the loaded key.
-        f = Fernet(self.key)
-        encrypted_password = f.encrypt(password.encode())
-        return encrypted_password.decode()
+            with os.scandir(log_folder) as it:
+                old_files = [entry for entry in it if entry.is_file() and entry.stat().st_mtime < cutoff_timestamp]
+        except OSError as e:
+            logging.error(f"Error listing log folder {log_folder}: {e}")
+            return
+        for entry in old_files:
+            try:
+                os.remove(entry.path)
+                logging.info(f"Deleted old log file: {entry.name}")
+            except Exception as e:
+                logging.error(f"Error deleting file {entry.name}: {e}")
 
-    def decrypt_password(self, encrypted_password):
-        # Decrypt an encrypted password using the loaded key.
-        f = Fernet(self.key)
-        decrypted_password = f.decrypt(encrypted_password.encode())
-        return decrypted_password.decode()    
+    def stop_logging(self):
+        # Flush queued records, then log synchronously for whatever is logged during shutdown
+        self.log_listener.stop()
+        logging.getLogger().removeHandler(self.log_queue_handler)
+        logging.getLogger().addHandler(self.log_file_handler)
 
     def save_ftp_credentials(self):
-        new_credential = {
-            'server': self.ftp_server_var.get(),
-            'username': self.ftp_username_var.get(),
-            'password': self.encrypt_password(self.ftp_password_var.get())
-        }
         try:
-            with open(self.ftp_credentials_path, 'r') as f:
-                credentials_list = json.load(f)  # Load existing data
-        except (FileNotFoundError, json.JSONDecodeError):
-            credentials_list = []  # Initialize if not found or empty
-
-        credentials_list.append(new_credential)  # Append new credentials
-
-        with open(self.ftp_credentials_path, 'w') as f:
-            json.dump(credentials_list, f)  # Save the list back to file
+            pool_size = int(self.ftp_pool_size_var.get())
+        except ValueError:
+            pool_size = None
+        try:
+            index = self.credential_store.put(self.ftp_server_var.get(), self.ftp_username_var.get(),
+                                              self.ftp_password_var.get(), pool_size=pool_size,
+                                              protocol=self.ftp_protocol_var.get())
+        except OSError as e:
+            messagebox.showerror("Fout", f"Kan de FTP-inloggegevens niet opslaan: {e}")
+            return
 
         messagebox.showinfo("Opslaan succesvol", "FTP-inloggegevens zijn succesvol opgeslagen.")
         self.load_ftp_credentials()  # Refresh credentials list in the combobox
+        self.ftp_creds_combobox.current(index)
 
     def open_ftp_upload_window(self, event=None):
         # Check if the subfolder entry is empty
@@ -303,8 +3482,7 @@ class FileCopyApp:
         if not subfolder_name:
             messagebox.showwarning("Lege Subfolder Naam", "Voer een naam in voordat u uploadt.")
             return  # Cancel the upload process        
-        selected_indices = self.file_listbox.curselection()
-        if not selected_indices:
+        if not self.file_listbox.selection():
             messagebox.showwarning("Fout", "Selecteer ten minste één bestand om te uploaden.")
             return        
         self.ftp_window = tk.Toplevel(self.root)
@@ -320,7 +3498,7 @@ class FileCopyApp:
 
         # Calculate window size as a percentage of screen size
         window_width = max(400, int(screen_width * 0.2))  # 50% of the screen width
-        window_height = max(300, int(screen_height * 0.25))  # 50% of the screen height
+        window_height = max(460, int(screen_height * 0.36))  # 50% of the screen height
 
         # Set the position (center the window)
         x_position = int((screen_width - window_width) / 2)
@@ -336,12 +3514,15 @@ class FileCopyApp:
         self.ftp_window.grid_rowconfigure(3, weight=1)
         self.ftp_window.grid_rowconfigure(4, weight=1)
         self.ftp_window.grid_rowconfigure(5, weight=1)
+        self.ftp_window.grid_rowconfigure(6, weight=1)
+        self.ftp_window.grid_rowconfigure(7, weight=1)
+        self.ftp_window.grid_rowconfigure(8, weight=1)
         self.ftp_window.grid_columnconfigure(0, weight=1)
         self.ftp_window.grid_columnconfigure(1, weight=1)        
 
         # Create a Combobox for saved FTP credentials
         ttk.Label(self.ftp_window, text="Opgeslagen inloggegevens:").grid(row=0, column=0, padx=5, sticky="w")
-        self.ftp_creds_combobox = ttk.Combobox(self.ftp_window, state="readonly", postcommand=self.load_ftp_credentials, style='TCombobox')
+        self.ftp_creds_combobox = ttk.Combobox(self.ftp_window, state="readonly", style='TCombobox')
         self.ftp_creds_combobox.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
         self.load_ftp_credentials()  # Load credentials to populate the combobox initially
 
@@ -360,14 +3541,36 @@ class FileCopyApp:
         self.ftp_password_var = tk.StringVar()
         ttk.Entry(self.ftp_window, textvariable=self.ftp_password_var, show="*").grid(row=3, column=1, padx=10, pady=10, sticky="ew")
 
-        ttk.Button(self.ftp_window, text="Uploaden  ", image=self.upload_icon, compound='right', command=self.upload_file_to_ftp, style="Accent.TButton").grid(row=4, column=1, padx=10, sticky="e")
+        # Protocol: "auto" tries FTPS and then FTP (remembering what worked); "local" delivers into a folder
+        ttk.Label(self.ftp_window, text="Protocol:").grid(row=4, column=0, padx=5, sticky="w")
+        self.ftp_protocol_var = tk.StringVar(value=CredentialStore.DEFAULT_SETTINGS["protocol"])
+        ttk.Combobox(self.ftp_window, textvariable=self.ftp_protocol_var, state="readonly", width=8,
+                     values=["auto"] + list(TRANSPORTS)).grid(row=4, column=1, padx=10, pady=10, sticky="w")
+
+        ttk.Label(self.ftp_window, text="Gelijktijdige uploads:").grid(row=5, column=0, padx=5, sticky="w")
+        self.ftp_pool_size_var = tk.StringVar(value=str(CredentialStore.DEFAULT_SETTINGS["pool_size"]))
+        ttk.Spinbox(self.ftp_window, from_=1, to=8, width=5, textvariable=self.ftp_pool_size_var).grid(row=5, column=1, padx=10, pady=10, sticky="w")
+
+        # Urgent uploads go before (and interrupt) the others; a window like 22:00-06:00 holds an upload until then
+        ttk.Label(self.ftp_window, text="Prioriteit:").grid(row=6, column=0, padx=5, sticky="w")
+        self.ftp_priority_var = tk.StringVar(value=self.DELIVERY_PRIORITY_LABELS["normal"])
+        priority_combobox = ttk.Combobox(self.ftp_window, textvariable=self.ftp_priority_var, state="readonly", width=8,
+                                         values=list(self.DELIVERY_PRIORITY_LABELS.values()))
+        priority_combobox.grid(row=6, column=1, padx=10, pady=10, sticky="w")
+        priority_combobox.bind("<<ComboboxSelected>>", self.on_ftp_priority_selected)
+
+        ttk.Label(self.ftp_window, text="Verzendvenster:").grid(row=7, column=0, padx=5, sticky="w")
+        self.ftp_delivery_window_var = tk.StringVar(value=self.delivery_windows.get("normal") or "")
+        ttk.Entry(self.ftp_window, textvariable=self.ftp_delivery_window_var, width=14).grid(row=7, column=1, padx=10, pady=10, sticky="w")
+
+        ttk.Button(self.ftp_window, text="Uploaden  ", image=self.upload_icon, compound='right', command=self.upload_file_to_ftp, style="Accent.TButton").grid(row=8, column=1, padx=10, sticky="e")
 
         # Bind the Enter key to the upload_file_to_ftp function
         self.ftp_window.bind('<Return>', self.handle_ftp_upload_shortcut)      
 
         # Frame for buttons
         buttons_frame = ttk.Frame(self.ftp_window)
-        buttons_frame.grid(row=4, column=0, columnspan=2, sticky="w")
+        buttons_frame.grid(row=8, column=0, columnspan=2, sticky="w")
 
         # Save and Delete Buttons within the frame
         ttk.Button(buttons_frame, image=self.save_icon, command=self.save_ftp_credentials, style="Accent.TButton").grid(row=0, column=0, padx=5, pady=10, sticky="w")
@@ -381,38 +3584,47 @@ class FileCopyApp:
 
         self.ftp_window.resizable(False, False)
 
+    DELIVERY_PRIORITY_LABELS = {"urgent": "Spoed", "normal": "Normaal", "bulk": "Bulk"}
+
+    def selected_delivery_priority(self):
+        labels = {label: priority for priority, label in self.DELIVERY_PRIORITY_LABELS.items()}
+        return labels.get(self.ftp_priority_var.get(), "normal")
+
+    def on_ftp_priority_selected(self, event=None):
+        # Fill in the configured window of the priority (delivery_windows); it can still be changed
+        self.ftp_delivery_window_var.set(self.delivery_windows.get(self.selected_delivery_priority()) or "")
+
     def handle_ftp_upload_shortcut(self, event=None):
         # Ensure all necessary fields have values before triggering the upload
-        if self.ftp_server_var.get() and self.ftp_username_var.get() and self.ftp_password_var.get():
+        # A local delivery folder needs no login
+        if self.ftp_server_var.get() and (self.ftp_protocol_var.get() == "local" or
+                                          (self.ftp_username_var.get() and self.ftp_password_var.get())):
             self.upload_file_to_ftp()
         else:
             messagebox.showwarning("Incompleet formulier", "Vul alle velden in voordat u uploadt.")
 
     def load_ftp_credentials(self):
-        try:
-            with open(self.ftp_credentials_path, 'r') as f:
-                credentials_list = json.load(f)
-            self.ftp_creds_combobox['values'] = [f"{cred['username']}@{cred['server']}" for cred in credentials_list]
-            if not credentials_list:  # Clear entries if no credentials are left
-                self.ftp_server_var.set("")
-                self.ftp_username_var.set("")
-                self.ftp_password_var.set("")
-        except FileNotFoundError:
-            self.ftp_creds_combobox['values'] = []  # Ensure the dropdown is cleared if file not found
+        labels = self.credential_store.labels()
+        self.ftp_creds_combobox['values'] = labels
+        if not labels:  # Clear entries if no credentials are left
+            self.ftp_server_var.set("")
+            self.ftp_username_var.set("")
+            self.ftp_password_var.set("")
 
     def on_ftp_creds_selected(self, event=None):
         selected_index = self.ftp_creds_combobox.current()
         if selected_index == -1:
             return
         try:
-            with open(self.ftp_credentials_path, 'r') as f:
-                credentials_list = json.load(f)
-            credential = credentials_list[selected_index]  # Access list by index, not a string
-            self.ftp_server_var.set(credential['server'])
-            self.ftp_username_var.set(credential['username'])
-            self.ftp_password_var.set(self.decrypt_password(credential['password']))
-        except (FileNotFoundError, IndexError):
+            credential = self.credential_store.get(selected_index)
+        except (IndexError, InvalidToken):
             messagebox.showerror("Fout", "Kan de geselecteerde inloggegevens niet laden.")
+            return
+        self.ftp_server_var.set(credential['server'])
+        self.ftp_username_var.set(credential['username'])
+        self.ftp_password_var.set(credential['password'])
+        self.ftp_pool_size_var.set(str(credential['pool_size']))
+        self.ftp_protocol_var.set(credential['protocol'])
 
     def delete_selected_credential(self):
         selected_index = self.ftp_creds_combobox.current()
@@ -421,20 +3633,14 @@ class FileCopyApp:
             return
 
         try:
-            with open(self.ftp_credentials_path, 'r') as f:
-                credentials_list = json.load(f)
-
-            # Remove selected credential
-            credentials_list.pop(selected_index)
-
-            # Save the updated list back to the file
-            with open(self.ftp_credentials_path, 'w') as f:
-                json.dump(credentials_list, f)
-
-            messagebox.showinfo("Inloggegevens verwijderen", "Geselecteerde inloggegevens zijn succesvol verwijderd.")
-            self.load_ftp_credentials()  # Refresh the credentials list in the combobox
-        except (FileNotFoundError, IndexError, json.JSONDecodeError) as e:
+            self.credential_store.remove(selected_index)
+        except (IndexError, OSError) as e:
             messagebox.showerror("Fout", "Kan de geselecteerde inloggegevens niet verwijderen: " + str(e))
+            return
+
+        messagebox.showinfo("Inloggegevens verwijderen", "Geselecteerde inloggegevens zijn succesvol verwijderd.")
+        self.ftp_creds_combobox.set("")
+        self.load_ftp_credentials()  # Refresh the credentials list in the combobox
 
     def upload_file_to_ftp(self):
         # Check if the subfolder entry is empty
@@ -442,19 +3648,42 @@ class FileCopyApp:
         if not subfolder_name:
             messagebox.showwarning("Lege Subfolder Naam", "Voer een naam in voordat u uploadt.")
             return  # Cancel the upload process        
-        selected_indices = self.file_listbox.curselection()
-        if not selected_indices:
+        selected_items = self.get_selected_items()
+        if not selected_items:
             messagebox.showerror("Fout", "Selecteer ten minste één bestand om te uploaden.")
             return
 
-        # Collect all files to be uploaded
-        files_to_upload = [self.source_folder_paths_and_names[i][0] for i in selected_indices]
+        # Collect all files to be uploaded (every chapter of a spanned clip, and their sidecars) as
+        # (path, name, is sidecar), named like the copy so the server and the project folder match
+        files_to_upload = [file for item in selected_items for entry in item.entries
+                           for file in [(entry.path, entry.display_name, False)] +
+                           [(sidecar.path, sidecar_name(sidecar, entry), True) for sidecar in entry.sidecars]]
 
-        # Start the upload process in a single thread
-        threading.Thread(target=self.perform_ftp_upload, args=(files_to_upload,), daemon=True).start()
+        # Transfer settings of the stored credential; the pool size and protocol in the dialog take precedence
+        transfer_settings = self.credential_store.settings(self.ftp_server_var.get(), self.ftp_username_var.get())
+        try:
+            transfer_settings["pool_size"] = max(1, int(self.ftp_pool_size_var.get()))
+        except ValueError:
+            pass
+        transfer_settings["protocol"] = self.ftp_protocol_var.get()
 
-    def perform_ftp_upload(self, files_to_upload):
+        delivery_window = self.ftp_delivery_window_var.get().strip() or None
+        if delivery_window:
+            try:
+                parse_delivery_window(delivery_window)
+            except ValueError:
+                messagebox.showwarning("Ongeldig verzendvenster", "Geef het verzendvenster op als uu:mm-uu:mm "
+                                                                  "(bijvoorbeeld 22:00-06:00) of laat het leeg.")
+                return
+
+        # Start the upload process in a background thread
+        threading.Thread(target=self.run_profiled, args=("upload", self.perform_ftp_upload, files_to_upload, transfer_settings,
+                                                         self.selected_delivery_priority(), delivery_window), daemon=True).start()
+
+    def perform_ftp_upload(self, files_to_upload, transfer_settings=None, priority="normal", delivery_window=None):
         """Perform the FTP upload with support for nested subfolders."""
+        transfer_settings = transfer_settings or dict(CredentialStore.DEFAULT_SETTINGS)
+
         # Fetch the subfolder name from the user input
         subfolder_name = self.subfolder_entry_var.get().strip()
 
@@ -471,74 +3700,37 @@ class FileCopyApp:
         # Combine the date prefix with the subfolder name
         full_subfolder_name = f"{date_prefix}_{subfolder_name}"
 
-        # Split the server address to handle subfolders
-        server_address = self.ftp_server_var.get()
-        server, *subfolder = server_address.split('/', 1)
-        ftp_subfolder = subfolder[0] if subfolder else ''
+        uploads = [list(file) for file in files_to_upload]
 
-        def ensure_directory_exists(session, directory_path):
-            # Ensure that a directory exists on the FTP server, create if not
-            directories = directory_path.split('/')
-            for directory in directories:
-                try:
-                    session.cwd(directory)
-                except ftplib.error_perm:
-                    session.mkd(directory)
-                    session.cwd(directory)
+        server_address = self.ftp_server_var.get()
+        job = {"kind": "upload", "server": server_address,
+               "username": self.ftp_username_var.get(), "password": self.ftp_password_var.get(),
+               "settings": dict(transfer_settings, rate_limit_mbps=self.upload_rate_limit_mbps,
+                                io_priority=self.transfer_io_priority, small_file_kb=self.small_file_kb,
+                                verify_retries=self.upload_verify_retries),
+               "directory": full_subfolder_name, "files": uploads,
+               "archive": f"{full_subfolder_name}_sidecars.tar" if self.sidecar_archive else None,
+               "priority": priority, "window": delivery_window,
+               "labels": {"source": self.selected_source_folder.get(),
+                          "destination": parse_server_address(transfer_settings["protocol"], server_address)[0]}}
+
+        def on_upload_event(event):
+            if event["event"] == "progress":
+                self.set_copy_progress(event["files"], event["total_files"])
+            elif event["event"] == "queued" and event["window"] and not delivery_window_open(event["window"]):
+                # Waiting for its window; the upload is kept in the delivery queue, also across restarts
+                self.root.after(0, lambda: messagebox.showinfo(
+                    "Upload ingepland", f"De upload naar {server_address} wordt verzonden tussen {event['window']}."))
 
         try:
-            # Attempt to connect to FTP or FTPS
-            session = ftplib.FTP_TLS(server, self.ftp_username_var.get(), self.ftp_password_var.get())
-            session.set_pasv(True)  # Set passive mode
-            logging.info("Connected via FTPS.")
-        except Exception as e:
-            logging.info(f"FTPS connection failed: {e}. Trying regular FTP...")
-            try:
-                session = ftplib.FTP(server, self.ftp_username_var.get(), self.ftp_password_var.get())
-                session.set_pasv(True)  # Set passive mode
-            except Exception as e:
-                messagebox.showerror("FTP-upload mislukt", f"Kan geen verbinding maken via FTPS of FTP: {str(e)}")
-                return
-
-        # Navigate to the specified subfolder if present
-        if ftp_subfolder:
-            ensure_directory_exists(session, ftp_subfolder)
-
-        # Ensure the full subfolder exists
-        ensure_directory_exists(session, full_subfolder_name)
-
-        # Dictionary to keep track of file names and their counts
-        file_name_counts = {}
-
-        total_files = len(files_to_upload)
-        uploaded_files = 0
-
-        for file_to_upload in files_to_upload:
-            file_name = os.path.basename(file_to_upload)
-            creation_time = os.path.getctime(file_to_upload)
-
-            if file_name in file_name_counts:
-                file_name_counts[file_name] += 1
-                base_name, ext = os.path.splitext(file_name)
-                new_file_name = f"{base_name}_{file_name_counts[file_name]}{ext}"
-            else:
-                file_name_counts[file_name] = 1
-                new_file_name = file_name
-
-            try:
-                with open(file_to_upload, 'rb') as file:
-                    session.storbinary(f"STOR {new_file_name}", file)
-                uploaded_files += 1
-                logging.info(f"Uploaded {new_file_name} successfully.")
-                # Update progress on the GUI thread after each file upload
-                progress = (uploaded_files / total_files) * 100
-                self.root.after(0, self.progress_var.set, progress)
-            except Exception as e:
-                logging.warning(f"Failed to upload {new_file_name}: {e}")
-
-        # Reset directory to home or another specified baseline if necessary
-        session.cwd('/')
-        session.quit()
+            done = self.run_transfer_job(job, on_upload_event, method="deliver")
+        except (OSError, ValueError) as e:
+            logging.error(f"Upload job: {e}")
+            done = {"error": str(e)}
+        if done["error"] is not None:
+            self.root.after(0, self.reset_progress)
+            messagebox.showerror("FTP-upload mislukt", f"Upload naar {server_address} mislukt: {done['error']}")
+            return
 
         # Set the date picker to today's date
         current_date = datetime.datetime.now().strftime("%d-%m-%Y")
@@ -554,6 +3746,7 @@ class FileCopyApp:
         self.progress_var.set(progress)
 
     def reset_progress(self):
+        self.copy_progress = None
         self.progress_var.set(0) 
 
     def set_min_size_by_percentage(self, width_percent, height_percent):
@@ -565,8 +3758,8 @@ class FileCopyApp:
         self.root.minsize(min_width, min_height)                 
 
     def copy_to_custom_location(self, event=None):
-        selected_indices = self.file_listbox.curselection()
-        if not selected_indices:
+        selected_items = self.get_selected_items()
+        if not selected_items:
             messagebox.showwarning("Geen bestanden geselecteerd", "Selecteer minstens één bestand om te kopiëren.")
             return
 
@@ -575,52 +3768,146 @@ class FileCopyApp:
             # User cancelled the dialog
             return
 
-        # Collect full paths of selected files
-        selected_files = [self.source_folder_paths_and_names[i][0] for i in selected_indices]
+        # Collect the selected files (every chapter of a spanned clip, and their sidecars) with their de-duplicated names
+        selected_files = [file for item in selected_items for entry in item.entries
+                          for file in [(entry.path, entry.display_name)] +
+                          [(sidecar.path, sidecar_name(sidecar, entry)) for sidecar in entry.sidecars]]
 
         # Start the copying in a separate thread
-        threading.Thread(target=self.copy_files_to_custom_location, args=(selected_files, destination_directory), daemon=True).start()
+        threading.Thread(target=self.run_profiled, args=("export", self.copy_files_to_custom_location, selected_files, destination_directory), daemon=True).start()
     
     def copy_files_to_custom_location(self, selected_files, destination_directory):
         total_files = len(selected_files)
-        successful_copies = 0  # Initialize a counter for successful copies
-        
-        # Dictionary to keep track of file names and their counts
-        file_name_counts = {}
-        
-        for index, source_path in enumerate(selected_files, start=1):
-            file_name = os.path.basename(source_path)
-            creation_time = os.path.getctime(source_path)
-            
-            if file_name in file_name_counts:
-                file_name_counts[file_name] += 1
-                base_name, ext = os.path.splitext(file_name)
-                new_file_name = f"{base_name}_{file_name_counts[file_name]}{ext}"
-            else:
-                file_name_counts[file_name] = 1
-                new_file_name = file_name
+        job = {"kind": "copy", "metric": "export", "settings": self.copy_settings(self.export_workers),
+               "labels": {"source": self.selected_source_folder.get(), "destination": "custom"},
+               "tasks": [{"source": source_path, "destination": os.path.join(destination_directory, file_name),
+                          "name": file_name} for source_path, file_name in selected_files]}
 
-            destination_path = os.path.join(destination_directory, new_file_name)
-            
-            try:
-                shutil.copy2(source_path, destination_path)
-                successful_copies += 1  # Increment on successful copy
-                logging.info(f"File {source_path} copied to custom location {destination_path}")
-                progress = (index / total_files) * 100
-                # Update progress bar in a thread-safe manner
-                self.root.after(0, self.progress_var.set, progress)
-            except Exception as e:
-                logging.error(f"Error copying file: {source_path} to {destination_directory}: {e}")
+        failures = []  # (name, error) of the files that were not copied
+
+        def on_export_event(event):
+            if event["event"] == "progress":
+                self.set_copy_progress(event["bytes"], event["total_bytes"],
+                                       f"Exporteren: {event['files']}/{event['total_files']}")
+            elif event["event"] == "file" and not event["ok"]:
+                failures.append((event["name"], event["error"]))
+
+        try:
+            done = self.run_transfer_job(job, on_export_event)
+            successful_copies = done["completed"]
+            if done["error"] is not None:
+                failures.append((destination_directory, done["error"]))
+        except OSError as e:
+            logging.error(f"Export job: {e}")
+            successful_copies = 0
+            failures.append((destination_directory, str(e)))
 
         # Ensure GUI updates are done in the main thread
-        self.root.after(0, self.progress_var.set, 0)
+        self.root.after(0, self.reset_progress)
         logging.info(f"Kopiëren voltooid. {successful_copies} van de {total_files} geselecteerde bestanden succesvol gekopieerd naar {destination_directory}.")
+        if failures or successful_copies < total_files:
+            self.root.after(0, self.copied_files_label_var.set, "Exporteren: Mislukt")
+            self.root.after(0, self.show_copy_failures,
+                            failures or [("onbekend", f"{total_files - successful_copies} bestand(en), zie het logbestand")])
+            return
+        self.root.after(0, self.copied_files_label_var.set, "Exporteren: Voltooid")
         copy_message = f"Kopiëren voltooid. {successful_copies} van de {total_files} geselecteerde bestanden succesvol gekopieerd naar {destination_directory}."
         self.root.after(0, messagebox.showinfo, "Kopiëren voltooid", copy_message)
 
+    def open_thumbnail_window(self, event=None):
+        if not self.file_items:
+            messagebox.showinfo("Geen bestanden", "Er zijn geen bestanden om weer te geven. Ververs de lijst (F5).")
+            return
+        if self.thumbnail_window is not None and self.thumbnail_window.winfo_exists():
+            self.thumbnail_window.destroy()
+
+        self.thumbnail_window = tk.Toplevel(self.root)
+        self.thumbnail_window.title("Thumbnails")
+        self.thumbnail_window.transient(self.root)
+        self.thumbnail_window.iconbitmap('./Icons/arrow.ico')
+        self.thumbnail_window.protocol("WM_DELETE_WINDOW", self.close_thumbnail_window)
+
+        # Size the window relative to the screen and derive the number of columns from it
+        screen_width = self.thumbnail_window.winfo_screenwidth()
+        screen_height = self.thumbnail_window.winfo_screenheight()
+        window_width = int(screen_width * 0.6)
+        window_height = int(screen_height * 0.6)
+        self.thumbnail_window.geometry(f"{window_width}x{window_height}")
+        card_width = self.thumbnail_width + 20
+        columns = max(1, (window_width - 40) // card_width)
+
+        # Scrollable canvas holding a grid of cards
+        canvas = tk.Canvas(self.thumbnail_window, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self.thumbnail_window, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        canvas.pack(side="left", fill="both", expand=True)
+        grid_frame = ttk.Frame(canvas)
+        canvas.create_window((0, 0), window=grid_frame, anchor="nw")
+        grid_frame.bind("<Configure>", lambda event: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.bind("<MouseWheel>", lambda event: canvas.yview_scroll(int(-event.delta / 120), "units"))
+
+        self.thumbnail_images = {}
+        placeholder_height = self.thumbnail_width * 9 // 16
+        for index, entry in enumerate(self.file_items.values()):
+            card = ttk.Frame(grid_frame, padding=5)
+            card.grid(row=index // columns, column=index % columns, sticky="n")
+            image_label = ttk.Label(card, text="...", anchor="center", width=self.thumbnail_width // 8)
+            image_label.pack(ipady=placeholder_height // 2 - 8)
+            ttk.Label(card, text=entry.label, width=self.thumbnail_width // 8).pack()
+            for widget in (card, image_label):
+                widget.bind("<Button-1>", lambda event, entry_id=entry.id: self.select_file_from_thumbnail(entry_id))
+                widget.bind("<MouseWheel>", lambda event: canvas.yview_scroll(int(-event.delta / 120), "units"))
+
+            # Cached cards are shown immediately, the rest are extracted in the background
+            cached_path = self.thumbnail_cache.lookup(entry.path)
+            if cached_path:
+                self.set_thumbnail_image(image_label, index, cached_path)
+            else:
+                self.thumbnail_cache.request(
+                    entry.path, lambda png, label=image_label, i=index: self.root.after(0, self.set_thumbnail_image, label, i, png))
+
+    def set_thumbnail_image(self, image_label, index, cached_path):
+        if not image_label.winfo_exists():
+            return
+        if cached_path is None:
+            image_label.config(text="—")
+            return
+        try:
+            image = PhotoImage(file=cached_path)
+        except tk.TclError:
+            image_label.config(text="—")
+            return
+        self.thumbnail_images[index] = image  # Keep a reference so Tk does not drop the image
+        image_label.config(image=image, text="", width=0)
+        image_label.pack_configure(ipady=0)
+
+    def select_file_from_thumbnail(self, entry_id):
+        self.file_listbox.select([entry_id])
+        self.file_listbox.see(entry_id)
+        self.file_listbox.event_generate("<<ListboxSelect>>")
+
+    def close_thumbnail_window(self):
+        # Queued extractions are no longer needed once the view is closed
+        self.thumbnail_cache.cancel_pending()
+        self.thumbnail_images = {}
+        self.thumbnail_window.destroy()
+        self.thumbnail_window = None
+
     def select_all_files(self):
-        self.file_listbox.select_set(0, "end")  # Selects all items in the listbox
-        self.file_listbox.event_generate("<<ListboxSelect>>")  # Triggers the listbox select event
+        self.file_listbox.select_all()  # Selects all items and triggers the listbox select event
+
+    def get_selected_items(self):
+        # Selected list items (FileEntry or ClipGroup) in display order
+        return [self.file_items[item_id] for item_id in self.file_listbox.selection()]
+
+    def file_list_colors(self):
+        # Match the file list to the sv_ttk theme
+        if self.theme == "dark":
+            return {"background": "#1c1c1c", "foreground": "#fafafa",
+                    "select_background": "#57c8ff", "select_foreground": "#000000"}
+        return {"background": "#fafafa", "foreground": "#1c1c1c",
+                "select_background": "#005fb8", "select_foreground": "#ffffff"}
 
     def on_source_selection(self, event):
         selected_source = self.selected_source_folder.get()
@@ -629,8 +3916,39 @@ class FileCopyApp:
             self.selected_destination_folder.set(default_destination)
         self.update_file_listbox()
 
+    def schedule_ui_tick(self):
+        # Idempotent: at most one tick is ever pending
+        if self.ui_tick_after_id is None:
+            self.ui_tick_after_id = self.root.after(self.ui_tick_interval_ms, self.ui_tick)
+
+    def ui_tick(self):
+        # One refresh pass for everything that changes over time
+        self.ui_tick_after_id = None
+        self.update_time_labels()
+        self.update_scrub_bar()
+        self.update_copy_progress()
+        self.update_preview_throttle()
+
+        # Keep ticking only while something is playing, loading or copying
+        if self.preview_loading or self.player.is_playing() or self.copy_progress is not None:
+            self.schedule_ui_tick()
+
+    def set_copy_progress(self, completed, total, label=None):
+        # Called from transfer threads; the values are applied by the next UI tick
+        self.copy_progress = (completed, total, label)
+        self.root.after(0, self.schedule_ui_tick)
+
+    def update_copy_progress(self):
+        copy_progress = self.copy_progress
+        if copy_progress is None:
+            return
+        completed, total, label = copy_progress
+        self.progress_var.set((completed / total) * 100 if total else 0)
+        if label is not None:
+            self.copied_files_label_var.set(label)
+
     def update_time_labels(self):
-        # Update duration and current time labels periodically.
+        # Update duration and current time labels.
         duration = self.player.get_length()
         if duration != -1:
             duration_str = self.format_time(duration)
@@ -641,8 +3959,6 @@ class FileCopyApp:
             current_time_str = self.format_time(current_time)
             self.current_time_label.config(text=f"{current_time_str}")
 
-        self.root.after(100, self.update_time_labels)
-
     def format_time(self, milliseconds):
         # Format time from milliseconds to HH:MM:SS:FF.
         total_seconds = milliseconds // 1000
@@ -666,46 +3982,207 @@ class FileCopyApp:
         # The user has finished interacting with the scrub bar
         self.manual_position_update = False
         self.update_player_position(self.scrub_bar.get())
+        self.schedule_ui_tick()
             
 
     def load_configuration(self):
         try:
-            with open("config.json", "r") as config_file:
-                self.config = json.load(config_file)
-    
-            # Load source folders
-            self.source_folders = self.config.get("source_folders", {})
-            for key, value in self.source_folders.items():
-                if not isinstance(value, list):
-                    self.source_folders[key] = [value]
-
-            # Load the theme configuration
-            self.theme = self.config.get("theme", "light")            
-
-            # Load custom export configuration
-            self.enable_custom_export = self.config.get("enable_custom_export", True)  
-
-            # Load custom export configuration
-            self.enable_ftp_export = self.config.get("enable_ftp_export", True)                   
-    
-            # Load destination folder mappings
-            self.destination_folders_mapping = self.config.get("destination_folders_mapping", {})
-
-            self.default_destinations = self.config.get("default_destinations", {})
-    
-            # Load file listbox update extensions
-            self.update_file_listbox_extensions = self.config.get("update_file_listbox", [])
-    
-            # Initialize StringVars for selected source and destination, defaulting to the first key if available
-            self.selected_source_folder = StringVar(value=next(iter(self.source_folders), ''))
-            self.selected_destination_folder = StringVar(value=next(iter(self.destination_folders_mapping), ''))
-    
+            with open(self.config_path, "r") as config_file:
+                config = json.load(config_file)
+            self.config_mtime = os.path.getmtime(self.config_path)
         except FileNotFoundError:
             messagebox.showerror("Configuratiefout", "Configuratiebestand niet gevonden.")
             self.root.destroy()
+            return
         except json.JSONDecodeError as e:
             messagebox.showerror("Configuratiefout", f"Fout bij lezen configuratiebestand: {e}")
             self.root.destroy()
+            return
+
+        errors = validate_config(config)
+        if errors:
+            messagebox.showerror("Configuratiefout", "Ongeldig configuratiebestand:\n" + "\n".join(errors[:10]))
+            self.root.destroy()
+            return
+
+        self.apply_configuration(config)
+
+        # Initialize StringVars for selected source and destination, defaulting to the first key if available
+        self.selected_source_folder = StringVar(value=next(iter(self.source_folders), ''))
+        self.selected_destination_folder = StringVar(value=next(iter(self.destination_folders_mapping), ''))
+
+    def apply_configuration(self, config):
+        # Everything is derived up front and then swapped in together, so a running copy
+        # (which snapshots what it needs when it starts) never sees a half-applied config
+        source_folders = {key: value if isinstance(value, list) else [value]
+                          for key, value in config.get("source_folders", {}).items()}
+        destination_folders_mapping = compile_destination_mapping(config.get("destination_folders_mapping", {}))
+        clip_name_parsers = build_clip_name_parsers(config.get("clip_name_patterns", []))
+
+        self.config = config
+        self.source_folders = source_folders
+
+        # Load the theme configuration
+        self.theme = config.get("theme", "light")
+
+        # Load custom export configuration
+        self.enable_custom_export = config.get("enable_custom_export", True)
+
+        # Load FTP export configuration
+        self.enable_ftp_export = config.get("enable_ftp_export", True)
+
+        # Load destination folder mappings
+        self.destination_folders_mapping = destination_folders_mapping
+        self.default_destinations = config.get("default_destinations", {})
+
+        # Load file listbox update extensions
+        self.update_file_listbox_extensions = config.get("update_file_listbox", [])
+
+        # Sidecar files (e.g. XML metadata, THM thumbnails) carried along with their media file
+        self.sidecar_extensions = {ext.lower() for ext in config.get("sidecar_extensions", [])}
+        self.sidecar_archive = config.get("sidecar_archive", False)
+
+        # Files up to small_file_kb are copied by small_file_workers workers of their own, and uploaded
+        # one after another over one extra FTP session
+        self.small_file_kb = config.get("small_file_kb", 1024)
+        self.small_file_workers = max(1, config.get("small_file_workers", 8))
+
+        # FTP uploads are checked on the server (SIZE, and HASH/XCRC/XMD5 where offered); a file that does
+        # not match is uploaded again up to upload_verify_retries times
+        self.upload_verify_retries = max(0, config.get("upload_verify_retries", 2))
+
+        # Precompiled camera clip naming schemes used to sort the file list
+        self.clip_name_parsers = clip_name_parsers
+
+        # List the chapters of a spanned recording (e.g. GX01xxxx, GX02xxxx) as one item
+        self.group_spanned_clips = config.get("group_spanned_clips", True)
+
+        # Load thumbnail view configuration
+        self.enable_thumbnail_view = config.get("enable_thumbnail_view", True)
+        self.thumbnail_cache_size_mb = config.get("thumbnail_cache_size_mb", 200)
+        self.thumbnail_width = config.get("thumbnail_width", 160)
+        self.thumbnail_workers = config.get("thumbnail_workers", 2)
+        self.ffmpeg_path = config.get("ffmpeg_path", "ffmpeg")
+
+        # Delay before a selected file is loaded into the preview player (debounce)
+        self.preview_debounce_ms = config.get("preview_debounce_ms", 150)
+
+        # Number of files copied at the same time by the ingest copy and by the custom export (Ctrl+E)
+        self.copy_workers = max(1, config.get("copy_workers", 2))
+        self.export_workers = max(1, config.get("export_workers", 4))
+
+        # Read copies back for the hash check from the disk instead of the page cache ("drop" or "direct")
+        self.verify_read = config.get("verify_read", "cached")
+
+        # Ring buffers of each copy worker: reads run ahead of writes by at most count * size bytes
+        self.copy_buffer_count = max(2, config.get("copy_buffer_count", 8))
+        self.copy_buffer_size_kb = max(64, config.get("copy_buffer_size_kb", 1024))
+
+        # Bandwidth caps in MB/s (0 = unlimited), the cap while the preview plays and the worker thread priority
+        self.copy_rate_limit_mbps = config.get("copy_rate_limit_mbps", 0)
+        self.upload_rate_limit_mbps = config.get("upload_rate_limit_mbps", 0)
+        self.preview_throttle_mbps = config.get("preview_throttle_mbps", 25)
+        self.transfer_io_priority = config.get("transfer_io_priority", "normal")
+
+        # Interval for checking config.json for changes (0 disables automatic reloading)
+        self.config_reload_interval_ms = config.get("config_reload_interval_ms", 2000)
+
+        # Default time window ("22:00-06:00") per delivery priority, for uploads (Ctrl+F)
+        self.delivery_windows = config.get("delivery_windows", {})
+
+        # What the copy does with files the ingest catalog already holds, and whether to preselect new clips
+        self.catalog_duplicates = config.get("catalog_duplicates", "copy")
+        self.catalog_preselect_new = config.get("catalog_preselect_new", False)
+
+    # Settings that are only read at startup
+    RESTART_CONFIG_KEYS = ("enable_thumbnail_view", "thumbnail_cache_size_mb", "thumbnail_width",
+                           "thumbnail_workers", "ffmpeg_path", "metrics_jsonl", "metrics_port",
+                           "enable_catalog", "catalog_path", "worker_jobs_per_device", "worker_address")
+
+    def reload_configuration(self, event=None, interactive=True):
+        # Re-read config.json (on request or when it changed) without restarting. A failed automatic
+        # reload (e.g. of a file an editor is still writing) is only logged: the last good configuration
+        # stays active and the file is read again on its next change. Ctrl+R reports it in a dialog.
+        try:
+            self.config_mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, "r") as config_file:
+                config = json.load(config_file)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Configuration not reloaded: {e}")
+            if interactive:
+                messagebox.showerror("Configuratiefout", f"Configuratie niet herladen: {e}")
+            return
+        errors = validate_config(config)
+        if errors:
+            logging.error("Configuration not reloaded: " + "; ".join(errors))
+            if interactive:
+                messagebox.showerror("Configuratiefout", "Configuratie niet herladen:\n" + "\n".join(errors[:10]))
+            return
+
+        previous_config = self.config
+        previous_source_folders = self.source_folders.get(self.selected_source_folder.get())
+        self.apply_configuration(config)
+
+        # Apply the changes to the widgets
+        self.source_dropdown['values'] = list(self.source_folders.keys())
+        self.destination_dropdown['values'] = list(self.destination_folders_mapping.keys())
+        if self.selected_source_folder.get() not in self.source_folders:
+            self.selected_source_folder.set(next(iter(self.source_folders), ''))
+        if self.selected_destination_folder.get() not in self.destination_folders_mapping:
+            self.selected_destination_folder.set(next(iter(self.destination_folders_mapping), ''))
+        if self.theme != previous_config.get("theme", "light"):
+            sv_ttk.set_theme(self.theme)
+            self.file_listbox.set_colors(self.file_list_colors())
+        self.bind_optional_shortcuts()
+        if not self.profiling_cli_mode:
+            self.set_profiling_mode(config.get("profiling"))
+
+        # Only rescan when the files that would be listed changed; re-sort when only the naming rules changed
+        if self.source_folders.get(self.selected_source_folder.get()) != previous_source_folders or \
+                config.get("update_file_listbox", []) != previous_config.get("update_file_listbox", []) or \
+                config.get("sidecar_extensions", []) != previous_config.get("sidecar_extensions", []):
+            if self.selected_source_folder.get():
+                self.update_file_listbox()
+        elif config.get("clip_name_patterns", []) != previous_config.get("clip_name_patterns", []) or \
+                self.group_spanned_clips != previous_config.get("group_spanned_clips", True):
+            self.reorganize_file_list()
+
+        restart_keys = [key for key in self.RESTART_CONFIG_KEYS if config.get(key) != previous_config.get(key)]
+        if restart_keys:
+            logging.info(f"Changed settings that take effect after a restart: {', '.join(restart_keys)}")
+        logging.info("Configuration reloaded.")
+
+    def watch_configuration(self):
+        # Reload config.json when it changes on disk
+        try:
+            if os.path.getmtime(self.config_path) != self.config_mtime:
+                self.reload_configuration(interactive=False)
+        except OSError:
+            pass
+        if self.config_reload_interval_ms:
+            self.root.after(self.config_reload_interval_ms, self.watch_configuration)
+
+    def bind_optional_shortcuts(self):
+        # Custom location if enabled
+        if self.enable_custom_export:
+            self.root.bind('<Control-e>', self.copy_to_custom_location)
+        else:
+            self.root.unbind('<Control-e>')
+
+        # FTP upload if enabled
+        if self.enable_ftp_export:
+            self.root.bind('<Control-f>', self.open_ftp_upload_window)
+        else:
+            self.root.unbind('<Control-f>')
+
+    def set_profiling_mode(self, profiling_mode):
+        if profiling_mode and profiling_mode not in JobProfiler.MODES:
+            logging.warning(f"Unknown profiling mode '{profiling_mode}'; profiling disabled.")
+            profiling_mode = None
+        if profiling_mode and profiling_mode != getattr(self, "profiling_mode", None):
+            logging.info(f"Profiling enabled ({profiling_mode}).")
+        self.profiling_mode = profiling_mode
+        self.profiling_sample_interval = self.config.get("profiling_sample_interval_ms", 5) / 1000
 
     def check_file_integrity(self, source, destination):
         #Compare file hashes
@@ -713,127 +4190,286 @@ class FileCopyApp:
         destination_hash = self.calculate_file_hash(destination)
         return source_hash == destination_hash
   
+    def copy_settings(self, max_workers):
+        # Copy engine settings sent along with copy and export jobs
+        return {"workers": max_workers, "verify": "hash" if self.config.get("perform_hash_check", True) else "size",
+                "block_size": self.copy_buffer_size_kb * 1024, "buffer_count": self.copy_buffer_count,
+                "rate_limit_mbps": self.copy_rate_limit_mbps, "io_priority": self.transfer_io_priority,
+                "small_file_kb": self.small_file_kb, "small_file_workers": self.small_file_workers,
+                "verify_read": self.verify_read}
+
+    def run_transfer_job(self, job, on_event, method="run"):
+        # Run a job on the worker when one is configured (falling back to this process when it is
+        # not running), otherwise in-process; blocks until the job is done and returns its "done" event.
+        # method="deliver" sends an upload job through the delivery queue (priority and time window).
+        if self.worker_address:
+            try:
+                return getattr(self.worker_client(), method)(job, on_event)
+            except ConnectionRefusedError as e:
+                logging.warning(f"Worker at {self.worker_address} not reachable ({e}); running the job here.")
+        profiler = getattr(self.job_profiles, "profiler", None)
+        return getattr(self.service, method)(job, on_event, span=profiler.span if profiler is not None else None)
+
+    def worker_client(self):
+        return WorkerClient(self.worker_address, self.worker_client_id,
+                            token=load_worker_token(worker_token_path(self.config_path)))
+
+    def update_preview_throttle(self):
+        # Interactive preview mode: slow running transfers down while the preview plays
+        playing = bool(self.player.is_playing())
+        if playing == self.preview_playing:
+            return
+        self.preview_playing = playing
+        rate_mbps = self.preview_throttle_mbps if playing else 0
+        self.service.set_throttle(self.worker_client_id, rate_mbps)
+        if self.worker_address:
+            threading.Thread(target=self.send_worker_throttle, args=(rate_mbps,), daemon=True).start()
+        if self.copy_progress is not None and self.preview_throttle_mbps:
+            logging.info("Transfers throttled for the preview." if playing else "Transfer throttle lifted.")
+
+    def send_worker_throttle(self, rate_mbps):
+        try:
+            self.worker_client().set_throttle(self.worker_client_id, rate_mbps)
+        except OSError as e:
+            logging.debug(f"Could not send the preview throttle to the worker: {e}")
+
+    def link_duplicate(self, fingerprint, entry, file_name, destination_path, hardlink):
+        # Handle a file the catalog already holds. Returns False when it still has to be copied: the earlier
+        # copy is gone or its contents differ (a fingerprint collision), or a hard link was wanted but is
+        # not possible (e.g. the earlier copy is on another volume).
+        with self.span("catalog"):
+            existing = self.catalog.verified_copy(fingerprint, entry.path)
+        if existing is None:
+            logging.info(f"'{file_name}' matches an earlier ingest, but that copy is gone or differs; copying it.")
+            return False
+        if os.path.exists(destination_path) and os.path.samefile(existing, destination_path):
+            logging.info(f"Skipping '{file_name}': already ingested to '{destination_path}'.")
+            return True
+        if not hardlink:
+            _, clip_id, ingested_at = self.catalog.lookup(fingerprint)[0]
+            logging.info(f"Skipping '{file_name}': already ingested on {ingested_at}"
+                         f"{f' as {clip_id}' if clip_id else ''} to '{existing}'.")
+            return True
+        if os.path.exists(destination_path):
+            return False
+        try:
+            os.link(existing, destination_path)
+        except OSError as e:
+            logging.info(f"Cannot hard-link '{file_name}' to '{existing}' ({e}); copying it instead.")
+            return False
+        logging.info(f"File '{file_name}' was already ingested; hard-linked '{destination_path}' to '{existing}'.")
+        self.record_ingest(fingerprint, entry, file_name, entry.path, destination_path)
+        return True
+
+    def record_ingest(self, fingerprint, entry, file_name, source_path, destination_path):
+        try:
+            self.catalog.record(fingerprint, entry.size, camera_clip_id(entry), file_name, source_path, destination_path)
+        except sqlite3.Error as e:
+            logging.error(f"Could not record '{file_name}' in the ingest catalog: {e}")
+
     def calculate_file_hash(self, file_path, hash_algorithm="sha256", block_size=65536):
         # Calculate the hash of a file.
-        hash_obj = hashlib.new(hash_algorithm)
-        with open(file_path, "rb") as file:
-            for block in iter(lambda: file.read(block_size), b""):
-                hash_obj.update(block)
-        return hash_obj.hexdigest()
+        return file_hash(file_path, hash_algorithm, block_size)
 
-    def show_error_message(self, file_name):
-        # Show an error message.
-        error_message = f"Fout: kopiëren van bestand '{file_name}' mislukt. Hashes komen niet overeen."
-        messagebox.showerror("Kopieerfout", error_message)
+    def show_copy_failures(self, failures):
+        # Show one error message for the files that failed: (name, error), error None when the hashes differ
+        lines = [f"- {name}: {error or 'hashes komen niet overeen'}" for name, error in failures[:10]]
+        if len(failures) > 10:
+            lines.append(f"... en nog {len(failures) - 10} bestand(en), zie het logbestand.")
+        messagebox.showerror("Kopieerfout", f"Kopiëren van {len(failures)} bestand(en) mislukt:\n" + "\n".join(lines))
 
     def update_file_listbox(self, event=None):
         selected_source_folders = self.source_folders[self.selected_source_folder.get()]
 
-        source_folder_paths_and_names = []
-
-        allowed_extensions = self.config.get("update_file_listbox", [])
-
-        for selected_source_folder in selected_source_folders:
-            for root, dirs, files in os.walk(selected_source_folder):
-                for file_name in files:
-                    _, file_extension = os.path.splitext(file_name.lower())
-                    if file_extension in allowed_extensions:
-                        full_path = os.path.join(root, file_name)
-                        creation_time = os.path.getctime(full_path)
-                        source_folder_paths_and_names.append((full_path, file_name, creation_time))
-
-        # Custom sorting function to prioritize GX-prefixed files by chapter number
-        def custom_sort_key(item):
-            file_name = item[1]
-            creation_time = item[2]
-
-            # Check if the filename has a two-letter prefix followed by two digits and then a clip identifier
-            match = re.match(r'([A-Z]{2})(\d{2})(\d+)', file_name)
-            if match:
-                # Extract the prefix (e.g., 'GX', 'AX'), chapter prefix (e.g., '01', '02'), and clip identifier (e.g., '1234')
-                prefix = match.group(1)             # e.g., 'GX' or 'AX'
-                chapter_prefix = int(match.group(2)) # e.g., '01' or '02'
-                clip_identifier = int(match.group(3)) # The remaining identifier like '1234', '1240', etc.
-
-                # Sort prefixed files by prefix alphabetically, then by clip identifier and chapter
-                return (prefix, clip_identifier, chapter_prefix)
-            else:
-                # For non-prefixed files, sort alphabetically by filename
-                return (file_name.lower(),)
-
-        # Apply the updated sorting function in the update_file_listbox method
-        source_folder_paths_and_names.sort(key=custom_sort_key)
+        # Sidecar files are scanned too; they are linked to their media file instead of being listed
+        allowed_extensions = self.config.get("update_file_listbox", []) + list(self.sidecar_extensions)
+
+        # Scan in the background; a newer refresh supersedes this one
+        self.scan_generation += 1
+        threading.Thread(target=self.run_profiled,
+                         args=("scan", self.scan_files_thread, self.scan_generation, selected_source_folders,
+                               allowed_extensions, self.file_entries),
+                         daemon=True).start()
+
+    def scan_files_thread(self, generation, selected_source_folders, allowed_extensions, previous_entries):
+        with self.span("walk"):
+            entries = scan_source_folders(selected_source_folders, allowed_extensions, previous_entries)
+        self.organize_file_list(generation, entries)
+
+    def reorganize_file_list(self):
+        # Re-sort and re-group the current entries (e.g. after the naming rules changed) without rescanning
+        self.scan_generation += 1
+        threading.Thread(target=self.run_profiled,
+                         args=("scan", self.organize_file_list, self.scan_generation, list(self.file_entries.values())),
+                         daemon=True).start()
+
+    def organize_file_list(self, generation, entries):
+        # Link sidecar files to their media file; only media files are listed
+        with self.span("sidecars"):
+            media = attach_sidecars(entries, self.sidecar_extensions)
+
+        # Sort camera clips by clip and chapter; parsed keys are cached on the entries
+        parsers = self.clip_name_parsers
+        with self.span("sort"):
+            media.sort(key=lambda entry: clip_sort_key(entry, parsers))
 
         # Handle duplicate filenames
-        file_name_counts = {}
-        for i, (path, file_name, creation_time) in enumerate(source_folder_paths_and_names):
-            if file_name in file_name_counts:
-                file_name_counts[file_name] += 1
-                base_name, ext = os.path.splitext(file_name)
-                new_file_name = f"{base_name}_{file_name_counts[file_name]}{ext}"
-                source_folder_paths_and_names[i] = (path, new_file_name, creation_time)
-            else:
-                file_name_counts[file_name] = 1
-
-        self.file_listbox.delete(0, "end")
-        for path, file_name, creation_time in source_folder_paths_and_names:
-            self.file_listbox.insert("end", file_name)
-
-        self.source_folder_paths_and_names = [(path, file_name) for path, file_name, creation_time in source_folder_paths_and_names]
+        with self.span("dedupe"):
+            assign_display_names(media)
+
+        # List the chapters of a spanned recording as one item
+        with self.span("group"):
+            items = group_spanned_clips(media) if self.group_spanned_clips else media
+
+        # Flag clips that were ingested before
+        with self.span("catalog"):
+            ingested_ids = self.find_ingested(items)
+
+        self.root.after(0, self.apply_file_scan, generation, entries, items, ingested_ids)
+
+    def find_ingested(self, items):
+        # Ids of the items whose files are all in the catalog. Only files with the size of an
+        # ingested file are fingerprinted, so a card of new clips is checked without any reads.
+        if self.catalog is None:
+            return set()
+        sizes = self.catalog.sizes()
+        ingested_ids = set()
+        for item in items:
+            try:
+                if all(entry.size in sizes and self.catalog.contains(entry_fingerprint(entry))
+                       for entry in item.entries):
+                    ingested_ids.add(item.id)
+            except OSError:
+                pass  # Unreadable files count as new
+        return ingested_ids
+
+    def refresh_ingested_marks(self):
+        # Re-check the listed items against the catalog (after a copy added to it)
+        items = list(self.file_items.values())
+        generation = self.scan_generation
+        ingested_ids = self.find_ingested(items)
+        self.root.after(0, self.apply_ingested_marks, generation, ingested_ids)
+
+    def apply_file_scan(self, generation, entries, items, ingested_ids):
+        if generation != self.scan_generation:
+            return
+        previous_ids = self.file_items.keys() - self.ingested_ids
+        self.file_entries = {entry.id: entry for entry in entries}
+        self.file_items = {item.id: item for item in items}
+        self.apply_ingested_marks(generation, ingested_ids)
+        # Preselect the new clips when the listing changed (not on every refresh, which would undo a selection)
+        new_ids = [item.id for item in items if item.id not in ingested_ids]
+        if self.catalog_preselect_new and set(new_ids) != previous_ids:
+            self.file_listbox.select(new_ids)
+
+    def apply_ingested_marks(self, generation, ingested_ids):
+        if generation != self.scan_generation:
+            return
+        self.ingested_ids = ingested_ids
+        self.file_listbox.set_items(self.file_items.keys(),
+                                    [item.label + ("  [al geïmporteerd]" if item.id in ingested_ids else "")
+                                     for item in self.file_items.values()])
  
     def load_media(self):
-        selected_indices = self.file_listbox.curselection()
+        # Cancel a pending (debounced) load and invalidate any load that is still in flight
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        self.preview_generation += 1
+        if self.preview_loading or self.player.is_playing():
+            # Stop the clip of the previous selection, so it does not keep playing muted in the background
+            # (keeping the UI tick busy and the transfers throttled) while nothing or several files are selected
+            self.player.stop()
+        self.preview_loading = False
+
+        selected_items = self.get_selected_items()
 
         self.play_button.config(text="                 Play                 ")
 
-        if len(selected_indices) != 1:
+        if len(selected_items) != 1:
+            return
+
+        # A spanned clip previews its first chapter
+        selected_path, selected_file = selected_items[0].path, selected_items[0].display_name
+
+        # Debounce rapid selections (e.g. arrow-keying through the list): only the last one is loaded
+        self.preview_after_id = self.root.after(self.preview_debounce_ms, self.start_media_load,
+                                                self.preview_generation, selected_path, selected_file)
+
+    def start_media_load(self, generation, selected_path, selected_file):
+        self.preview_after_id = None
+        if generation != self.preview_generation:
             return
 
-        selected_path, selected_file = self.source_folder_paths_and_names[selected_indices[0]]
         absolute_path = os.path.abspath(selected_path)
         media = self.instance.media_new(absolute_path)
+        # Events of the media itself, bound to this load's generation: a late event of an earlier
+        # clip cannot finish or cancel the load of a newer selection
+        media.event_manager().event_attach(vlc.EventType.MediaStateChanged, self.on_media_state_changed, generation)
         self.player.set_media(media)
         self.player.set_hwnd(self.media_player_canvas.winfo_id())  # Assign the media player to the Canvas widget
 
-        # Start playback to initiate loading
+        # Start playback to initiate loading; on_media_state_changed pauses it on the first frame
+        self.preview_loading = True
         self.player.play()
         self.player.audio_set_mute(True)  # Mute the audio immediately after starting playback
 
-        # Wait until the media is actually playing, then pause it
-        def wait_for_media_ready():
-            while True:
-                state = self.player.get_state()
-                if state in (vlc.State.Playing, vlc.State.Paused):
-                    break
-                time.sleep(0.1)
+        # Reset the scrub bar to the start if applicable
+        self.scrub_bar.set(0)
+        self.schedule_ui_tick()
 
-            # Seek to the first frame and pause the player
-            if self.player.is_seekable():
-                self.player.set_time(0)  # Seek to 40 milliseconds
-                self.player.pause()  # Ensure the player is paused after seeking
+        logging.info(f"Media '{selected_file}' loading.")
 
-        # Run the wait operation in a separate thread to avoid blocking the main GUI thread
-        threading.Thread(target=wait_for_media_ready, daemon=True).start()
+    def on_media_state_changed(self, event, generation):
+        # Called from a VLC thread; libvlc must not be called back from here, so hand over to Tk
+        state = event.u.new_state
+        if state == vlc.State.Playing.value:
+            self.root.after(0, self.finish_media_load, generation)
+        elif state == vlc.State.Error.value:
+            self.root.after(0, self.cancel_media_load, generation)
 
-        # Reset the scrub bar to the start if applicable
-        self.scrub_bar.set(0)
+    def finish_media_load(self, generation):
+        # Ignore events belonging to a previous selection
+        if generation != self.preview_generation or not self.preview_loading:
+            return
+        self.preview_loading = False
+
+        # Seek to the first frame and pause the player
+        if self.player.is_seekable():
+            self.player.set_time(0)
+        self.player.set_pause(1)
+        self.schedule_ui_tick()
 
-        logging.info(f"Media '{selected_file}' loaded and set to pause.")
+        logging.info("Media loaded and set to pause.")
+
+    def cancel_media_load(self, generation):
+        if generation != self.preview_generation or not self.preview_loading:
+            return
+        self.preview_loading = False
+        logging.warning("VLC could not load the selected media.")
  
     def play_media(self):
         if self.player.get_media():
-            if self.player.is_playing():
+            if self.preview_loading:
+                # Playback requested before the preview finished loading: keep it playing
+                self.preview_loading = False
+                self.player.audio_set_mute(False)
+                self.play_button.config(text="               Pause                ")
+                logging.info("Video playing.")
+                self.schedule_ui_tick()
+            elif self.player.is_playing():
                 # If the video is playing, pause it and change button text to "Play"
                 self.player.pause()
                 self.play_button.config(text="                 Play                 ")
                 logging.info("Video paused.")
+                self.schedule_ui_tick()
             else:
                 # If the video is paused, play it and change button text to "Pause"
                 self.player.audio_set_mute(False)  # Ensure the audio is not muted
                 self.player.play()
                 self.play_button.config(text="               Pause                ")
                 logging.info("Video playing.")
-                self.update_scrub_bar()  # Start updating the scrub bar during playback
+                self.schedule_ui_tick()  # Start updating the scrub bar during playback
         else:
             logging.warning("No media loaded to play.")
             messagebox.showinfo("Afspeelfout", "Er is geen medium geladen. Selecteer een bestand uit de lijst.")
@@ -850,13 +4486,32 @@ class FileCopyApp:
                 # Calculate the position as a percentage
                 position = (current_time / length) * 100
                 self.scrub_bar.set(position)
-        
-        # Schedule the next update after 100 milliseconds
-        self.root.after(100, self.update_scrub_bar)
 
     def copy_files(self):
         # Start the file copying in a background thread
-        threading.Thread(target=self.copy_files_thread, daemon=True).start()
+        threading.Thread(target=self.run_profiled, args=("copy", self.copy_files_thread), daemon=True).start()
+
+    def run_profiled(self, job_name, target, *args):
+        # Run a job on the current thread, profiling it when profiling is enabled
+        if not self.profiling_mode:
+            return target(*args)
+        profiler = JobProfiler(job_name, self.profiling_mode, self.log_folder, self.profiling_sample_interval)
+        self.job_profiles.profiler = profiler
+        profiler.start()
+        try:
+            return target(*args)
+        finally:
+            profiler.stop()
+            self.job_profiles.profiler = None
+            try:
+                profiler.write_report()
+            except OSError as e:
+                logging.error(f"Could not write the profile of job '{job_name}': {e}")
+
+    def span(self, stage):
+        # Time a stage of the job running on this thread; a no-op when profiling is off
+        profiler = getattr(self.job_profiles, "profiler", None)
+        return profiler.span(stage) if profiler is not None else contextlib.nullcontext()
 
     def copy_files_thread(self):
         self.is_copying = True
@@ -871,9 +4526,6 @@ class FileCopyApp:
         start_time = time.time()
 
         try:
-            # Check if hash check is enabled in the configuration
-            perform_hash_check = self.config.get("perform_hash_check", True)
-
             # Validate the selected date from the date picker
             try:
                 selected_date = self.date_picker_var.get()
@@ -898,17 +4550,8 @@ class FileCopyApp:
             # 1) Normalize the input to a standard Unicode form (e.g., NFC).
             subfolder_name = unicodedata.normalize('NFC', subfolder_name)
 
-<<<<<<< HEAD
             # 2) Define a pattern that forbids Windows-reserved ASCII chars and control characters
             pattern = r'[\u0000-\u001F\u007F-\u009F\\/:*?"<>|]'
-=======
-            # 2) Define a pattern that forbids:
-            #    - Windows-reserved ASCII characters  (\/:*?"<>|)
-            #    - ASCII control characters           [\u0000-\u001F\u007F]
-            #    - Unicode C1 control characters      [\u0080-\u009F]
-            pattern = r'[\u0000-\u001F\u007F-\u009F\\/:*?"<>|]'
-
->>>>>>> 4ef7c679184ab47df35b991f062579cd2e417278
             if re.search(pattern, subfolder_name):
                 logging.warning("Copy button pressed, but folder name contains invalid or control characters.")
                 messagebox.showwarning(
@@ -938,10 +4581,15 @@ class FileCopyApp:
             selected_source_folder = self.source_folders[self.selected_source_folder.get()]
             selected_destination_folder = self.destination_folders_mapping[self.selected_destination_folder.get()]
 
-            # Get the list of selected files from the listbox
-            selected_files = [self.file_listbox.get(i) for i in self.file_listbox.curselection()]
+            # Snapshot the selected clips as lists of (path, name, entry, sidecars) chapters, sidecars as
+            # (path, name): a refresh during the copy renames entries and refills their sidecars, which
+            # must not change the files or names of a copy that is already running
+            selected_clips = [[(entry.path, entry.display_name, entry,
+                                tuple((sidecar.path, sidecar_name(sidecar, entry)) for sidecar in entry.sidecars))
+                               for entry in item.entries]
+                              for item in self.get_selected_items()]
 
-            if not selected_files:
+            if not selected_clips:
                 logging.warning("Copy button pressed, but no files selected.")
                 messagebox.showwarning("Geen bestanden geselecteerd", "Selecteer de bestanden die u wilt kopiëren.")
                 self.subfolder_entry.config(state="normal")
@@ -952,154 +4600,148 @@ class FileCopyApp:
                 self.is_copying = False
                 return
 
-            logging.info(f"Copy button pressed. Copying {len(selected_files)} file(s).")
+            metric_labels = {"source": self.selected_source_folder.get(),
+                             "destination": self.selected_destination_folder.get()}
+
+            logging.info(f"Copy button pressed. Copying {sum(len(chapters) for chapters in selected_clips)} file(s).")
 
-            total_files = len(selected_files)
-            completed_files = 0
+            duplicate_files = 0
+            duplicates = self.catalog_duplicates if self.catalog is not None else "copy"
 
             # Format the subfolder name with the selected date
             selected_datetime = datetime.datetime.strptime(selected_date, "%d-%m-%Y")
             subfolder_name_with_date = selected_datetime.strftime("%y%m%d") + "_" + subfolder_name
 
-            # Loop through selected files and copy them to the destination
-            for index in self.file_listbox.curselection():
-                source_path, file_name = self.source_folder_paths_and_names[index]
-                _, file_extension = os.path.splitext(file_name.lower())
+            # Route the selected clips; all chapters of a clip go to the same destination
+            copy_tasks = []
+            for chapters in selected_clips:
+                first_source_path, first_file_name, _, _ = chapters[0]
+                _, file_extension = os.path.splitext(first_file_name.lower())
 
                 # Only proceed if there's a matching extension mapping in the destination folder config
-                if file_extension in selected_destination_folder:
-                    destination_info_list = selected_destination_folder[file_extension]
-
-                    # Try each path in this extension's list
-                    for destination_info in destination_info_list:
-                        destination_path_base = destination_info.get("path")
-                        extension_media_info_tracks = destination_info.get("media_info_tracks", {})
-
-                        # --- Media Info Check ---
-                        # Always define media_info
-                        media_info = MediaInfo.parse(source_path)
-
-                        # We'll track whether the file’s media info fails the checks
-                        mismatch_occurred = False  
-                        # Also define a default for actual_value
-                        actual_value = None  
-
-                        # Parse media_info tracks, check them against the config if present
-                        for track in media_info.tracks:
-                            track_type = track.track_type
-                            if track_type in extension_media_info_tracks:
-                                # For each required attribute + expected value
-                                for attr, expected_value in extension_media_info_tracks[track_type].items():
-                                    actual_value = getattr(track, attr, "N/A")
-                                    if actual_value != expected_value:
-                                        mismatch_occurred = True
-
-                        # If we found any mismatch, skip copying this file
-                        if mismatch_occurred:
-                            logging.warning(
-                                f"Skipping copying of file '{file_name}' due to media info mismatch. "
-                                f"Last actual_value read: {actual_value}"
-                            )
-                            continue
-                        # --- End Media Info Check ---
+                if file_extension not in selected_destination_folder:
+                    continue
+
+                # --- Media Info Check --- (once per clip: the chapters share one recording's format)
+                mediainfo_start = time.perf_counter()
+                with self.span("mediainfo"):
+                    destination_info = find_destination(first_source_path, first_file_name,
+                                                        selected_destination_folder[file_extension])
+                mediainfo_seconds = time.perf_counter() - mediainfo_start
+                if destination_info is None:
+                    logging.warning(f"Skipping copying of '{first_file_name}': no destination matches its media info.")
+                    continue
+                # --- End Media Info Check ---
+
+                # Build the actual path with date-based subfolder
+                destination_folder = os.path.join(destination_info.get("path"), subfolder_name_with_date)
+                if not os.path.exists(destination_folder):
+                    os.makedirs(destination_folder)
+
+                # Extra targets of the rule (backup folders, an FTP credential) are written from the same read
+                backup_folders = [os.path.join(path, subfolder_name_with_date)
+                                  for path in destination_info.get("backup_paths", [])]
+                for backup_folder in backup_folders:
+                    try:
+                        os.makedirs(backup_folder, exist_ok=True)
+                    except OSError as e:
+                        # Not fatal: the copies to this folder fail and are reported after the copy
+                        logging.error(f"Cannot create backup folder '{backup_folder}': {e}")
+                credential_label = destination_info.get("ftp_credential")
 
-                        # Build the actual path with date-based subfolder
-                        destination_path = os.path.join(destination_path_base, subfolder_name_with_date)
-                        if not os.path.exists(destination_path):
-                            os.makedirs(destination_path)
+                for source_path, file_name, entry, sidecars in chapters:
+                    destination_path = os.path.join(destination_folder, os.path.basename(file_name))
 
-                        destination_path = os.path.join(destination_path, os.path.basename(file_name))
+                    # Files that were ingested before are skipped or hard-linked to their earlier copy
+                    try:
+                        with self.span("catalog"):
+                            fingerprint = entry_fingerprint(entry) if self.catalog is not None else None
+                    except OSError as e:
+                        logging.warning(f"Could not fingerprint '{file_name}': {e}")
+                        fingerprint = None
+                    # (a hard link would not write the rule's backup copies and upload, so those are copied)
+                    linkable = duplicates == "skip" or (duplicates == "hardlink" and not backup_folders
+                                                        and not credential_label)
+                    if fingerprint is not None and linkable and self.catalog.contains(fingerprint):
+                        if self.link_duplicate(fingerprint, entry, file_name, destination_path,
+                                               hardlink=duplicates == "hardlink"):
+                            duplicate_files += 1
+                            continue
 
-                        # If the file already exists, handle overwrite logic
-                        if os.path.exists(destination_path):
+                    # If the file already exists, handle overwrite logic (asked up front, before any copy starts)
+                    if os.path.exists(destination_path):
+                        with self.span("dialog"):
                             overwrite = messagebox.askyesnocancel(
                                 "Bestand bestaat",
                                 f"Het bestand '{file_name}' bestaat al. "
                                 "Wil je het overschrijven?",
                                 default=messagebox.YES
                             )
-                            if overwrite is None:
-                                # User chose "Cancel" => cancel entire copy operation
-                                self.progress_var.set(0)
-                                self.subfolder_entry.config(state="normal")
-                                self.date_picker.config(state="normal")
-                                self.source_dropdown.config(state="normal")
-                                self.destination_dropdown.config(state="normal")
-                                self.copy_button.config(state="normal")
-                                self.is_copying = False
-                                return
-                            elif overwrite:
-                                logging.info(f"User chose to overwrite '{file_name}'.")
-                            else:
-                                # User chose 'No' => skip this file
-                                logging.info(f"User chose NOT to overwrite '{file_name}'.")
-                                continue
-
-                        # Update counters, progress
-                        completed_files += 1
-                        self.root.after(0, self.copied_files_label_var.set,
-                                    f"Kopiëren: {completed_files}/{total_files}")
-                        progress_value = (completed_files / total_files) * 100
-                        self.progress_var.set(progress_value)
-                        self.root.update_idletasks()
-
-                        # Copy the file
-                        shutil.copy2(source_path, destination_path)
-                        logging.info(f"File '{file_name}' copied to '{destination_path}'.")
-
-<<<<<<< HEAD
-                        # If "adjust_time" is True, set the file timestamps to now
-                        if destination_info.get("adjust_time", False):
-                            current_time = time.time()
-                            os.utime(destination_path, (current_time, current_time))
-
-                        # --- Optional File Verification Logic ---
-=======
-                        # --- File Verification Logic ---
->>>>>>> 4ef7c679184ab47df35b991f062579cd2e417278
-                        if perform_hash_check:
-                            # Perform hash check
-                            source_hash = self.calculate_file_hash(source_path)
-                            destination_hash = self.calculate_file_hash(destination_path)
-                            if source_hash == destination_hash:
-                                logging.info(f"Hashes match for file '{file_name}'. Copy successful.")
-                            else:
-                                logging.info(
-                                    f"Hashes do not match for file '{file_name}'. "
-                                    f"Copy may not be successful."
-                                )
-                                self.show_error_message(file_name)
-                        else:
-                            source_size = os.path.getsize(source_path)
-                            destination_size = os.path.getsize(destination_path)
-                            if source_size == destination_size:
-                                logging.info(f"File sizes match for '{file_name}'. Copy successful.")
-                            else:
-                                logging.info(
-                                    f"File sizes do not match for '{file_name}'. "
-                                    f"Copy may not be successful."
-                                )
-                                self.show_error_message(file_name)
+                        if overwrite is None:
+                            # User chose "Cancel" => cancel entire copy operation
+                            self.root.after(0, self.reset_progress)
+                            self.subfolder_entry.config(state="normal")
+                            self.date_picker.config(state="normal")
+                            self.source_dropdown.config(state="normal")
+                            self.destination_dropdown.config(state="normal")
+                            self.copy_button.config(state="normal")
+                            self.is_copying = False
+                            return
+                        elif overwrite:
+                            logging.info(f"User chose to overwrite '{file_name}'.")
                         else:
-                            # Compare file sizes
-                            source_size = os.path.getsize(source_path)
-                            destination_size = os.path.getsize(destination_path)
-                            if source_size == destination_size:
-                                logging.info(f"File sizes match for '{file_name}'. Copy successful.")
-                            else:
-                                logging.info(f"File sizes do not match for '{file_name}'. Copy may not be successful.")
-                                self.show_error_message(file_name)
-                        # --- End of File Verification Logic ---
-
-                        # If we successfully copied to this `destination_info`,
-                        # we can break out of the `for destination_info in destination_info_list` loop
-                        break
+                            # User chose 'No' => skip this file
+                            logging.info(f"User chose NOT to overwrite '{file_name}'.")
+                            continue
+
+                    base_name = os.path.basename(file_name)
+                    copy_tasks.append({
+                        "source": source_path, "destination": destination_path, "name": file_name,
+                        "adjust_time": destination_info.get("adjust_time", False),
+                        "mirrors": [os.path.join(backup_folder, base_name) for backup_folder in backup_folders],
+                        "uploads": [[credential_label, subfolder_name_with_date, base_name]] if credential_label else [],
+                        # The clip's routing cost is attributed to its first chapter
+                        "mediainfo_seconds": mediainfo_seconds if source_path == first_source_path else None,
+                        "fingerprint": fingerprint, "clip_id": camera_clip_id(entry)})
+
+                    # Sidecar files go to the same targets, named after the media file
+                    for sidecar_path, sidecar_file_name in sidecars:
+                        copy_tasks.append({
+                            "source": sidecar_path, "destination": os.path.join(destination_folder, sidecar_file_name),
+                            "name": sidecar_file_name,
+                            "mirrors": [os.path.join(backup_folder, sidecar_file_name) for backup_folder in backup_folders],
+                            "uploads": [[credential_label, subfolder_name_with_date, sidecar_file_name]]
+                            if credential_label else []})
+
+            failures = []  # (name, error) of the files that were not copied
+
+            def on_copy_event(event):
+                if event["event"] == "progress":
+                    self.set_copy_progress(event["bytes"], event["total_bytes"],
+                                           f"Kopiëren: {event['files']}/{event['total_files']}")
+                elif event["event"] == "file" and not event["ok"]:
+                    failures.append((event["name"], event["error"]))
+
+            # Copy and verify on the transfer service (in-process or the worker)
+            job = {"kind": "copy", "metric": "copy", "labels": metric_labels,
+                   "settings": self.copy_settings(self.copy_workers), "tasks": copy_tasks}
+            done = self.run_transfer_job(job, on_copy_event)
+            if done["error"] is not None:
+                raise RuntimeError(done["error"])
+            completed_files, failed_files, copied_bytes = done["completed"], done["failed"], done["bytes"]
+            if self.catalog is not None:
+                threading.Thread(target=self.refresh_ingested_marks, daemon=True).start()
+            if done["failed_targets"]:
+                messagebox.showwarning(
+                    "Extra doelen",
+                    f"{len(done['failed_targets'])} kopie(ën) naar back-up- of FTP-doelen zijn mislukt. Zie het logbestand."
+                )
 
             # Measure the total duration of the copy process
             duration = time.time() - start_time
 
             # Reset GUI controls and show completion message
-            self.progress_var.set(0)
+            self.root.after(0, self.reset_progress)
             self.subfolder_entry.config(state="normal")
             self.date_picker.config(state="normal")
             self.source_dropdown.config(state="normal")
@@ -1108,23 +4750,27 @@ class FileCopyApp:
 
             logging.info(
                 f"Copying {completed_files} file(s) to '{subfolder_name_with_date}' "
-                f"completed in {duration:.2f} seconds."
+                f"completed in {duration:.2f} seconds.",
+                extra={"fields": {"files": completed_files, "failed": failed_files, "bytes": copied_bytes,
+                                  "seconds": round(duration, 3)}}
             )
 
             current_date = datetime.datetime.now().strftime("%d-%m-%Y")
             self.date_picker_var.set(current_date)
 
-<<<<<<< HEAD
-            self.root.after(0, self.copied_files_label_var.set, "Kopiëren: Voltooid")
-            messagebox.showinfo(
-                "Kopiëren voltooid",
-                f"Kopiëren voltooid. {completed_files} bestanden gekopieerd naar '{subfolder_name_with_date}'."
-            )
+            if failed_files:
+                # Not "voltooid": the operator has to know which clips are missing from the project folder
+                self.root.after(0, self.copied_files_label_var.set, "Kopiëren: Mislukt")
+                self.show_copy_failures(failures or [("onbekend", f"{failed_files} bestand(en), zie het logbestand")])
+            else:
+                self.root.after(0, self.copied_files_label_var.set, "Kopiëren: Voltooid")
+                messagebox.showinfo(
+                    "Kopiëren voltooid",
+                    f"Kopiëren voltooid. {completed_files} bestanden gekopieerd naar '{subfolder_name_with_date}'."
+                    + (f" {duplicate_files} eerder geïmporteerde bestanden overgeslagen of gekoppeld." if duplicate_files else "")
+                )
 
             self.is_copying = False
-=======
-            self.is_copying = False            
->>>>>>> 4ef7c679184ab47df35b991f062579cd2e417278
 
         except Exception as e:
             # Handle any exceptions that occur during the copy process
@@ -1133,7 +4779,7 @@ class FileCopyApp:
                 "Fout",
                 f"Er is een fout opgetreden tijdens het kopiëren van de bestanden: {str(e)}"
             )
-            self.progress_var.set(0)
+            self.root.after(0, self.reset_progress)
             self.subfolder_entry.config(state="normal")
             self.date_picker.config(state="normal")
             self.source_dropdown.config(state="normal")
@@ -1143,10 +4789,7 @@ class FileCopyApp:
             self.is_copying = False
 
 
-<<<<<<< HEAD
 
-=======
->>>>>>> 4ef7c679184ab47df35b991f062579cd2e417278
     def initialize_date_picker(self):
         # Get the current time and date
         now = datetime.datetime.now()
@@ -1186,6 +4829,16 @@ class FileCopyApp:
     
         # Log application closure
         logging.info("Application closed by the user.")
+        queued_deliveries = self.service.deliveries.status()
+        if queued_deliveries:
+            logging.info(f"{len(queued_deliveries)} deliveries stay queued and continue when FileMover starts again.")
+
+        if self.enable_thumbnail_view:
+            self.thumbnail_cache.shutdown()
+        self.metrics.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        self.stop_logging()
 
         # If no copy in progress or 'Yes' is selected, close the application
         self.root.destroy()
@@ -1194,8 +4847,33 @@ class FileCopyApp:
         logging.info("GUI closed.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FileMover")
+    parser.add_argument("--profile", choices=JobProfiler.MODES,
+                        help="profile copy, scan and upload jobs; reports are written to the logs folder")
+    parser.add_argument("--worker", action="store_true",
+                        help="run the transfer worker (on worker_address from config.json) instead of the GUI")
+    parser.add_argument("--status", action="store_true", help="list the jobs of the running worker")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        sys.exit()
+    if args.status:
+        with open("config.json", "r") as config_file:
+            worker_address = json.load(config_file).get("worker_address") or "127.0.0.1:8765"
+        worker = WorkerClient(worker_address, token=load_worker_token(worker_token_path("config.json")))
+        for job_status in worker.status():
+            print(f"#{job_status['job']} {job_status['kind']} {job_status['state']}: "
+                  f"{job_status['files']}/{job_status['total_files']} files, "
+                  f"{job_status['bytes'] / 1024 / 1024:.0f}/{job_status['total_bytes'] / 1024 / 1024:.0f} MB")
+        for delivery in worker.deliveries():
+            window = f" ({delivery['window']})" if delivery["window"] else ""
+            print(f"delivery {delivery['id'][:8]} {delivery['priority']} {delivery['state']}{window}: "
+                  f"{delivery['files']} files left to {delivery['server']}/{delivery['directory']}")
+        sys.exit()
+
     root = tk.Tk()
-    app = FileCopyApp(root)
+    app = FileCopyApp(root, profiling_mode=args.profile)
     root.state('zoomed')
     root.iconbitmap('./Icons/arrow.ico')
     root.mainloop()
@@ -0,0 +1,353 @@
+"""Reproducible benchmark for FileMover's ingest engine.
+
+Builds a synthetic card in a temporary folder (many small files, a few huge files and
+GoPro chapter sets), then times the stages of an ingest:
+
+    scan     - walking, sorting, de-duplicating and grouping like update_file_listbox
+    route    - matching every clip against a config.json-style destination mapping
+    copy     - copying every file to its destination and verifying it
+    copy_engine - the same copy + verify through Filemover's CopyEngine (parallel, hash while reading)
+    tee_copy - one read per file written to a destination, a backup folder and a local upload target
+    verify_* - hashing the copy_engine copies again as they are read back for verification: from the
+               page cache ("cached"), after dropping their cached pages ("drop") or with direct reads ("direct")
+    upload   - uploading every file to the in-process FTP stand-in (ftp_standin.py)
+    upload_local - the same delivery through the "local" transport (no server involved)
+
+Results are written as JSON so runs can be compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import Filemover
+from ftp_standin import FTPStandInServer
+
+MB = 1024 * 1024
+
+
+def parse_size(value):
+    # "64K", "256M", "2G" or a plain number of bytes
+    units = {"K": 1024, "M": MB, "G": 1024 * MB}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def write_file(path, size, block):
+    # Repeat a random block: fast to generate and not compressible by the file system
+    with open(path, "wb") as file:
+        remaining = size
+        while remaining > 0:
+            chunk = block[:min(remaining, len(block))]
+            file.write(chunk)
+            remaining -= len(chunk)
+
+
+def build_card(card_folder, args):
+    # Synthetic card layout, returns (file count, total bytes)
+    block = os.urandom(MB)
+    files = []
+
+    # Thousands of small clips spread over camera folders
+    for index in range(args.small_files):
+        folder = os.path.join(card_folder, "DCIM", f"{100 + index // 1000}MEDIA")
+        files.append((os.path.join(folder, f"C{index + 1:04d}.MP4"), args.small_size))
+
+    # A few huge files
+    for index in range(args.huge_files):
+        files.append((os.path.join(card_folder, "XDROOT", "Clip", f"C{index + 1:04d}.MXF"), args.huge_size))
+
+    # GoPro chapter sets: GX01xxxx, GX02xxxx, ... of the same clip
+    for clip in range(args.gopro_clips):
+        for chapter in range(1, args.gopro_chapters + 1):
+            files.append((os.path.join(card_folder, "DCIM", "100GOPRO", f"GX{chapter:02d}{1000 + clip:04d}.MP4"),
+                          args.chapter_size))
+
+    for path, size in files:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, size, block)
+    return len(files), sum(size for _, size in files)
+
+
+def stage_result(seconds, files, size):
+    return {"seconds": round(seconds, 4), "files": files, "bytes": size,
+            "files_per_s": round(files / seconds, 1) if seconds else None,
+            "mb_per_s": round(size / seconds / MB, 2) if seconds and size else None}
+
+
+def bench_scan(card_folder, extensions):
+    parsers = Filemover.build_clip_name_parsers()
+    start = time.perf_counter()
+    entries = Filemover.scan_source_folders([card_folder], extensions)
+    entries.sort(key=lambda entry: Filemover.clip_sort_key(entry, parsers))
+    Filemover.assign_display_names(entries)
+    items = Filemover.group_spanned_clips(entries)
+    seconds = time.perf_counter() - start
+
+    # A second scan reuses the entries (and their parsed sort keys), like a refresh
+    start = time.perf_counter()
+    rescanned = Filemover.scan_source_folders([card_folder], extensions, {entry.id: entry for entry in entries})
+    rescanned.sort(key=lambda entry: Filemover.clip_sort_key(entry, parsers))
+    Filemover.assign_display_names(rescanned)
+    Filemover.group_spanned_clips(rescanned)
+    refresh_seconds = time.perf_counter() - start
+
+    size = sum(entry.size for entry in entries)
+    return items, {"scan": stage_result(seconds, len(entries), size),
+                   "refresh": stage_result(refresh_seconds, len(rescanned), size)}
+
+
+def bench_route(items, mapping, output_folder):
+    # Route every clip; destinations are remapped into the benchmark's output folder
+    routes = []
+    start = time.perf_counter()
+    for item in items:
+        first = item.entries[0]
+        rules = mapping.get(first.ext.lower(), [])
+        destination_info = Filemover.find_destination(first.path, first.display_name, rules) if rules else None
+        if destination_info is None:
+            destination = os.path.join(output_folder, "unrouted")
+        else:
+            destination = os.path.join(output_folder, destination_info["path"].replace(":", "").lstrip("/\\"))
+        routes.append((item, destination))
+    seconds = time.perf_counter() - start
+    return routes, stage_result(seconds, len(items), 0)
+
+
+def bench_copy(routes, verify):
+    copied_files = copied_bytes = 0
+    copy_seconds = hash_seconds = 0.0
+    for item, destination in routes:
+        os.makedirs(destination, exist_ok=True)
+        for entry in item.entries:
+            destination_path = os.path.join(destination, entry.display_name)
+            start = time.perf_counter()
+            shutil.copy2(entry.path, destination_path)
+            copy_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            if verify == "hash":
+                ok = Filemover.file_hash(entry.path) == Filemover.file_hash(destination_path)
+            else:
+                ok = os.path.getsize(entry.path) == os.path.getsize(destination_path)
+            hash_seconds += time.perf_counter() - start
+            if not ok:
+                raise RuntimeError(f"Verification failed for {destination_path}")
+            copied_files += 1
+            copied_bytes += entry.size
+    return {"copy": stage_result(copy_seconds, copied_files, copied_bytes),
+            "verify": stage_result(hash_seconds, copied_files, copied_bytes),
+            "copy_and_verify": stage_result(copy_seconds + hash_seconds, copied_files, copied_bytes)}
+
+
+def deliver(files, transport):
+    # Connect, create the target folder and upload every file, like perform_ftp_upload with one connection
+    start = time.perf_counter()
+    with transport.connect():
+        transport.ensure_directory("upload")
+        for entry in files:
+            with open(entry.path, "rb") as file:
+                transport.upload(file, entry.display_name)
+    return time.perf_counter() - start
+
+
+def create_engine(args):
+    return Filemover.CopyEngine(args.copy_workers, args.verify, block_size=args.buffer_size,
+                                buffer_count=args.buffer_count, verify_read=args.verify_read)
+
+
+def bench_copy_engine(routes, args, output_folder):
+    # Same routes as bench_copy, written under a separate folder so the .part/resume logic starts clean
+    tasks = []
+    for item, destination in routes:
+        destination = os.path.join(output_folder, os.path.relpath(destination, os.path.dirname(output_folder)))
+        os.makedirs(destination, exist_ok=True)
+        tasks.extend(Filemover.CopyTask(entry.path, os.path.join(destination, entry.display_name))
+                     for entry in item.entries)
+    engine = create_engine(args)
+    start = time.perf_counter()
+    results = engine.run(tasks)
+    seconds = time.perf_counter() - start
+    failed = [task.destination for task, result in results if not result.ok]
+    if failed:
+        raise RuntimeError(f"Verification failed for {failed[0]}")
+    return stage_result(seconds, len(results), sum(result.size for _, result in results))
+
+
+def bench_verify_read(output_folder, args):
+    # Read-back cost of each verify_read mode over the same files; "cached" runs first, while the
+    # copies are still in the page cache as they are right after copying
+    paths = [os.path.join(folder, name) for folder, _, names in os.walk(output_folder) for name in names]
+    size = sum(os.path.getsize(path) for path in paths)
+    results = {}
+    for mode in ("cached", "drop", "direct"):
+        start = time.perf_counter()
+        for path in paths:
+            if mode == "cached":
+                Filemover.file_hash(path, block_size=args.buffer_size)
+            else:
+                Filemover.file_hash_uncached(path, block_size=args.buffer_size, mode=mode)
+        results[f"verify_{mode}"] = stage_result(time.perf_counter() - start, len(paths), size)
+    return results
+
+
+def bench_tee_copy(routes, args, output_folder):
+    # Like copy_engine, but every file also goes to a backup folder and the "local" transport
+    os.makedirs(os.path.join(output_folder, "upload"), exist_ok=True)
+    upload_target = Filemover.UploadTarget(
+        "local", lambda: Filemover.LocalTransport(os.path.join(output_folder, "upload")).connect(), "tee")
+    tasks = []
+    for index, (item, _) in enumerate(routes):
+        folders = [os.path.join(output_folder, name, str(index)) for name in ("main", "backup")]
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+        tasks.extend(Filemover.CopyTask(entry.path, os.path.join(folders[0], entry.display_name),
+                                        mirrors=(os.path.join(folders[1], entry.display_name),),
+                                        uploads=((upload_target, f"{index}_{entry.display_name}"),))
+                     for entry in item.entries)
+    engine = create_engine(args)
+    start = time.perf_counter()
+    results = engine.run(tasks)
+    seconds = time.perf_counter() - start
+    upload_target.close()
+    failed = [task.destination for task, result in results if not result.ok or not all(ok for _, ok, _ in result.targets)]
+    if failed:
+        raise RuntimeError(f"Tee copy failed for {failed[0]}")
+    return stage_result(seconds, len(results), sum(result.size for _, result in results))
+
+
+def bench_upload(items, ftp_root):
+    files = [entry for item in items for entry in item.entries]
+    with FTPStandInServer(ftp_root) as server:
+        seconds = deliver(files, Filemover.FTPTransport("127.0.0.1", server.port, "benchmark", "benchmark"))
+    return stage_result(seconds, len(files), sum(entry.size for entry in files))
+
+
+def bench_upload_local(items, delivery_root):
+    files = [entry for item in items for entry in item.entries]
+    os.makedirs(delivery_root, exist_ok=True)
+    seconds = deliver(files, Filemover.LocalTransport(delivery_root))
+    return stage_result(seconds, len(files), sum(entry.size for entry in files))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for stage, result in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old["seconds"] or not result["seconds"]:
+            continue
+        change = (result["seconds"] - old["seconds"]) / old["seconds"] * 100
+        print(f"  {stage:<16}{old['seconds']:>10.3f} s -> {result['seconds']:>10.3f} s  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FileMover's ingest engine on a synthetic card")
+    parser.add_argument("--config", default="config.json", help="config.json providing the destination mapping")
+    parser.add_argument("--destination", help="destination project to route against (default: the first one)")
+    parser.add_argument("--small-files", type=int, default=2000)
+    parser.add_argument("--small-size", type=parse_size, default=parse_size("64K"))
+    parser.add_argument("--huge-files", type=int, default=2)
+    parser.add_argument("--huge-size", type=parse_size, default=parse_size("256M"))
+    parser.add_argument("--gopro-clips", type=int, default=4)
+    parser.add_argument("--gopro-chapters", type=int, default=3)
+    parser.add_argument("--chapter-size", type=parse_size, default=parse_size("32M"))
+    parser.add_argument("--verify", choices=("hash", "size"), default="hash")
+    parser.add_argument("--verify-read", choices=("cached", "drop", "direct"), default="cached",
+                        help="how the copy_engine and tee_copy stages read copies back for the hash check")
+    parser.add_argument("--copy-workers", type=int, default=2, help="parallel copies in the copy_engine stage")
+    parser.add_argument("--buffer-count", type=int, default=8, help="ring buffers per copy worker")
+    parser.add_argument("--buffer-size", type=parse_size, default=parse_size("1M"), help="size of each ring buffer")
+    parser.add_argument("--skip", action="append", default=[],
+                        choices=("route", "copy", "copy_engine", "verify_read", "tee_copy", "upload", "upload_local"),
+                        help="skip a stage (can be repeated)")
+    parser.add_argument("--workdir", help="folder for the synthetic card (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic card and outputs")
+    parser.add_argument("--output", help="JSON results file (default: benchmark_results/benchmark_<time>.json)")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+    destinations = config.get("destination_folders_mapping", {})
+    destination = args.destination or next(iter(destinations), None)
+    mapping = destinations.get(destination, {})
+    extensions = [ext.lower() for ext in config.get("update_file_listbox", [])]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="filemover_bench_")
+    card_folder = os.path.join(workdir, "card")
+    try:
+        print(f"Building synthetic card in {card_folder} ...")
+        file_count, total_bytes = build_card(card_folder, args)
+        print(f"  {file_count} files, {total_bytes / MB:.1f} MB")
+
+        stages = {}
+        items, scan_results = bench_scan(card_folder, extensions)
+        stages.update(scan_results)
+        routes = [(item, os.path.join(workdir, "out", "unrouted")) for item in items]
+        if "route" not in args.skip:
+            routes, stages["route"] = bench_route(items, mapping, os.path.join(workdir, "out"))
+        if "copy" not in args.skip:
+            stages.update(bench_copy(routes, args.verify))
+        if "copy_engine" not in args.skip:
+            stages["copy_engine"] = bench_copy_engine(routes, args, os.path.join(workdir, "out_engine"))
+            if "verify_read" not in args.skip:
+                stages.update(bench_verify_read(os.path.join(workdir, "out_engine"), args))
+        if "tee_copy" not in args.skip:
+            stages["tee_copy"] = bench_tee_copy(routes, args, os.path.join(workdir, "out_tee"))
+        if "upload" not in args.skip:
+            stages["upload"] = bench_upload(items, os.path.join(workdir, "ftp"))
+        if "upload_local" not in args.skip:
+            stages["upload_local"] = bench_upload_local(items, os.path.join(workdir, "delivery"))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "destination": destination,
+        "parameters": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "compare", "keep", "workdir")},
+        "stages": stages,
+    }
+
+    for stage, result in stages.items():
+        rate = f"{result['mb_per_s']:>9.1f} MB/s" if result["mb_per_s"] else f"{result['files_per_s'] or 0:>9.1f} files/s"
+        print(f"{stage:<16}{result['seconds']:>10.3f} s  {result['files']:>7} files  {rate}")
+
+    output = args.output or os.path.join(
+        "benchmark_results", f"benchmark_{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Minimal in-process FTP server used as a stand-in for delivery servers.
+
+Only the commands FileMover's uploads need are implemented (passive mode, binary
+STOR/RETR, directory handling, SIZE and the HASH/XCRC/XMD5/XSHA1/XSHA256 checksum
+commands). AUTH TLS is refused, so FTP_TLS connections
+fall back to plain FTP exactly as they do against a server without TLS.
+
+Usage from Python:
+
+    with FTPStandInServer("/tmp/ftp_root") as server:
+        ftp = ftplib.FTP()
+        ftp.connect("127.0.0.1", server.port)
+
+Or standalone:
+
+    python ftp_standin.py /tmp/ftp_root --port 2121
+"""
+import argparse
+import hashlib
+import os
+import posixpath
+import socket
+import socketserver
+import threading
+import zlib
+
+# HASH algorithm name -> hashlib name; the first one is the default
+HASH_ALGORITHMS = {"SHA-256": "sha256", "SHA-1": "sha1", "MD5": "md5", "CRC32": "crc32"}
+CHECKSUM_COMMANDS = {"XSHA256": "sha256", "XSHA1": "sha1", "XMD5": "md5", "XCRC": "crc32"}
+
+
+def checksum(path, algorithm, block_size):
+    with open(path, "rb") as file:
+        if algorithm == "crc32":
+            value = 0
+            while block := file.read(block_size):
+                value = zlib.crc32(block, value)
+            return f"{value:08X}"
+        digest = hashlib.new(algorithm)
+        while block := file.read(block_size):
+            digest.update(block)
+        return digest.hexdigest()
+
+
+class FTPStandInHandler(socketserver.StreamRequestHandler):
+    # Replies are small writes; without this Nagle + delayed ACK add ~40 ms per command
+    disable_nagle_algorithm = True
+
+    # Commands that are allowed before logging in
+    ANONYMOUS_COMMANDS = ("USER", "PASS", "QUIT", "AUTH", "FEAT", "SYST", "NOOP", "OPTS")
+
+    def handle(self):
+        self.cwd = "/"
+        self.user = None
+        self.authenticated = False
+        self.passive_socket = None
+        self.rename_from = None
+        self.hash_algorithm = next(iter(HASH_ALGORITHMS))
+        self.reply(220, "FileMover FTP stand-in ready")
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+                command = command.upper()
+                handler = getattr(self, "ftp_" + command, None)
+                if handler is None:
+                    self.reply(502, f"Command {command} not implemented")
+                    continue
+                if not self.authenticated and command not in self.ANONYMOUS_COMMANDS:
+                    self.reply(530, "Please log in with USER and PASS")
+                    continue
+                try:
+                    if handler(argument) is False:
+                        break
+                except OSError as e:
+                    self.reply(550, str(e))
+        finally:
+            self.close_passive()
+
+    def reply(self, code, text):
+        self.wfile.write(f"{code} {text}\r\n".encode("utf-8"))
+
+    def virtual_path(self, path):
+        return posixpath.normpath(posixpath.join(self.cwd, path or "."))
+
+    def real_path(self, path):
+        # Map a virtual path onto the server root; normpath keeps ".." from leaving the root
+        parts = [part for part in self.virtual_path(path).split("/") if part and part != ".."]
+        return os.path.join(self.server.root, *parts)
+
+    # --- Session ---
+
+    def ftp_USER(self, argument):
+        self.user = argument
+        self.reply(331, "Password required")
+
+    def ftp_PASS(self, argument):
+        users = self.server.users
+        if users is not None and users.get(self.user) != argument:
+            self.reply(530, "Login incorrect")
+            return
+        self.authenticated = True
+        self.reply(230, "Logged in")
+
+    def ftp_AUTH(self, argument):
+        self.reply(502, "TLS not supported by the stand-in")
+
+    def ftp_SYST(self, argument):
+        self.reply(215, "UNIX Type: L8")
+
+    def ftp_FEAT(self, argument):
+        features = ["SIZE", "PASV", "UTF8"]
+        if self.server.checksums:
+            names = [name + ("*" if name == self.hash_algorithm else "") for name in HASH_ALGORITHMS]
+            features += ["HASH " + ";".join(names), *CHECKSUM_COMMANDS]
+        self.wfile.write(("211-Features:\r\n" + "".join(f" {feature}\r\n" for feature in features)).encode("utf-8"))
+        self.reply(211, "End")
+
+    def ftp_OPTS(self, argument):
+        option, _, value = argument.partition(" ")
+        if option.upper() == "HASH" and self.server.checksums:
+            if value and value.upper() not in HASH_ALGORITHMS:
+                self.reply(504, f"Unknown algorithm {value}")
+                return
+            self.hash_algorithm = value.upper() or self.hash_algorithm
+            self.reply(200, self.hash_algorithm)
+            return
+        self.reply(200, "OK")
+
+    def ftp_NOOP(self, argument):
+        self.reply(200, "OK")
+
+    def ftp_TYPE(self, argument):
+        self.reply(200, f"Type set to {argument}")
+
+    def ftp_QUIT(self, argument):
+        self.reply(221, "Goodbye")
+        return False
+
+    # --- Directories ---
+
+    def ftp_PWD(self, argument):
+        self.reply(257, f'"{self.cwd}" is the current directory')
+
+    def ftp_CWD(self, argument):
+        if not os.path.isdir(self.real_path(argument)):
+            self.reply(550, f"{argument}: No such directory")
+            return
+        self.cwd = self.virtual_path(argument)
+        self.reply(250, f"Directory changed to {self.cwd}")
+
+    def ftp_CDUP(self, argument):
+        self.ftp_CWD("..")
+
+    def ftp_MKD(self, argument):
+        path = self.real_path(argument)
+        if os.path.exists(path):
+            self.reply(550, f"{argument}: Already exists")
+            return
+        os.mkdir(path)
+        self.reply(257, f'"{self.virtual_path(argument)}" created')
+
+    def ftp_RMD(self, argument):
+        os.rmdir(self.real_path(argument))
+        self.reply(250, "Directory removed")
+
+    def ftp_NLST(self, argument):
+        names = sorted(os.listdir(self.real_path(argument)))
+        self.send_data("".join(f"{name}\r\n" for name in names).encode("utf-8"))
+
+    def ftp_LIST(self, argument):
+        lines = []
+        folder = self.real_path(argument if argument and not argument.startswith("-") else "")
+        for name in sorted(os.listdir(folder)):
+            stat = os.stat(os.path.join(folder, name))
+            kind = "d" if os.path.isdir(os.path.join(folder, name)) else "-"
+            lines.append(f"{kind}rw-r--r-- 1 owner group {stat.st_size} Jan 01 00:00 {name}\r\n")
+        self.send_data("".join(lines).encode("utf-8"))
+
+    # --- Files ---
+
+    def ftp_SIZE(self, argument):
+        path = self.real_path(argument)
+        if not os.path.isfile(path):
+            self.reply(550, f"{argument}: No such file")
+            return
+        self.reply(213, str(os.path.getsize(path)))
+
+    def ftp_HASH(self, argument):
+        if not self.server.checksums:
+            self.reply(502, "Command HASH not implemented")
+            return
+        path = self.real_path(argument)
+        if not os.path.isfile(path):
+            self.reply(550, f"{argument}: No such file")
+            return
+        value = checksum(path, HASH_ALGORITHMS[self.hash_algorithm], self.server.block_size)
+        self.reply(213, f"{self.hash_algorithm} 0-{os.path.getsize(path)} {value} {argument}")
+
+    def reply_checksum(self, command, argument):
+        if not self.server.checksums:
+            self.reply(502, f"Command {command} not implemented")
+            return
+        path = self.real_path(argument)
+        if not os.path.isfile(path):
+            self.reply(550, f"{argument}: No such file")
+            return
+        self.reply(250, checksum(path, CHECKSUM_COMMANDS[command], self.server.block_size))
+
+    def ftp_XCRC(self, argument):
+        self.reply_checksum("XCRC", argument)
+
+    def ftp_XMD5(self, argument):
+        self.reply_checksum("XMD5", argument)
+
+    def ftp_XSHA1(self, argument):
+        self.reply_checksum("XSHA1", argument)
+
+    def ftp_XSHA256(self, argument):
+        self.reply_checksum("XSHA256", argument)
+
+    def ftp_DELE(self, argument):
+        os.remove(self.real_path(argument))
+        self.reply(250, "File deleted")
+
+    def ftp_RNFR(self, argument):
+        self.rename_from = self.real_path(argument)
+        self.reply(350, "Ready for RNTO")
+
+    def ftp_RNTO(self, argument):
+        if self.rename_from is None:
+            self.reply(503, "RNFR required first")
+            return
+        os.replace(self.rename_from, self.real_path(argument))
+        self.rename_from = None
+        self.reply(250, "Renamed")
+
+    def ftp_STOR(self, argument):
+        self.receive_file(argument, "wb")
+
+    def ftp_APPE(self, argument):
+        self.receive_file(argument, "ab")
+
+    def ftp_RETR(self, argument):
+        path = self.real_path(argument)
+        if not os.path.isfile(path):
+            self.reply(550, f"{argument}: No such file")
+            return
+        with open(path, "rb") as file:
+            self.send_data(file.read())
+
+    # --- Data connections (passive mode only) ---
+
+    def ftp_PASV(self, argument):
+        self.close_passive()
+        self.passive_socket = socket.create_server((self.server.host, 0))
+        host, port = self.passive_socket.getsockname()[:2]
+        self.reply(227, f"Entering Passive Mode ({host.replace('.', ',')},{port >> 8},{port & 255})")
+
+    def ftp_EPSV(self, argument):
+        self.close_passive()
+        self.passive_socket = socket.create_server((self.server.host, 0))
+        port = self.passive_socket.getsockname()[1]
+        self.reply(229, f"Entering Extended Passive Mode (|||{port}|)")
+
+    def accept_data_connection(self):
+        if self.passive_socket is None:
+            self.reply(425, "Use PASV first")
+            return None
+        self.passive_socket.settimeout(10)
+        try:
+            connection, _ = self.passive_socket.accept()
+        except OSError as e:
+            self.reply(425, f"Can't open data connection: {e}")
+            return None
+        finally:
+            self.close_passive()
+        self.reply(150, "Opening data connection")
+        return connection
+
+    def send_data(self, data):
+        connection = self.accept_data_connection()
+        if connection is None:
+            return
+        with connection:
+            connection.sendall(data)
+        self.reply(226, "Transfer complete")
+
+    def receive_file(self, argument, mode):
+        connection = self.accept_data_connection()
+        if connection is None:
+            return
+        corrupt = self.server.take_corruption()
+        with connection, open(self.real_path(argument), mode) as file:
+            while True:
+                chunk = connection.recv(self.server.block_size)
+                if not chunk:
+                    break
+                if corrupt:  # Flip the first byte, as a flaky link or disk would
+                    chunk = bytes([chunk[0] ^ 0xFF]) + chunk[1:]
+                    corrupt = False
+                file.write(chunk)
+        self.reply(226, "Transfer complete")
+
+    def close_passive(self):
+        if self.passive_socket is not None:
+            self.passive_socket.close()
+            self.passive_socket = None
+
+
+class FTPStandInServer(socketserver.ThreadingTCPServer):
+    """FTP server serving root on host:port (port 0 picks a free port). users=None accepts any login.
+
+    checksums=False hides the checksum commands (a server with SIZE only); corrupt_uploads=n
+    damages the first n uploaded files, to test that FileMover notices and uploads them again.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root, host="127.0.0.1", port=0, users=None, block_size=256 * 1024,
+                 checksums=True, corrupt_uploads=0):
+        self.root = os.path.abspath(root)
+        self.host = host
+        self.users = users
+        self.block_size = block_size
+        self.checksums = checksums
+        self.corrupt_uploads = corrupt_uploads
+        self.corrupt_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        super().__init__((host, port), FTPStandInHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def take_corruption(self):
+        with self.corrupt_lock:
+            if self.corrupt_uploads <= 0:
+                return False
+            self.corrupt_uploads -= 1
+            return True
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the FileMover FTP stand-in server")
+    parser.add_argument("root", help="folder served as the FTP root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2121)
+    parser.add_argument("--user", help="only accept this user (requires --password)")
+    parser.add_argument("--password")
+    parser.add_argument("--no-checksums", action="store_true", help="only offer SIZE, no checksum commands")
+    parser.add_argument("--corrupt-uploads", type=int, default=0, metavar="N", help="damage the first N uploads")
+    args = parser.parse_args()
+
+    users = {args.user: args.password} if args.user else None
+    server = FTPStandInServer(args.root, args.host, args.port, users, checksums=not args.no_checksums,
+                              corrupt_uploads=args.corrupt_uploads)
+    print(f"FTP stand-in serving {server.root} on {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,1094 @@
+import datetime
+import io
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+
+import pytest
+
+import Filemover
+from ftp_standin import FTPStandInServer
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+# --- Configuration ---
+
+def test_shipped_config_is_valid():
+    with open(os.path.join(os.path.dirname(Filemover.__file__), "config.json")) as config_file:
+        assert Filemover.validate_config(json.load(config_file)) == []
+
+
+@pytest.mark.parametrize("config, problem", [
+    ([], "config: expected dict"),
+    ({"source_folders": ["E:/"]}, "source_folders: expected dict"),
+    ({"source_folders": {"Card": [1]}}, "source_folders.Card[0]: expected str"),
+    ({"destination_folders_mapping": {"Project": {".mp4": {"path": "D:/"}}}},
+     "destination_folders_mapping.Project..mp4: expected list"),
+    ({"destination_folders_mapping": {"Project": {".mp4": [{"path": "D:/", "adjust_time": "yes"}]}}},
+     "destination_folders_mapping.Project..mp4[0].adjust_time: expected bool"),
+    ({"update_file_listbox": ".mp4"}, "update_file_listbox: expected list"),
+    ({"copy_workers": "4"}, "copy_workers: expected int"),
+    ({"copy_workers": True}, "copy_workers: expected int"),
+    ({"thumbnail_cache_size_mb": None}, "thumbnail_cache_size_mb: expected int/float"),
+    ({"perform_hash_check": 1}, "perform_hash_check: expected bool"),
+    ({"delivery_windows": {"bulk": 22}}, "delivery_windows.bulk: expected str"),
+    ({"theme": "blue"}, "theme: must be"),
+])
+def test_config_with_wrong_types_is_rejected(config, problem):
+    assert any(error.startswith(problem) for error in Filemover.validate_config(config))
+
+
+def test_config_accepts_numbers_and_null_where_allowed():
+    assert Filemover.validate_config({"copy_rate_limit_mbps": 12.5, "thumbnail_cache_size_mb": 256,
+                                      "metrics_port": None, "worker_address": None}) == []
+
+
+# --- Clip names ---
+
+def entry(path, size=1):
+    return Filemover.FileEntry(path, os.path.basename(path), 0.0, size)
+
+
+@pytest.mark.parametrize("name, scheme, prefix, clip, chapter", [
+    ("GX010042.MP4", "gopro", "GX", 42, 1),
+    ("GX030042.MP4", "gopro", "GX", 42, 3),
+    ("GH020007.MP4", "gopro", "GH", 7, 2),
+    ("GOPR0042.MP4", "gopro_legacy", "GP", 42, 0),
+    ("GP010042.MP4", "gopro", "GP", 42, 1),
+    ("C0001.MP4", "sony", "C", 1, 0),
+    ("C0123M01.XML", "sony", "C", 123, 0),
+    ("MVI_1234.MOV", "canon", "MVI_", 1234, 0),
+    ("DJI_0005.MP4", "dji", "DJI_", 5, 0),
+    ("P1000123.MOV", "panasonic", "P", 1000123, 0),
+    ("interview.mov", None, None, None, None),
+])
+def test_clip_name_parsers(name, scheme, prefix, clip, chapter):
+    file_entry = entry(os.path.join("card", name))
+    Filemover.clip_sort_key(file_entry, Filemover.build_clip_name_parsers())
+    if scheme is None:
+        assert file_entry.clip is None
+        assert file_entry.sort_key == (name.lower(),)
+    else:
+        assert file_entry.clip == Filemover.ClipName(scheme, prefix, clip, chapter)
+
+
+def test_config_pattern_replaces_built_in_scheme():
+    parsers = Filemover.build_clip_name_parsers([{"name": "sony", "pattern": r"^(?P<prefix>A\d{3})C(?P<clip>\d{3})"},
+                                                 {"name": "broken", "pattern": "("}])
+    names = [parser.name for parser in parsers]
+    assert names.count("sony") == 1 and "broken" not in names
+    file_entry = entry("A001C007_230101.MXF")
+    Filemover.clip_sort_key(file_entry, parsers)
+    assert file_entry.clip == Filemover.ClipName("sony", "A001", 7, 0)
+
+
+def test_clip_sort_order():
+    parsers = Filemover.build_clip_name_parsers()
+    # XDCAM cards keep their clips in XDROOT/Clip; the Sony scheme applies there too
+    names = ["GX020042.MP4", "C0010.MP4", os.path.join("XDROOT", "Clip", "C0002.MXF"), "GX010042.MP4",
+             "GOPR0041.MP4", "C0009.MP4", "GX010040.MP4", "B-roll.mov", "a-roll.mov"]
+    entries = [entry(os.path.join("card", name)) for name in names]
+    entries.sort(key=lambda file_entry: Filemover.clip_sort_key(file_entry, parsers))
+    # Clips by prefix, number and chapter (GOPR0041 sorts as GP); other files by lower-cased name
+    assert [file_entry.name for file_entry in entries] == [
+        "C0002.MXF", "C0009.MP4", "C0010.MP4", "GOPR0041.MP4", "GX010040.MP4", "GX010042.MP4", "GX020042.MP4",
+        "a-roll.mov", "B-roll.mov"]
+
+
+def test_clip_sort_key_is_cached_until_the_parsers_change():
+    parsers = Filemover.build_clip_name_parsers()
+    file_entry = entry(os.path.join("card", "GX010042.MP4"))
+    sort_key = Filemover.clip_sort_key(file_entry, parsers)
+    clip = file_entry.clip
+    # A new display name (a duplicate being numbered) does not parse the name again
+    file_entry.display_name = "GX010042_2.MP4"
+    assert Filemover.clip_sort_key(file_entry, parsers) is sort_key
+    assert file_entry.clip is clip
+    # Other parsers (a reloaded config) do
+    new_parsers = Filemover.build_clip_name_parsers([{"name": "gopro", "pattern": r"^(?P<prefix>GX)(?P<clip>\d{6})"}])
+    assert Filemover.clip_sort_key(file_entry, new_parsers) == ("GX", 10042, 0)
+
+
+def test_gopro_chapters_become_one_clip_group():
+    parsers = Filemover.build_clip_name_parsers()
+    names = ["GX020042.MP4", "GX010042.MP4", "C0001.MP4", "GX030042.MP4", "GX010043.MP4", "notes.txt"]
+    entries = [entry(os.path.join("card", name)) for name in names]
+    entries.sort(key=lambda file_entry: Filemover.clip_sort_key(file_entry, parsers))
+    items = Filemover.group_spanned_clips(entries)
+
+    groups = [item for item in items if isinstance(item, Filemover.ClipGroup)]
+    assert len(groups) == 1
+    assert [chapter.name for chapter in groups[0].entries] == ["GX010042.MP4", "GX020042.MP4", "GX030042.MP4"]
+    assert groups[0].id == groups[0].entries[0].id
+    assert [item.name for item in items if not isinstance(item, Filemover.ClipGroup)] == \
+        ["C0001.MP4", "GX010043.MP4", "notes.txt"]
+
+
+def test_chapters_in_other_folders_or_with_the_same_number_stay_separate():
+    parsers = Filemover.build_clip_name_parsers()
+    entries = [entry(os.path.join("card", "A", "GX010042.MP4")), entry(os.path.join("card", "B", "GX020042.MP4")),
+               entry(os.path.join("card", "C", "GX010050.MP4")), entry(os.path.join("card", "D", "GX010050.MP4"))]
+    for file_entry in entries:
+        Filemover.clip_sort_key(file_entry, parsers)
+    assert not any(isinstance(item, Filemover.ClipGroup) for item in Filemover.group_spanned_clips(entries))
+
+
+def test_duplicate_names_get_unique_display_names():
+    entries = [entry(os.path.join("card", folder, "C0001.MP4")) for folder in ("A", "B", "C")]
+    entries.append(entry(os.path.join("card", "A", "C0002.MP4")))
+    Filemover.assign_display_names(entries)
+    assert [file_entry.display_name for file_entry in entries] == \
+        ["C0001.MP4", "C0001_2.MP4", "C0001_3.MP4", "C0002.MP4"]
+    assert [file_entry.name for file_entry in entries] == ["C0001.MP4"] * 3 + ["C0002.MP4"]
+
+
+# --- Sidecars ---
+
+SIDECAR_EXTENSIONS = {".xml", ".thm", ".lrv"}
+
+
+def scan_card(card):
+    # Like a refresh of the file list: scan, link the sidecars, sort and number duplicate names
+    parsers = Filemover.build_clip_name_parsers()
+    entries = Filemover.scan_source_folders([card], {".mp4"} | SIDECAR_EXTENSIONS)
+    media = Filemover.attach_sidecars(entries, SIDECAR_EXTENSIONS)
+    media.sort(key=lambda file_entry: (os.path.dirname(file_entry.id), Filemover.clip_sort_key(file_entry, parsers)))
+    Filemover.assign_display_names(media)
+    return media
+
+
+def make_card(card):
+    for path in ("A/C0001.MP4", "A/C0001M01.XML", "B/C0001.MP4", "B/C0001M01.XML",
+                 "GOPR0042.MP4", "GOPR0042.THM", "GOPR0042.LRV", "GOPR0043.THM"):
+        write(os.path.join(card, path), os.urandom(2048 if path.endswith(".MP4") else 300))
+
+
+def test_sidecars_are_attached_and_renamed_with_their_clip(tmp_path):
+    card = str(tmp_path / "card")
+    make_card(card)
+    media = scan_card(card)
+
+    # The sidecar without a media file (GOPR0043.THM) is left out
+    assert {file_entry.display_name: sorted(Filemover.sidecar_name(sidecar, file_entry)
+                                            for sidecar in file_entry.sidecars) for file_entry in media} == {
+        "C0001.MP4": ["C0001M01.XML"],
+        "C0001_2.MP4": ["C0001_2M01.XML"],
+        "GOPR0042.MP4": ["GOPR0042.LRV", "GOPR0042.THM"],
+    }
+    for file_entry in media:
+        assert all(os.path.dirname(sidecar.path) == os.path.dirname(file_entry.path) for sidecar in file_entry.sidecars)
+
+
+def test_sidecars_are_copied_next_to_their_clip(tmp_path):
+    card, destination = str(tmp_path / "card"), str(tmp_path / "ingest")
+    make_card(card)
+    os.makedirs(destination)
+    tasks = [Filemover.CopyTask(path, os.path.join(destination, name)) for file_entry in scan_card(card)
+             for path, name in [(file_entry.path, file_entry.display_name)] +
+             [(sidecar.path, Filemover.sidecar_name(sidecar, file_entry)) for sidecar in file_entry.sidecars]]
+    # Files up to 1 KB (the sidecars here) go through the small-file workers
+    engine = Filemover.CopyEngine(small_file_size=1024, small_file_workers=2)
+    assert sum(engine.is_small(task) for task in tasks) == 4
+    results = engine.run(tasks)
+
+    assert all(result.ok for _, result in results)
+    assert sorted(os.listdir(destination)) == ["C0001.MP4", "C0001M01.XML", "C0001_2.MP4", "C0001_2M01.XML",
+                                               "GOPR0042.LRV", "GOPR0042.MP4", "GOPR0042.THM"]
+    for task in tasks:
+        with open(task.source, "rb") as source_file, open(task.destination, "rb") as copy:
+            assert source_file.read() == copy.read()
+
+
+@pytest.mark.parametrize("archive", [False, True])
+def test_sidecars_are_uploaded_with_their_clip(tmp_path, archive):
+    card = str(tmp_path / "card")
+    make_card(card)
+    files = [[path, name, sidecar] for file_entry in scan_card(card)
+             for path, name, sidecar in [(file_entry.path, file_entry.display_name, False)] +
+             [(sidecar.path, Filemover.sidecar_name(sidecar, file_entry), True) for sidecar in file_entry.sidecars]]
+    service = Filemover.IngestService(Filemover.MetricsRegistry(None))
+    with FTPStandInServer(str(tmp_path / "ftp")) as server:
+        done = service.run({"kind": "upload", "server": f"127.0.0.1:{server.port}", "username": "user",
+                            "password": "password", "directory": "clips", "files": files,
+                            "settings": dict(Filemover.CredentialStore.DEFAULT_SETTINGS, protocol="ftp",
+                                             pool_size=2, small_file_kb=1),
+                            "archive": "clips_sidecars.tar" if archive else None})
+    assert done["error"] is None and done["failed"] == 0
+    uploaded = sorted(os.listdir(str(tmp_path / "ftp" / "clips")))
+    media_names = ["C0001.MP4", "C0001_2.MP4", "GOPR0042.MP4"]
+    if archive:
+        # The sidecars travel packed in one archive, under the names they get next to their clip
+        assert uploaded == sorted(media_names + ["clips_sidecars.tar"])
+        with tarfile.open(str(tmp_path / "ftp" / "clips" / "clips_sidecars.tar")) as tar:
+            assert sorted(tar.getnames()) == ["C0001M01.XML", "C0001_2M01.XML", "GOPR0042.LRV", "GOPR0042.THM"]
+    else:
+        assert uploaded == sorted(media_names + ["C0001M01.XML", "C0001_2M01.XML", "GOPR0042.LRV", "GOPR0042.THM"])
+
+
+# --- Ingest catalog ---
+
+def test_catalog_hit_with_deleted_copy_is_copied_again(tmp_path):
+    source = write(str(tmp_path / "card" / "C0001.MP4"), os.urandom(300 * 1024))
+    earlier_copy = write(str(tmp_path / "ingest" / "C0001.MP4"), open(source, "rb").read())
+    catalog = Filemover.IngestCatalog(str(tmp_path / "catalog.sqlite"))
+    fingerprint = Filemover.file_fingerprint(source, os.path.getsize(source))
+    catalog.record(fingerprint, os.path.getsize(source), None, "C0001.MP4", source, earlier_copy)
+
+    assert catalog.verified_copy(fingerprint, source) == earlier_copy
+    os.remove(earlier_copy)
+    assert catalog.contains(fingerprint)
+    assert catalog.verified_copy(fingerprint, source) is None
+    catalog.close()
+
+
+def test_catalog_fingerprint_collision_is_not_a_duplicate(tmp_path):
+    # Same size, head and tail: only the middle differs, which the fingerprint does not sample
+    head, tail = os.urandom(64 * 1024), os.urandom(64 * 1024)
+    earlier_copy = write(str(tmp_path / "ingest" / "C0001.MP4"), head + b"a" * 200 * 1024 + tail)
+    source = write(str(tmp_path / "card" / "C0001.MP4"), head + b"b" * 200 * 1024 + tail)
+    fingerprint = Filemover.file_fingerprint(source, os.path.getsize(source))
+    assert fingerprint == Filemover.file_fingerprint(earlier_copy, os.path.getsize(earlier_copy))
+
+    catalog = Filemover.IngestCatalog(str(tmp_path / "catalog.sqlite"))
+    catalog.record(fingerprint, os.path.getsize(source), None, "C0001.MP4", earlier_copy, earlier_copy)
+    assert catalog.verified_copy(fingerprint, source) is None
+    catalog.close()
+
+
+# --- UI tick ---
+
+class FakeRoot:
+    def __init__(self):
+        self.pending = []
+
+    def after(self, milliseconds, callback):
+        self.pending.append((milliseconds, callback))
+        return f"after#{len(self.pending)}"
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for _, callback in pending:
+            callback()
+
+
+class FakeVar:
+    def __init__(self, value=None):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+
+class FakePlayer:
+    playing = False
+
+    def is_playing(self):
+        return self.playing
+
+
+def ticking_app():
+    # Just the state the UI tick reads; the refresh passes that need Tk widgets are no-ops
+    app = Filemover.FileCopyApp.__new__(Filemover.FileCopyApp)
+    app.root, app.player = FakeRoot(), FakePlayer()
+    app.ui_tick_after_id, app.ui_tick_interval_ms = None, 100
+    app.preview_loading, app.copy_progress = False, None
+    app.progress_var, app.copied_files_label_var = FakeVar(0), FakeVar("")
+    app.update_time_labels = app.update_scrub_bar = app.update_preview_throttle = lambda: None
+    return app
+
+
+def test_schedule_ui_tick_keeps_one_tick_pending():
+    app = ticking_app()
+    app.schedule_ui_tick()
+    app.schedule_ui_tick()
+
+    assert app.root.pending == [(100, app.ui_tick)]
+    assert app.ui_tick_after_id == "after#1"
+
+
+def test_ui_tick_runs_while_busy_and_stops_when_idle():
+    app = ticking_app()
+    app.player.playing = True
+    app.schedule_ui_tick()
+    app.root.run_pending()
+    assert len(app.root.pending) == 1  # Rescheduled while playing
+
+    # Progress from a transfer thread is applied by the next tick
+    app.player.playing = False
+    app.set_copy_progress(3, 4, "Kopiëren: 3/4")
+    app.root.run_pending()
+    assert (app.progress_var.value, app.copied_files_label_var.value) == (75, "Kopiëren: 3/4")
+    assert len(app.root.pending) == 1  # Still copying
+
+    app.copy_progress = None
+    app.root.run_pending()
+    assert app.root.pending == [] and app.ui_tick_after_id is None
+
+    app.preview_loading = True
+    app.schedule_ui_tick()
+    app.root.run_pending()
+    assert len(app.root.pending) == 1
+
+
+# --- File list ---
+
+def file_list(ids):
+    # The row bookkeeping of VirtualFileList without a Tk window; drawing is a no-op
+    rows = Filemover.VirtualFileList.__new__(Filemover.VirtualFileList)
+    rows.ids, rows.texts, rows.index = [], [], {}
+    rows.selected, rows.anchor, rows.active, rows.top = set(), None, None, 0
+    rows.redraw = rows.changed = lambda: None
+    rows.max_top = lambda: 0
+    rows.set_items(ids, [f"text {item_id}" for item_id in ids])
+    return rows
+
+
+def test_file_list_selection_survives_a_resort():
+    ids = ["a", "b", "c", "d", "e"]
+    rows = file_list(ids)
+    rows.select(["d", "b"])
+    assert rows.selection() == ["b", "d"]
+    assert rows.active == 3
+
+    rows.set_items(ids[::-1], [f"text {item_id}" for item_id in ids[::-1]])
+    assert rows.selection() == ["d", "b"]  # Display order after the re-sort
+    assert rows.ids[rows.active] == "d" and rows.anchor == rows.active
+    assert rows.texts[rows.index["b"]] == "text b"
+
+    # A shift-selection after the re-sort spans the new display order
+    rows.select_range(rows.index["a"])
+    assert rows.selection() == ["d", "c", "b", "a"]
+
+
+def test_file_list_drops_ids_that_disappear():
+    rows = file_list(["a", "b", "c"])
+    rows.select(["c", "a", "x"])
+    assert rows.selection() == ["a", "c"]
+
+    rows.set_items(["a", "b"], ["text a", "text b"])
+    assert rows.selection() == ["a"]
+    assert rows.active is None and rows.anchor is None  # The cursor was on "c"
+
+    rows.set_items([], [])
+    assert rows.selection() == [] and rows.size() == 0
+
+
+# --- Logging ---
+
+def log_record(message, fields=None):
+    record = logging.LogRecord("filemover", logging.INFO, __file__, 1, message, None, None)
+    if fields is not None:
+        record.fields = fields
+    return record
+
+
+def test_structured_formatter_appends_fields_as_json():
+    formatter = Filemover.StructuredFormatter("%(levelname)s - %(message)s")
+    line = formatter.format(log_record("Kopiëren voltooid", {
+        "job": "a1b2", "files": 3, "ok": True, "destination": 'D:\\Project "Zee"', "bron": "Kaart é",
+    }))
+
+    message, fields = line.split(" | ")
+    assert message == "INFO - Kopiëren voltooid"
+    assert fields.split(" ")[:3] == ['job="a1b2"', "files=3", "ok=true"]
+    assert 'destination="D:\\\\Project \\"Zee\\""' in fields
+    assert fields.endswith('bron="Kaart é"')  # Not escaped to \u00e9
+
+
+def test_structured_formatter_without_fields():
+    formatter = Filemover.StructuredFormatter("%(message)s")
+
+    assert formatter.format(log_record("Gestart")) == "Gestart"
+    assert formatter.format(log_record("Gestart", {})) == "Gestart"
+
+
+def test_structured_fields_survive_the_log_queue():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(Filemover.StructuredFormatter("%(asctime)s - %(levelname)s - %(message)s"))
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    logger = logging.getLogger("filemover.test_queue")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    listener.start()
+    try:
+        logger.info("Bestand %s gekopieerd", "C0001.MP4", extra={"fields": {"bytes": 1024, "name": "C0001.MP4"}})
+    finally:
+        listener.stop()
+        logger.removeHandler(queue_handler)
+
+    line = stream.getvalue().strip()
+    assert " - INFO - Bestand C0001.MP4 gekopieerd | " in line
+    assert line.endswith('bytes=1024 name="C0001.MP4"')
+
+
+# --- Poster frames ---
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    # Writes a 100-byte "poster frame" to its last argument, like ffmpeg writes its output file
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!{sys.executable}\nimport sys\nopen(sys.argv[-1], 'wb').write(b'P' * 100)\n")
+    script.chmod(0o755)
+    return str(script)
+
+
+def request_poster(cache, path):
+    done = threading.Event()
+    results = []
+
+    def callback(cached_path):
+        results.append(cached_path)
+        done.set()
+
+    cache.request(path, callback)
+    assert done.wait(10)
+    return results[0]
+
+
+def test_thumbnail_cache_name_follows_size_mtime_and_width(tmp_path):
+    video = write(str(tmp_path / "C0001.MP4"), b"x" * 10)
+    cache = Filemover.ThumbnailCache(str(tmp_path / "cache"), 1024, width=160, ffmpeg_path="no-such-ffmpeg")
+    try:
+        name = cache.cache_name(video)
+        assert name == cache.cache_name(video)
+
+        cache.width = 320
+        assert cache.cache_name(video) != name
+        cache.width = 160
+
+        write(video, b"y" * 10)
+        os.utime(video, ns=(1_000_000_000, 1_000_000_000))
+        same_size = cache.cache_name(video)
+        os.utime(video, ns=(2_000_000_000, 2_000_000_000))
+        assert cache.cache_name(video) != same_size
+
+        write(video, b"y" * 11)
+        os.utime(video, ns=(2_000_000_000, 2_000_000_000))
+        assert cache.cache_name(video) != same_size
+    finally:
+        cache.shutdown()
+
+
+def test_thumbnail_cache_hit_and_invalidation(tmp_path, fake_ffmpeg):
+    video = write(str(tmp_path / "C0001.MP4"), b"x" * 10)
+    cache = Filemover.ThumbnailCache(str(tmp_path / "cache"), 1024, ffmpeg_path=fake_ffmpeg)
+    try:
+        assert cache.lookup(video) is None
+        cached_path = request_poster(cache, video)
+        assert os.path.getsize(cached_path) == 100
+        assert cache.lookup(video) == cached_path
+        assert cache.total_bytes == 100
+
+        # A changed file is a new key: the old poster frame is no longer served
+        write(video, b"changed")
+        assert cache.lookup(video) is None
+        assert request_poster(cache, video) not in (None, cached_path)
+    finally:
+        cache.shutdown()
+
+    # A new cache over the same folder rebuilds its index from disk
+    reopened = Filemover.ThumbnailCache(str(tmp_path / "cache"), 1024, ffmpeg_path="no-such-ffmpeg")
+    try:
+        assert reopened.lookup(video) is not None
+        assert request_poster(reopened, write(str(tmp_path / "C0002.MP4"), b"z")) is None
+    finally:
+        reopened.shutdown()
+
+
+def test_thumbnail_cache_evicts_least_recently_used(tmp_path, fake_ffmpeg):
+    videos = [write(str(tmp_path / f"C000{n}.MP4"), b"x" * n) for n in range(1, 4)]
+    cache = Filemover.ThumbnailCache(str(tmp_path / "cache"), 250, ffmpeg_path=fake_ffmpeg)
+    try:
+        first = request_poster(cache, videos[0])
+        second = request_poster(cache, videos[1])
+        assert cache.lookup(videos[0]) == first  # Now the most recently used
+        request_poster(cache, videos[2])
+
+        assert cache.total_bytes == 200
+        assert cache.lookup(videos[1]) is None and not os.path.exists(second)
+        assert cache.lookup(videos[0]) == first
+        assert sorted(os.listdir(str(tmp_path / "cache"))) == sorted(cache.index)
+    finally:
+        cache.shutdown()
+
+
+# --- Metrics ---
+
+def test_metrics_render_prometheus_text():
+    metrics = Filemover.MetricsRegistry(None)
+    labels = {"source": 'Card "A"\\B\nC', "destination": "Project"}
+    metrics.observe_file("copy", labels, "C0001.MP4", 10 * 1024 * 1024, 2.0)
+    metrics.observe_file("copy", labels, "C0002.MP4", 1024, 0.02, ok=False)
+    lines = metrics.render().splitlines()
+
+    assert "# HELP filemover_files_total Files transferred, by status." in lines
+    assert "# TYPE filemover_files_total counter" in lines
+    assert "# TYPE filemover_file_seconds histogram" in lines
+    # Label values are escaped and label names sorted
+    escaped = 'destination="Project",kind="copy",source="Card \\"A\\"\\\\B\\nC"'
+    assert f'filemover_files_total{{{escaped},status="ok"}} 1' in lines
+    assert f'filemover_files_total{{{escaped},status="failed"}} 1' in lines
+    assert f"filemover_bytes_total{{{escaped}}} {10 * 1024 * 1024 + 1024}" in lines
+    # Histogram buckets are cumulative, end in +Inf and come with a sum and count
+    buckets = [line for line in lines if line.startswith("filemover_file_seconds_bucket")]
+    assert len(buckets) == len(Filemover.MetricsRegistry.SECONDS_BUCKETS) + 1
+    assert f'filemover_file_seconds_bucket{{{escaped},le="0.01"}} 0' in lines
+    assert f'filemover_file_seconds_bucket{{{escaped},le="0.05"}} 1' in lines
+    assert f'filemover_file_seconds_bucket{{{escaped},le="2.5"}} 2' in lines
+    assert f'filemover_file_seconds_bucket{{{escaped},le="+Inf"}} 2' in lines
+    assert f"filemover_file_seconds_sum{{{escaped}}} 2.02" in lines
+    assert f"filemover_file_seconds_count{{{escaped}}} 2" in lines
+    # Metrics without observations are left out
+    assert not any("filemover_jobs_total" in line for line in lines)
+
+
+def test_metrics_jsonl_records_a_finished_job(tmp_path):
+    source = write(str(tmp_path / "card" / "C0001.MP4"), os.urandom(100 * 1024))
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    os.makedirs(os.path.dirname(destination))
+    jsonl_path = str(tmp_path / "metrics.jsonl")
+    metrics = Filemover.MetricsRegistry(jsonl_path)
+    service = Filemover.IngestService(metrics)
+    done = service.run({"kind": "copy", "metric": "copy", "labels": {"source": "Card", "destination": "Project"},
+                        "settings": {}, "tasks": [{"source": source, "destination": destination,
+                                                   "name": "C0001.MP4"}]})
+    metrics.close()
+    assert done["error"] is None and done["completed"] == 1
+
+    with open(jsonl_path, encoding="utf-8") as jsonl_file:
+        records = [json.loads(line) for line in jsonl_file]
+    assert [record["event"] for record in records] == ["file", "job"]
+    assert records[0]["file"] == "C0001.MP4" and records[0]["ok"] is True
+    job = records[1]
+    assert {key: job[key] for key in ("kind", "source", "destination", "files", "failed", "bytes")} == \
+        {"kind": "copy", "source": "Card", "destination": "Project", "files": 1, "failed": 0, "bytes": 100 * 1024}
+    assert job["seconds"] >= 0 and "mb_per_s" in job
+    datetime.datetime.fromisoformat(job["time"])
+
+
+# --- FTP credentials ---
+
+class StubFernet:
+    # Stands in for cryptography's Fernet: a reversible "encryption" tied to the key
+    def __init__(self, key):
+        self.key = key
+
+    @staticmethod
+    def generate_key():
+        return b"stub-key-" + os.urandom(4).hex().encode()
+
+    def encrypt(self, data):
+        return self.key + b":" + data[::-1]
+
+    def decrypt(self, token):
+        key, _, data = token.partition(b":")
+        if key != self.key:
+            raise ValueError("wrong key")
+        return data[::-1]
+
+
+@pytest.fixture
+def credential_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(Filemover, "Fernet", StubFernet)
+    return str(tmp_path / "ftp_credentials.json"), str(tmp_path / "secret.key")
+
+
+def test_credentials_round_trip(credential_paths):
+    store = Filemover.CredentialStore(*credential_paths)
+    assert store.put("ftp.example.com/uploads", "editor", "geheim", pool_size=4) == 0
+    assert store.put("sftp.example.com", "ingest", "wachtwoord", protocol="sftp") == 1
+    assert store.put("ftp.example.com/uploads", "editor", "nieuw") == 0  # Same server and user: updated
+
+    with open(credential_paths[0]) as credentials_file:
+        assert "geheim" not in credentials_file.read()
+    reloaded = Filemover.CredentialStore(*credential_paths)  # Reuses the key written by the first store
+    assert reloaded.labels() == ["editor@ftp.example.com/uploads", "ingest@sftp.example.com"]
+    assert reloaded.get(0)["password"] == "nieuw"
+    assert reloaded.find("ingest@sftp.example.com")["password"] == "wachtwoord"
+    assert reloaded.find("unknown@example.com") is None
+    assert reloaded.settings("ftp.example.com/uploads", "editor") == \
+        dict(Filemover.CredentialStore.DEFAULT_SETTINGS, pool_size=4)
+    assert reloaded.settings("sftp.example.com", "ingest")["protocol"] == "sftp"
+
+
+def test_credentials_save_is_atomic(credential_paths, monkeypatch):
+    store = Filemover.CredentialStore(*credential_paths)
+    store.put("ftp.example.com", "editor", "geheim")
+    with open(credential_paths[0]) as credentials_file:
+        saved = credentials_file.read()
+
+    def failing_replace(source, destination):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Filemover.os, "replace", failing_replace)
+        with pytest.raises(OSError):
+            store.put("ftp2.example.com", "editor", "geheim")
+
+    # The file on disk is still the complete previous version
+    with open(credential_paths[0]) as credentials_file:
+        assert credentials_file.read() == saved
+    assert Filemover.CredentialStore(*credential_paths).labels() == ["editor@ftp.example.com"]
+
+
+def test_credentials_remove_writes_through(credential_paths):
+    store = Filemover.CredentialStore(*credential_paths)
+    store.put("ftp.example.com", "editor", "geheim")
+    store.put("ftp.example.com", "assistant", "geheim")
+    store.remove(0)
+    assert Filemover.CredentialStore(*credential_paths).labels() == ["assistant@ftp.example.com"]
+
+
+# --- Job profiler ---
+
+def test_job_profiler_spans_nest_and_count():
+    profiler = Filemover.JobProfiler("copy", "spans", None)
+    profiler.start()
+    with profiler.span("copy"):
+        with profiler.span("hash"):
+            time.sleep(0.02)
+        with profiler.span("hash"):
+            pass
+    with pytest.raises(ValueError):
+        with profiler.span("flush"):
+            raise ValueError("a failing stage is still timed")
+    profiler.stop()
+
+    assert {stage: count for stage, (_, count) in profiler.stages.items()} == {"copy": 1, "hash": 2, "flush": 1}
+    assert profiler.stages["copy"][0] >= profiler.stages["hash"][0] >= 0.02
+    assert profiler.wall_time >= profiler.stages["copy"][0]
+
+
+def test_job_profiler_spans_from_worker_threads(tmp_path):
+    profiler = Filemover.JobProfiler("copy", "sample", str(tmp_path), sample_interval=0.001)
+    profiler.start()
+
+    finished = threading.Barrier(4)
+
+    def worker():
+        for _ in range(200):
+            with profiler.span("copy"):
+                sum(range(2000))
+        finished.wait()  # Keep the threads (and their ids) alive until all are done
+
+    threads = [threading.Thread(target=worker, name=f"copy_{n}") for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.stop()
+    profiler.write_report()
+
+    # No span lost to concurrent updates, and the workers were sampled under their own names
+    assert profiler.stages["copy"][1] == 800
+    assert len(profiler.threads) == 5
+    assert any(stack.startswith("copy_") for stack in profiler.samples)
+    assert sorted(name.rsplit(".", 1)[1] for name in os.listdir(str(tmp_path))) == ["folded", "txt"]
+
+
+def test_job_profiler_cprofile_covers_worker_threads(tmp_path):
+    profiler = Filemover.JobProfiler("copy", "cprofile", str(tmp_path))
+    profiler.start()
+
+    def first_worker_function():
+        return sum(range(20000))
+
+    def second_worker_function():
+        return sum(range(20000))
+
+    # One after the other, so the second thread may well get the id of the first
+    for function in (first_worker_function, second_worker_function):
+        def worker():
+            with profiler.span("hash"):
+                function()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    profiler.stop()
+    profiler.write_report()
+
+    report_name = next(name for name in os.listdir(str(tmp_path)) if name.endswith(".txt"))
+    with open(os.path.join(str(tmp_path), report_name), encoding="utf-8") as report_file:
+        report = report_file.read()
+    assert "first_worker_function" in report and "second_worker_function" in report
+
+
+# --- Worker API ---
+
+def test_worker_requires_token_and_loopback(tmp_path):
+    service = Filemover.IngestService(Filemover.MetricsRegistry(None))
+    with pytest.raises(ValueError):
+        Filemover.WorkerServer(("0.0.0.0", 0), service, "secret")
+    token = Filemover.load_worker_token(str(tmp_path / "worker.key"))
+    assert token == Filemover.load_worker_token(str(tmp_path / "worker.key"))
+    with Filemover.WorkerServer(("127.0.0.1", 0), service, token) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = f"127.0.0.1:{server.server_address[1]}"
+        assert Filemover.WorkerClient(address, token=token).status() == []
+        with pytest.raises(PermissionError):
+            Filemover.WorkerClient(address, token="wrong").status()
+        server.shutdown()
+    assert Filemover.validate_config({"worker_address": "192.168.1.10:8765"})
+    assert not Filemover.validate_config({"worker_address": "127.0.0.1:8765"})
+
+
+# --- Copy engine ---
+
+@pytest.mark.parametrize("tail_matches", [True, False])
+def test_copy_resumes_only_from_part_with_matching_tail(tmp_path, tail_matches):
+    data = os.urandom(2 * 1024 * 1024 + 5)
+    source = write(str(tmp_path / "card" / "C0001.MP4"), data)
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    partial = bytearray(data[:1024 * 1024 + 3])
+    if not tail_matches:
+        partial[-1] ^= 0xFF
+    part_path = write(destination + Filemover.CopyEngine.PART_SUFFIX, bytes(partial))
+
+    engine = Filemover.CopyEngine(block_size=256 * 1024)
+    assert engine.resume_offset(source, part_path) == (len(partial) if tail_matches else 0)
+    result = engine.copy_file(source, destination)
+    assert result.ok
+    assert result.resumed == tail_matches
+    assert not os.path.exists(part_path)
+    with open(destination, "rb") as file:
+        assert file.read() == data
+
+
+def test_copy_larger_than_the_ring_is_exact(tmp_path):
+    data = os.urandom(1024 * 1024 + 7)
+    source = write(str(tmp_path / "card" / "C0001.MP4"), data)
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    mirrors = [str(tmp_path / "backup1" / "C0001.MP4"), str(tmp_path / "backup2" / "C0001.MP4")]
+    for path in [destination] + mirrors:
+        os.makedirs(os.path.dirname(path))
+    # 3 buffers of 64 KB: the file passes through the ring more than five times over
+    engine = Filemover.CopyEngine(block_size=64 * 1024, buffer_count=3)
+    result = engine.copy_file(source, destination, mirrors=mirrors)
+
+    assert result.ok and [ok for _, ok, _ in result.targets] == [True, True]
+    for path in [destination] + mirrors:
+        with open(path, "rb") as file:
+            assert file.read() == data
+    assert engine.rings.ring.free.qsize() == 3  # Every buffer went back to the ring
+
+
+def test_fan_out_drops_a_failing_sink():
+    ring = Filemover.BufferRing(2, 16)
+    written = []
+    writes_to_bad = []
+
+    def bad(view):
+        writes_to_bad.append(bytes(view))
+        if len(writes_to_bad) == 3:
+            raise OSError("disk full")
+
+    fan_out = Filemover.FanOut({"good": lambda view: written.append(bytes(view)), "bad": bad}, ring)
+    blocks = [os.urandom(16) for _ in range(10)]
+    for block in blocks:
+        buffer = ring.acquire()
+        buffer[:len(block)] = block
+        fan_out.write(buffer, len(block))
+    errors = fan_out.close()
+
+    assert written == blocks
+    assert list(errors) == ["bad"] and isinstance(errors["bad"], OSError)
+    assert len(writes_to_bad) == 3  # Not written to after it failed
+    assert ring.free.qsize() == 2
+
+
+def test_failing_mirror_does_not_break_the_copy(tmp_path):
+    data = os.urandom(512 * 1024)
+    source = write(str(tmp_path / "card" / "C0001.MP4"), data)
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    os.makedirs(os.path.dirname(destination))
+    good_mirror = str(tmp_path / "ingest" / "C0001_backup.MP4")
+    bad_mirror = str(tmp_path / "missing" / "C0001.MP4")  # Its folder does not exist
+    result = Filemover.CopyEngine(block_size=64 * 1024).copy_file(source, destination,
+                                                                  mirrors=[bad_mirror, good_mirror])
+
+    assert result.ok
+    assert [(label, ok) for label, ok, _ in result.targets] == [(bad_mirror, False), (good_mirror, True)]
+    assert isinstance(result.targets[0][2], OSError)
+    with open(destination, "rb") as file:
+        assert file.read() == data
+    assert not os.path.exists(bad_mirror + Filemover.CopyEngine.PART_SUFFIX)
+
+
+@pytest.mark.parametrize("size", [0, 1, 4095, 1024 * 1024 + 13])
+@pytest.mark.parametrize("mode", ["drop", "direct"])
+def test_uncached_hash_matches_file_hash(tmp_path, mode, size):
+    path = write(str(tmp_path / "C0001.MP4"), os.urandom(size))
+    assert Filemover.file_hash_uncached(path, "sha256", 64 * 1024, mode) == Filemover.file_hash(path, "sha256")
+
+
+def test_direct_hash_falls_back_when_direct_reads_are_unsupported(tmp_path, monkeypatch):
+    path = write(str(tmp_path / "C0001.MP4"), os.urandom(200 * 1024))
+
+    def unsupported(file_path, block_size, consume):
+        raise OSError(22, "Invalid argument")  # What O_DIRECT gives on e.g. tmpfs
+
+    monkeypatch.setattr(Filemover, "read_direct", unsupported)
+    assert Filemover.file_hash_uncached(path, mode="direct") == Filemover.file_hash(path)
+
+
+def test_direct_hash_does_not_hide_a_read_error(tmp_path, monkeypatch):
+    path = write(str(tmp_path / "C0001.MP4"), os.urandom(200 * 1024))
+
+    def failing_halfway(file_path, block_size, consume):
+        consume(b"\0" * block_size)
+        raise OSError(5, "Input/output error")
+
+    monkeypatch.setattr(Filemover, "read_direct", failing_halfway)
+    with pytest.raises(OSError):
+        Filemover.file_hash_uncached(path, mode="direct")
+
+
+@pytest.mark.parametrize("verify_read", ["cached", "drop", "direct"])
+def test_copy_verifies_with_each_verify_read_mode(tmp_path, verify_read):
+    data = os.urandom(700 * 1024)
+    source = write(str(tmp_path / "card" / "C0001.MP4"), data)
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    mirror = str(tmp_path / "backup" / "C0001.MP4")
+    os.makedirs(os.path.dirname(destination))
+    os.makedirs(os.path.dirname(mirror))
+    engine = Filemover.CopyEngine(block_size=256 * 1024, verify_read=verify_read)
+    result = engine.copy_file(source, destination, mirrors=[mirror])
+    assert result.ok and result.targets[0][1]
+    assert result.hash_seconds is not None
+    with open(destination, "rb") as file:
+        assert file.read() == data
+
+
+@pytest.mark.parametrize("corrupt_uploads, upload_ok", [(0, True), (1, False)])
+def test_tee_copy_verifies_upload_on_server(tmp_path, corrupt_uploads, upload_ok):
+    source = write(str(tmp_path / "card" / "C0001.MP4"), os.urandom(3 * 1024 * 1024 + 17))
+    destination = str(tmp_path / "ingest" / "C0001.MP4")
+    os.makedirs(os.path.dirname(destination))
+    with FTPStandInServer(str(tmp_path / "ftp"), corrupt_uploads=corrupt_uploads) as server:
+        target = Filemover.UploadTarget("ftp", lambda: Filemover.connect_transport(
+            "ftp", "127.0.0.1", server.port, "user", "password"), "clips")
+        result = Filemover.CopyEngine(block_size=256 * 1024).copy_file(source, destination,
+                                                                       uploads=[(target, "C0001.MP4")])
+        target.close()
+    assert result.ok
+    assert [ok for _, ok, _ in result.targets] == [upload_ok]
+
+
+# --- Transfer limits ---
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        seconds = max(seconds, 0.001)  # Like a real sleep, which always takes some time
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(Filemover, "time", fake_clock)
+    return fake_clock
+
+
+def test_token_bucket_without_rate_is_unlimited(clock):
+    bucket = Filemover.TokenBucket(0)
+    for _ in range(100):
+        bucket.consume(1024 * 1024 * 1024)
+    assert clock.slept == 0
+
+
+def test_token_bucket_holds_rate(clock):
+    bucket = Filemover.TokenBucket(1000)
+    for _ in range(50):
+        bucket.consume(100)
+    # 5000 bytes at 1000 bytes/s, starting from an empty bucket
+    assert 4.9 <= clock.slept <= 5.1
+
+
+def test_token_bucket_limits_burst(clock):
+    bucket = Filemover.TokenBucket(1000)
+    clock.now += 60  # Idle for a minute: at most half a second of tokens is saved up
+    bucket.consume(500)
+    assert clock.slept == 0
+    bucket.consume(100)
+    assert 0.1 <= clock.slept <= 0.11
+
+
+def test_token_bucket_throttle_applies_the_lower_rate(clock):
+    bucket = Filemover.TokenBucket(1000)
+    bucket.set_throttle(250)
+    for _ in range(10):
+        bucket.consume(100)
+    assert 3.9 <= clock.slept <= 4.1
+    bucket.set_throttle(0)
+    clock.slept = 0
+    for _ in range(10):
+        bucket.consume(100)
+    assert 0.9 <= clock.slept <= 1.1
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux") or os.geteuid() != 0,
+                    reason="raising the priority again needs root (CAP_SYS_NICE) on Linux")
+def test_thread_io_priority_is_restored():
+    thread_id = threading.get_native_id()
+    before = os.getpriority(os.PRIO_PROCESS, thread_id)
+    with Filemover.thread_io_priority("low"):
+        assert os.getpriority(os.PRIO_PROCESS, thread_id) == max(before, 10)
+    assert os.getpriority(os.PRIO_PROCESS, thread_id) == before
+    with Filemover.thread_io_priority("normal"):
+        assert os.getpriority(os.PRIO_PROCESS, thread_id) == before
+
+
+# --- Upload verification ---
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    with FTPStandInServer(str(tmp_path / "ftp")) as server:
+        yield server
+
+
+def uploaded_file(tmp_path, data):
+    return write(str(tmp_path / "ftp" / "clips" / "C0001.MP4"), data)
+
+
+def digest_of(algorithm, data):
+    digest = Filemover.new_digest(algorithm)
+    digest.update(data)
+    return digest
+
+
+@pytest.mark.parametrize("features, algorithm, command", [
+    (None, "sha256", "HASH"),  # Everything the stand-in offers: HASH with SHA-256
+    ({"HASH": "SHA-256*;SHA-1;MD5;CRC32", "SIZE": ""}, "sha256", "HASH"),
+    ({"HASH": "MD5;CRC32*", "SIZE": ""}, "md5", "HASH"),
+    ({"HASH": "CRC32*", "SIZE": ""}, "crc32", "HASH"),
+    ({"XSHA256": "", "XMD5": "", "SIZE": ""}, "sha256", "XSHA256"),
+    ({"XSHA1": "", "SIZE": ""}, "sha1", "XSHA1"),
+    ({"XMD5": "", "XCRC": "", "SIZE": ""}, "md5", "XMD5"),
+    ({"XCRC": "", "SIZE": ""}, "crc32", "XCRC"),
+])
+def test_verify_upload_parses_checksum_replies(tmp_path, ftp_server, features, algorithm, command):
+    data = os.urandom(300 * 1024 + 3)
+    uploaded_file(tmp_path, data)
+    with Filemover.connect_transport("ftp", "127.0.0.1", ftp_server.port, "user", "password") as session:
+        if features is not None:
+            session.features = features
+            session.checksum_algorithm, session.checksum_command = session.choose_checksum()
+        assert (session.checksum_algorithm, session.checksum_command) == (algorithm, command)
+        session.cwd("clips")
+
+        assert session.verify_upload("C0001.MP4", len(data), digest_of(algorithm, data)) is None
+        mismatch = session.verify_upload("C0001.MP4", len(data), digest_of(algorithm, data[::-1]))
+        assert mismatch.startswith(f"{algorithm.upper()} on server ")
+        assert session.verify_upload("C0001.MP4", len(data) + 1, None) == \
+            f"size on server {len(data)} instead of {len(data) + 1}"
+        assert session.verify_upload("C0002.MP4", len(data), None) == "not found on the server"
+
+
+def test_verify_upload_without_checksum_commands(tmp_path):
+    data = os.urandom(64 * 1024)
+    uploaded_file(tmp_path, data)
+    with FTPStandInServer(str(tmp_path / "ftp"), checksums=False) as server:
+        with Filemover.connect_transport("ftp", "127.0.0.1", server.port, "user", "password") as session:
+            assert (session.checksum_algorithm, session.checksum_command) == (None, None)
+            session.cwd("clips")
+            # Only the size can be checked
+            assert session.verify_upload("C0001.MP4", len(data)) is None
+            assert session.verify_upload("C0001.MP4", len(data) - 1) == \
+                f"size on server {len(data)} instead of {len(data) - 1}"
+            # A server that turns a checksum command down after all is not asked again
+            session.checksum_algorithm, session.checksum_command = "md5", "XMD5"
+            assert session.verify_upload("C0001.MP4", len(data), digest_of("md5", b"other")) is None
+            assert session.checksum_algorithm is None
+
+
+# --- Delivery queue ---
+
+def upload_job(files, port, priority, window=None, rate_limit_mbps=0):
+    return {"kind": "upload", "server": f"127.0.0.1:{port}", "username": "user", "password": "password",
+            "settings": dict(Filemover.CredentialStore.DEFAULT_SETTINGS, protocol="ftp",
+                             rate_limit_mbps=rate_limit_mbps),
+            "directory": "delivery", "files": [[path, os.path.basename(path), False] for path in files],
+            "priority": priority, "window": window}
+
+
+def test_delivery_window():
+    assert Filemover.parse_delivery_window("22:00-06:00") == (1320, 360)
+    for window in ("22:00", "25:00-06:00", "06:00-06:00", "nacht"):
+        with pytest.raises(ValueError):
+            Filemover.parse_delivery_window(window)
+    assert Filemover.delivery_window_open("22:00-06:00", datetime.datetime(2024, 1, 1, 23, 30))
+    assert Filemover.delivery_window_open("22:00-06:00", datetime.datetime(2024, 1, 1, 5, 59))
+    assert not Filemover.delivery_window_open("22:00-06:00", datetime.datetime(2024, 1, 1, 6, 0))
+    assert not Filemover.delivery_window_open("09:00-17:00", datetime.datetime(2024, 1, 1, 8, 59))
+    assert Filemover.delivery_window_open(None)
+
+
+def test_delivery_waits_for_its_window(tmp_path):
+    source = write(str(tmp_path / "card" / "C0001.MP4"), os.urandom(64 * 1024))
+    later = datetime.datetime.now() + datetime.timedelta(hours=2)
+    window = f"{later:%H}:00-{(later + datetime.timedelta(hours=1)):%H}:00"
+    service = Filemover.IngestService(Filemover.MetricsRegistry(None))
+    with FTPStandInServer(str(tmp_path / "ftp")) as server:
+        events = []
+        service.deliveries.submit(upload_job([source], server.port, "normal", window), events.append)
+        time.sleep(0.5)
+        assert [delivery["state"] for delivery in service.deliveries.status()] == ["waiting"]
+        assert [event["event"] for event in events] == ["queued"]
+        assert not os.path.exists(str(tmp_path / "ftp" / "delivery" / "C0001.MP4"))
+
+
+def test_urgent_delivery_preempts_bulk_delivery(tmp_path):
+    bulk_data, urgent_data = os.urandom(3 * 1024 * 1024), os.urandom(128 * 1024)
+    bulk_source = write(str(tmp_path / "card" / "C0001.MP4"), bulk_data)
+    urgent_source = write(str(tmp_path / "card" / "C0002.MP4"), urgent_data)
+    service = Filemover.IngestService(Filemover.MetricsRegistry(None))
+    with FTPStandInServer(str(tmp_path / "ftp")) as server:
+        order, bulk_events, bulk_started = [], [], threading.Event()
+
+        def on_bulk_event(event):
+            bulk_events.append(event["event"])
+            if event["event"] == "started":
+                bulk_started.set()
+
+        def deliver_bulk():
+            outcome = service.deliver(upload_job([bulk_source], server.port, "bulk", rate_limit_mbps=2),
+                                      on_bulk_event)
+            order.append(("bulk", outcome["completed"]))
+
+        bulk = threading.Thread(target=deliver_bulk)
+        bulk.start()
+        assert bulk_started.wait(10)
+        outcome = service.deliver(upload_job([urgent_source], server.port, "urgent"))
+        order.append(("urgent", outcome["completed"]))
+        bulk.join(30)
+
+    assert order == [("urgent", 1), ("bulk", 1)]
+    # The bulk upload was stopped, queued again and continued where the server left off
+    assert "queued" in bulk_events[bulk_events.index("started"):]
+    for name, data in (("C0001.MP4", bulk_data), ("C0002.MP4", urgent_data)):
+        with open(str(tmp_path / "ftp" / "delivery" / name), "rb") as file:
+            assert file.read() == data